@@ -0,0 +1,98 @@
+""" Memory regression check for plotting in a long BoothiumEDA session.
+
+Runs a cycle of plot commands (dist univ/biv, with and without categoricals, reg and corr) hundreds of times
+in one process on a synthetic dataset, and checks that the resident set size (RSS) stops growing:
+RSS is measured once a warm-up round of commands has finished, and again after every round after that.
+Exits with status 1 if RSS grows by more than the allowed amount past warm-up. Needs psutil.
+
+usage: python bench/figure_memory.py [-n/--commands] [-w/--warmup] [--max-growth] [--rows]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import commandInterpreter  # noqa: E402
+import render  # noqa: E402
+
+
+COMMANDS = [
+    'dist univ x -o {dir}/univ.png',
+    'dist univ x -c g -o {dir}/univ_g.png',
+    'dist biv x y heatmap -o {dir}/heatmap.png',
+    'dist biv x y gaussian -c g -o {dir}/gaussian_g.png',
+    'reg x y -o {dir}/reg.png',
+    'corr -o {dir}/corr.png',
+]
+
+
+def make_data(rows, seed=0):
+    """Returns a synthetic dataframe of 2 correlated numerical vars, an unrelated one, and a categorical with 6 levels"""
+    rng = np.random.default_rng(seed)
+    x = rng.normal(10, 3, rows)
+    return pd.DataFrame({
+        'x': x,
+        'y': 2 * x + rng.normal(0, 4, rows),
+        'z': rng.exponential(2, rows),
+        'g': pd.Categorical(rng.choice(list('abcdef'), rows)),
+    })
+
+
+def run_round(data, commands, outdir):
+    """Runs each command once (hiding its output), then waits for all their plots to be rendered"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for command in commands:
+            commandInterpreter.interpret(command.format(dir=outdir), data)
+        render.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--commands',
+                        type=int,
+                        default=300)
+    parser.add_argument('-w', '--warmup',
+                        type=int,
+                        default=30)
+    parser.add_argument('--max-growth',
+                        type=float,
+                        default=25)  # In MB
+    parser.add_argument('--rows',
+                        type=int,
+                        default=20_000)
+    args = parser.parse_args()
+
+    process = psutil.Process()
+    data = make_data(args.rows)
+    rounds = max(1, args.commands // len(COMMANDS))
+    warmup_rounds = max(1, args.warmup // len(COMMANDS))
+
+    with tempfile.TemporaryDirectory() as outdir:
+        for _ in range(warmup_rounds):
+            run_round(data, COMMANDS, outdir)
+        baseline = process.memory_info().rss / 2**20
+        peak = baseline
+        for _ in range(rounds):
+            run_round(data, COMMANDS, outdir)
+            peak = max(peak, process.memory_info().rss / 2**20)
+        final = process.memory_info().rss / 2**20
+
+    failed = sum(job.status == 'failed' for job in render.jobs())
+    print(f"{rounds * len(COMMANDS)} plot commands after {warmup_rounds * len(COMMANDS)} warm-up commands ({failed} failed)")
+    print(f"RSS after warm-up: {baseline:.1f} MB  peak: {peak:.1f} MB  final: {final:.1f} MB")
+    print(f"growth: {peak - baseline:.1f} MB (allowed: {args.max_growth:.1f} MB)")
+    if failed or peak - baseline > args.max_growth:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+""" Deterministic synthetic CSV generator for the BoothiumEDA benchmarks.
+
+Writes a CSV file of numerical columns x0, x1, ... and categorical columns c0, c1, ..., with a given no. of rows,
+no. of levels per categorical (cardinality) and proportion of missing values (NaN rate). The numerical columns cycle
+through a normal var, a var linearly related to x0 (so that regressions and correlations have something to find),
+a skewed (exponential) var and an integer count (poisson) var. Categorical levels are named k0, k1, ... and are
+Zipf-distributed, so that k0 is the most common level, k1 the next, and so on, like most real categoricals.
+
+The rows are generated and written in fixed-size chunks, each from its own seeded random generator, so memory use
+stays flat however many rows are written, and the same arguments always produce the same file, byte for byte.
+
+usage: python bench/make_dataset.py [output file] [-r/--rows] [-n/--numericals] [-k/--categoricals] [--cardinality]
+                                    [--nan-rate] [--seed]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+CHUNK_ROWS = 1_000_000  # No. of rows generated and written at a time. Changing it changes the generated data
+
+
+def generate(filename, rows, numericals=4, categoricals=2, cardinality=8, nan_rate=0.0, seed=0):
+    """ Writes a synthetic CSV file (see module docstring)
+
+    PARAMETERS:
+        filename - name of the CSV file to write
+        rows - no. of rows
+        numericals - no. of numerical columns
+        categoricals - no. of categorical columns
+        cardinality - no. of levels of each categorical
+        nan_rate - proportion of the values of each column that are missing, between 0 and 1
+        seed - seed of the random generators
+    """
+    weights = 1 / np.arange(1, cardinality + 1)
+    weights /= weights.sum()
+    levels = np.array([f"k{k}" for k in range(cardinality)], dtype=object)
+
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w', newline='') as file:
+        for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+            size = min(CHUNK_ROWS, rows - start)
+            rng = np.random.default_rng([seed, chunk])
+            frame = {}
+            for i in range(numericals):
+                frame[f"x{i}"] = __numerical(rng, i, size, frame.get('x0'))
+            for j in range(categoricals):
+                frame[f"c{j}"] = levels[rng.choice(cardinality, size, p=weights)]
+            frame = pd.DataFrame(frame)
+            if nan_rate > 0:
+                frame = frame.mask(rng.random(frame.shape) < nan_rate)
+            frame.to_csv(file, index=False, header=chunk == 0, float_format='%.6g')
+    os.replace(tmp_filename, filename)  # So that an interrupted run never leaves a partial file under the final name
+
+
+def __numerical(rng, i, size, x0):
+    """Returns the values of the i-th numerical column of a chunk (see module docstring)"""
+    match i % 4:
+        case 0:
+            return rng.normal(50, 10, size)
+        case 1:
+            return 2 * x0 + rng.normal(0, 15, size) if x0 is not None else rng.normal(100, 25, size)
+        case 2:
+            return rng.exponential(5, size)
+        case _:
+            return rng.poisson(3 + i, size)
+
+
+def row_count(token):
+    """Argparse type for a no. of rows, which may be written in scientific notation (e.g. 1e6)"""
+    try:
+        rows = float(token)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid no. of rows: {token}")
+    if rows < 1 or rows != int(rows):
+        raise argparse.ArgumentTypeError(f"invalid no. of rows: {token} (expected a positive whole number)")
+    return int(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filename')
+    parser.add_argument('-r', '--rows',
+                        type=row_count,
+                        default=100_000)
+    parser.add_argument('-n', '--numericals',
+                        type=int,
+                        default=4)
+    parser.add_argument('-k', '--categoricals',
+                        type=int,
+                        default=2)
+    parser.add_argument('--cardinality',
+                        type=int,
+                        default=8)
+    parser.add_argument('--nan-rate',
+                        type=float,
+                        default=0.0)
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    args = parser.parse_args()
+    if args.numericals < 0 or args.categoricals < 0 or args.numericals + args.categoricals == 0:
+        parser.error("the file needs at least one column")
+    if args.cardinality < 1:
+        parser.error("--cardinality must be 1 or more")
+    if not 0 <= args.nan_rate < 1:
+        parser.error("--nan-rate must be at least 0 and less than 1")
+
+    generate(args.filename, args.rows, args.numericals, args.categoricals, args.cardinality, args.nan_rate, args.seed)
+    print(f"Wrote {args.rows} rows to {args.filename} ({os.path.getsize(args.filename) / 2**20:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+""" Accuracy and memory check for the sketches behind approximate stats (summary -a, and streaming mode).
+
+Feeds synthetic columns to the quantile and frequency sketches, a chunk at a time and merged as streaming mode does,
+and checks that:
+    - every approximate percentile is within its reported rank error of the exact one
+    - the quantile and frequency sketches' peak memory stays bounded, however many values they are given at once
+    - the approximate mode is found for a low-cardinality column, and for a high-cardinality column with a heavy hitter
+    - the approximate mode of a high-cardinality column (e.g. continuous values, all distinct) is never NaN,
+      and its count is underestimated by no more than the reported error
+Exits with status 1 if any check fails.
+
+usage: python bench/sketch_accuracy.py [--rows] [--chunks] [--max-memory] [--seed]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import sketches  # noqa: E402
+
+
+PERCENTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def sketch_chunks(values, chunks, seed):
+    """Returns the quantile and frequency sketches of values, built a chunk at a time and merged"""
+    merged = None
+    for i, chunk in enumerate(np.array_split(values, chunks)):
+        column = sketches.sketch_columns(chunk.reshape(-1, 1), ['median', 'mode'], [seed, i])
+        merged = column if merged is None else sketches.merge_columns(merged, column)
+    return merged[0]
+
+
+def check_quantiles(name, values, chunks, seed):
+    """Returns a list of the failures of the approximate percentiles of values"""
+    quantiles, _ = sketch_chunks(values, chunks, seed)
+    error = quantiles.rank_error()
+    valid = np.sort(values[~np.isnan(values)])
+    failures = []
+    for q in PERCENTILES:
+        rank = np.searchsorted(valid, quantiles.quantile(q), side='right') / len(valid)
+        if abs(rank - q) > error:
+            failures.append(f"{name}: p{q * 100:g} is at rank {rank:.4f} (allowed error: {error:.4f})")
+    print(f"{name}: max. rank error allowed {error:.4f}")
+    return failures
+
+
+def check_mode(name, values, chunks, seed, expected=None):
+    """ Returns a list of the failures of the approximate mode of values: NaN, not the expected mode (if given),
+    or with its count underestimated by more than the reported error
+    """
+    _, frequencies = sketch_chunks(values, chunks, seed)
+    mode = frequencies.mode()
+    print(f"{name}: mode {mode:g} ±{frequencies.error}")
+    if np.isnan(mode):
+        return [f"{name}: mode is NaN"]
+    if expected is not None and mode != expected:
+        return [f"{name}: mode is {mode:g} (expected {expected:g})"]
+    true_count = np.count_nonzero(values == mode)
+    estimate = frequencies.counts[np.searchsorted(frequencies.values, mode)]
+    if not estimate <= true_count <= estimate + frequencies.error:
+        return [f"{name}: count of the mode is {true_count}, estimated as {estimate} ±{frequencies.error}"]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows',
+                        type=int,
+                        default=1_000_000)
+    parser.add_argument('--chunks',
+                        type=int,
+                        default=4)
+    parser.add_argument('--max-memory',
+                        type=float,
+                        default=8)  # In MB
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    normal = rng.normal(0, 1, args.rows)
+    skewed = rng.exponential(5, args.rows)
+    skewed[rng.random(args.rows) < 0.05] = np.nan
+    counts = rng.poisson(4, args.rows).astype(np.float64)
+    heavy_hitter = rng.normal(0, 1, args.rows)
+    heavy_hitter[rng.random(args.rows) < 0.01] = 42.0
+
+    failures = []
+    failures += check_quantiles('normal', normal, args.chunks, args.seed)
+    failures += check_quantiles('exponential with NaNs', skewed, args.chunks, args.seed)
+    failures += check_mode('poisson counts', counts, args.chunks, args.seed, expected=float(np.argmax(np.bincount(counts.astype(int)))))
+    failures += check_mode('all distinct', normal, args.chunks, args.seed)
+    failures += check_mode('all distinct, one chunk', normal, 1, args.seed)
+    failures += check_mode('heavy hitter among distinct values', heavy_hitter, args.chunks, args.seed, expected=42.0)
+
+    for name, sketch in [('quantile', sketches.QuantileSketch(seed=args.seed)), ('frequency', sketches.FrequencySketch())]:
+        tracemalloc.start()
+        sketch.update(normal)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print(f"{name} sketch of {args.rows} values: peak memory {peak:.1f} MB (allowed: {args.max_memory:.1f} MB)")
+        if peak > args.max_memory:
+            failures.append(f"{name} sketch peak memory {peak:.1f} MB")
+
+    if failures:
+        print("\n".join(failures))
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+""" Startup-time benchmark for the BoothiumEDA command loop.
+
+Launches src/main.py on a CSV file several times and measures:
+    - time to first prompt: from process launch until the "> " prompt is printed
+    - time to first command: from sending the first command until its output is complete and the next prompt is printed
+
+usage: python bench/startup.py [csv file] [-c/--command] [-r/--repeats] [main.py flags...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'main.py')
+PROMPT = b'> '
+
+
+class PromptWatcher:
+    """Reads a process's stdout in a background thread, recording when each prompt is printed"""
+
+    def __init__(self, stream):
+        self.__stream = stream
+        self.__buffer = b''
+        self.__prompts = 0
+        self.__cond = threading.Condition()
+        threading.Thread(target=self.__read, daemon=True).start()
+
+    def __read(self):
+        while True:
+            chunk = self.__stream.read1(65536)
+            with self.__cond:
+                if not chunk:
+                    self.__prompts = -1  # Process exited
+                    self.__cond.notify_all()
+                    return
+                self.__buffer += chunk
+                self.__prompts = self.__buffer.count(PROMPT)
+                self.__cond.notify_all()
+
+    def wait_for_prompt(self, n, timeout):
+        """Blocks until the nth prompt has been printed. Returns False if the process exits or timeout passes first"""
+        with self.__cond:
+            return self.__cond.wait_for(lambda: self.__prompts >= n or self.__prompts == -1, timeout) \
+                and self.__prompts >= n
+
+
+def run_once(csv_file, command, main_flags, timeout):
+    """Runs one session and returns a tuple of (time to first prompt, time to first command) in seconds"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-u', MAIN, csv_file, *main_flags],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            env={**os.environ, 'MPLBACKEND': 'Agg'})
+    watcher = PromptWatcher(proc.stdout)
+    try:
+        if not watcher.wait_for_prompt(1, timeout):
+            raise RuntimeError("main.py exited or timed out before printing its first prompt")
+        first_prompt = time.perf_counter() - start
+
+        sent = time.perf_counter()
+        proc.stdin.write(command.encode() + b'\n')
+        proc.stdin.flush()
+        if not watcher.wait_for_prompt(2, timeout):
+            raise RuntimeError(f"main.py exited or timed out while running: {command}")
+        first_command = time.perf_counter() - sent
+
+        proc.stdin.write(b'exit\n')
+        proc.stdin.flush()
+        proc.wait(timeout)
+    finally:
+        proc.kill()
+    return first_prompt, first_command
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_file')
+    parser.add_argument('-c', '--command',
+                        default='summary')
+    parser.add_argument('-r', '--repeats',
+                        type=int,
+                        default=5)
+    parser.add_argument('-t', '--timeout',
+                        type=float,
+                        default=600)
+    args, main_flags = parser.parse_known_args()
+
+    prompts, commands = [], []
+    for _ in range(args.repeats):
+        first_prompt, first_command = run_once(args.csv_file, args.command, main_flags, args.timeout)
+        prompts.append(first_prompt)
+        commands.append(first_command)
+
+    print(f"command: {args.command}  ({args.repeats} runs)")
+    print(f"time to first prompt:   median {statistics.median(prompts):.3f}s  min {min(prompts):.3f}s  max {max(prompts):.3f}s")
+    print(f"time to first command:  median {statistics.median(commands):.3f}s  min {min(commands):.3f}s  max {max(commands):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+""" Benchmark suite for the BoothiumEDA commands.
+
+For each scale (no. of rows), generates a synthetic CSV file (see make_dataset.py, kept for later runs), then measures:
+    - loading it with utils.check_and_load_csv_file: parsing the CSV, loading it from the column cache, and memory-mapping
+      it from the column cache (lazy)
+    - every command, in its ungrouped form and its grouped form (on categorical c0) where it has them
+
+Each is run once cold (with the dataset profile's cached group indexes and histograms discarded first), then --repeats
+more times warm, then once more while tracing memory allocations with tracemalloc. A command's time is how long it took
+to return to the prompt; its total time also includes rendering its plots in the background.
+
+The run, with the version of the code (git commit), the machine and the parameters, is appended to a JSON history file,
+and each timing is compared with the latest earlier run in the history with the same parameters (or the run given by
+--baseline), so that performance can be compared across versions.
+
+Generated files and their column cache are kept in $BOOTHIUMEDA_BENCH_DIR (default: boothiumeda_bench in the temp directory).
+
+usage: python bench/suite.py [-s/--scales] [-n/--numericals] [-k/--categoricals] [--cardinality] [--nan-rate] [--seed]
+                             [-r/--repeats] [--mode] [--only] [--history] [--no-history] [--label] [--baseline]
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+DATA_DIR = os.environ.get('BOOTHIUMEDA_BENCH_DIR', os.path.join(tempfile.gettempdir(), 'boothiumeda_bench'))
+os.environ.setdefault('BOOTHIUMEDA_CACHE_DIR', os.path.join(DATA_DIR, 'cache'))  # Keeps the benchmark files out of the user's cache
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO, 'src'))
+import commandInterpreter  # noqa: E402
+import datasetProfile  # noqa: E402
+import render  # noqa: E402
+import utils  # noqa: E402
+from make_dataset import generate, row_count  # noqa: E402
+
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+RESAMPLES = 1000  # No. of resamples of the bootstrap CIs & permutation test, well below their default to keep large scales quick
+PAGE_SIZE = 16  # Facets per page of the grouped distributions, so that high-cardinality categoricals don't make one huge figure
+PAIRWISE_LEVELS = 4  # No. of (most common) levels compared by the pairwise tests
+
+# Name, ungrouped form and grouped form of each command benchmarked. None where a command has no such form
+COMMANDS = [
+    ('summary', 'summary', 'summary -c {cat}'),
+    ('summary approx', 'summary -a -s median p90', 'summary -a -s median p90 -c {cat}'),
+    ('ci', 'ci', 'ci -c {cat}'),
+    ('ci boot', 'ci boot -v {x} -n {resamples}', 'ci boot -v {x} -n {resamples} -c {cat}'),
+    ('dist univ', 'dist univ {x} -o {dir}/univ.png', 'dist univ {x} -c {cat} -p {page_size} -o {dir}/univ_grouped.png'),
+    ('dist biv', 'dist biv {x} {y} heatmap -o {dir}/biv.png',
+     'dist biv {x} {y} heatmap -c {cat} -p {page_size} -o {dir}/biv_grouped.png'),
+    ('reg', 'reg {x} {y} -o {dir}/reg.png', None),
+    ('reg batch', 'reg batch {y}', None),
+    ('corr', 'corr -o {dir}/corr.png', 'corr -c {cat}'),
+    ('test 1samp', 'test 1samp {x} 50', None),
+    ('test 2samp_col', 'test 2samp_col {x} {y}', None),
+    ('test paired', 'test paired {x} {y}', None),
+    ('test 2samp_cat', None, 'test 2samp_cat {x} {cat} k0 k1'),
+    ('test perm', None, 'test perm {x} {cat} k0 k1 -n {resamples}'),
+    ('test pairwise', None, 'test pairwise {cat} -v {x} -l {levels}'),
+]
+
+# Keyword arguments of utils.check_and_load_csv_file for each way of loading the file that is benchmarked
+LOADS = {
+    'parse': {'use_cache': False},
+    'cache': {'use_cache': True},
+    'lazy': {'use_cache': True, 'lazy': True},
+}
+
+# Keyword arguments of utils.check_and_load_csv_file that load the file for each mode the commands can be run in
+MODES = {
+    'in-memory': {'use_cache': True},
+    'lazy': {'use_cache': True, 'lazy': True},
+    'stream': {'stream_threshold': -1},
+}
+
+
+def dataset(rows, args):
+    """Returns the name of the synthetic CSV file of a scale, generating it if it hasn't been already"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filename = os.path.join(DATA_DIR, f"rows{rows}_num{args.numericals}_cat{args.categoricals}_card{args.cardinality}_"
+                                      f"nan{args.nan_rate:g}_seed{args.seed}.csv")
+    if not os.path.exists(filename):
+        print(f"Generating {rows} rows...", flush=True)
+        generate(filename, rows, args.numericals, args.categoricals, args.cardinality, args.nan_rate, args.seed)
+    return filename
+
+
+def run_quietly(function):
+    """ Calls function, hiding what it prints, then waits for any plots it requested to be rendered.
+    Returns the seconds until function returned, the seconds until its plots were rendered too, and the first error it
+    printed (or the first of its plots that failed), if any
+    """
+    first_job = len(render.jobs())
+    stdout, stderr = io.StringIO(), io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        function()
+        seconds = time.perf_counter() - start
+        render.wait()
+    total = time.perf_counter() - start
+
+    errors = [line for line in stdout.getvalue().splitlines() if line.startswith('ERROR')]
+    errors += [line for line in stderr.getvalue().splitlines() if 'error:' in line]  # Printed by argparse
+    errors += [f"plot failed: {job.error}" for job in render.jobs()[first_job:] if job.status == 'failed']
+    return seconds, total, errors[0] if errors else None
+
+
+def measure(function, repeats, reset=None):
+    """ Runs function (see run_quietly()) once cold, repeats more times warm, then once more tracing memory allocations.
+    Returns a dict of its cold time, median warm time and total (incl. rendering) time, and peak memory allocated in bytes.
+
+    PARAMETERS:
+        function - function to benchmark
+        repeats - no. of warm runs
+        reset - optional function called before the cold run, discarding whatever the warm runs reuse
+    """
+    if reset is not None:
+        reset()
+    gc.collect()
+    cold, _, error = run_quietly(function)
+    if error is not None:
+        return {'status': 'error', 'error': error}
+
+    seconds, totals = [], []
+    for _ in range(repeats):
+        gc.collect()
+        run_seconds, run_total, _ = run_quietly(function)
+        seconds.append(run_seconds)
+        totals.append(run_total)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_quietly(function)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'status': 'ok', 'cold_seconds': round(cold, 6),
+            'seconds': round(statistics.median(seconds), 6) if seconds else round(cold, 6),
+            'total_seconds': round(statistics.median(totals), 6) if totals else None,
+            'peak_bytes': peak}
+
+
+def benchmark_loads(filename, repeats):
+    """Returns the measurements (see measure()) of each way of loading a file (see LOADS)"""
+    run_quietly(lambda: utils.check_and_load_csv_file(filename))  # Writes the file to the column cache, if it isn't already
+    return {name: measure(lambda: utils.check_and_load_csv_file(filename, **kwargs), repeats) for name, kwargs in LOADS.items()}
+
+
+def benchmark_commands(data, args, outdir):
+    """Returns a list of the measurements (see measure()) of each form of each command (see COMMANDS) on a dataset"""
+    fields = {'x': 'x0', 'y': 'x1', 'cat': 'c0', 'dir': outdir, 'resamples': RESAMPLES, 'page_size': PAGE_SIZE,
+              'levels': ' '.join(f"k{k}" for k in range(min(PAIRWISE_LEVELS, args.cardinality)))}
+
+    def reset():
+        datasetProfile.invalidate()
+        datasetProfile.get(data)  # Built when the file is loaded, before any command
+
+    results = []
+    for name, *forms in COMMANDS:
+        for grouped, form in zip([False, True], forms):
+            if form is None or (args.only and not any(only in name for only in args.only)):
+                continue
+            command = form.format(**fields)
+            result = {'command': name, 'grouped': grouped, 'args': command}
+            result.update(measure(lambda: commandInterpreter.interpret(command, data), args.repeats, reset))
+            results.append(result)
+            print(f"  {name}{' (grouped)' if grouped else ''}: " +
+                  (f"{result['seconds']:.3f}s" if result['status'] == 'ok' else result['error']), flush=True)
+    return results
+
+
+def version():
+    """Returns the short hash of the git commit the code is at, marked +dirty if it has uncommitted changes, or None"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.stdout.strip() + ('+dirty' if status.stdout.strip() else '')
+
+
+def read_history(filename):
+    """Returns the list of runs in a history file, or an empty list if it doesn't exist"""
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as file:
+        return json.load(file)
+
+
+def write_history(filename, history):
+    """Writes the list of runs to a history file, replacing it only once it has been written in full"""
+    with open(f"{filename}.tmp", 'w') as file:
+        json.dump(history, file, indent=1)
+    os.replace(f"{filename}.tmp", filename)
+
+
+def find_baseline(history, run, baseline=None):
+    """ Returns the run of the history to compare a run with: the latest run whose label or commit starts with baseline,
+    if given, else the latest run with the same parameters. None if there is no such run
+    """
+    for earlier in reversed(history):
+        if baseline is not None:
+            if any(str(earlier.get(field) or '').startswith(baseline) for field in ('label', 'commit')):
+                return earlier
+        elif earlier['parameters'] == run['parameters']:
+            return earlier
+    return None
+
+
+def comparison_table(scale, baseline_scale):
+    """ Returns a dataframe of the time and peak memory of each load & command of a scale, alongside the ratio of its
+    time to that of the same load or command in the baseline's scale of the same no. of rows (if any)
+    """
+    def previous(section, key):
+        if baseline_scale is None:
+            return None
+        if section == 'load':
+            return baseline_scale['load'].get(key)
+        return next((result for result in baseline_scale['commands'] if (result['command'], result['grouped']) == key), None)
+
+    rows = []
+    entries = [('load', name, result) for name, result in scale['load'].items()]
+    entries += [('commands', (result['command'], result['grouped']), result) for result in scale['commands']]
+    for section, key, result in entries:
+        label = f"load ({key})" if section == 'load' else f"{key[0]}{' (grouped)' if key[1] else ''}"
+        if result['status'] != 'ok':
+            rows.append([label, None, None, None, None, None])
+            continue
+        earlier = previous(section, key)
+        ratio = result['seconds'] / earlier['seconds'] if earlier and earlier['status'] == 'ok' and earlier['seconds'] else None
+        rows.append([label, result['cold_seconds'], result['seconds'], result['total_seconds'], result['peak_bytes'] / 2**20, ratio])
+    table = pd.DataFrame(rows, columns=['benchmark', 'cold (s)', 'warm (s)', 'total (s)', 'peak (MB)', 'vs baseline'])
+    return table.set_index('benchmark').round({'cold (s)': 4, 'warm (s)': 4, 'total (s)': 4, 'peak (MB)': 1, 'vs baseline': 2})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scales',
+                        nargs='+',
+                        type=row_count,
+                        default=[1_000, 10_000, 100_000])
+    parser.add_argument('-n', '--numericals',
+                        type=int,
+                        default=4)
+    parser.add_argument('-k', '--categoricals',
+                        type=int,
+                        default=2)
+    parser.add_argument('--cardinality',
+                        type=int,
+                        default=8)
+    parser.add_argument('--nan-rate',
+                        type=float,
+                        default=0.01)
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0)
+    parser.add_argument('-r', '--repeats',
+                        type=int,
+                        default=3)
+    parser.add_argument('--mode',
+                        choices=list(MODES),
+                        default='lazy')
+    parser.add_argument('--only',
+                        nargs='*',
+                        default=[])  # Only benchmark the commands whose names contain any of these
+    parser.add_argument('--history',
+                        default=HISTORY)
+    parser.add_argument('--no-history',
+                        action='store_true')
+    parser.add_argument('--label',
+                        default=None)
+    parser.add_argument('--baseline',
+                        default=None)  # Label or commit of the run to compare with
+    args = parser.parse_args()
+    if args.numericals < 2 or args.categoricals < 1 or args.cardinality < 2:
+        parser.error("every command needs at least 2 numericals, 1 categorical and a cardinality of 2")
+    if not 0 <= args.nan_rate < 1:
+        parser.error("--nan-rate must be at least 0 and less than 1")
+    if args.repeats < 0:
+        parser.error("--repeats must be 0 or more")
+
+    run = {
+        'label': args.label,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': version(),
+        'machine': {'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'parameters': {'numericals': args.numericals, 'categoricals': args.categoricals, 'cardinality': args.cardinality,
+                       'nan_rate': args.nan_rate, 'seed': args.seed, 'repeats': args.repeats, 'mode': args.mode,
+                       'resamples': RESAMPLES},
+        'scales': [],
+    }
+    history = read_history(args.history)
+    baseline = find_baseline(history, run, args.baseline)
+    if args.baseline is not None and baseline is None:
+        print(f"WARNING: no run labelled {args.baseline} or at commit {args.baseline} in {args.history}")
+    commandInterpreter.prewarm().join()  # Imported while the file loads in a session, so kept out of the commands' cold times
+
+    for rows in args.scales:
+        filename = dataset(rows, args)
+        print(f"== {rows} rows ({os.path.getsize(filename) / 2**20:.1f} MB) ==", flush=True)
+        scale = {'rows': rows, 'file_bytes': os.path.getsize(filename), 'load': benchmark_loads(filename, args.repeats)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            data = utils.check_and_load_csv_file(filename, **MODES[args.mode])
+        with tempfile.TemporaryDirectory() as outdir:
+            scale['commands'] = benchmark_commands(data, args, outdir)
+        del data
+        run['scales'].append(scale)
+
+        baseline_scale = next((earlier for earlier in baseline['scales'] if earlier['rows'] == rows), None) if baseline else None
+        print()
+        print(comparison_table(scale, baseline_scale).to_string())
+        print("\n")
+
+    if baseline is not None:
+        print(f"Compared with the run at {baseline['time']} (commit {baseline['commit']}"
+              f"{', label ' + baseline['label'] if baseline['label'] else ''})")
+    if not args.no_history:
+        history.append(run)
+        write_history(args.history, history)
+        print(f"Results appended to {args.history}")
+
+
+if __name__ == '__main__':
+    main()
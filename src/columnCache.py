@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_object_dtype
+
+
+CACHE_DIR = os.path.abspath(os.environ.get('BOOTHIUMEDA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'boothiumeda')))
+DISK_BUDGET = 10 * 2**30  # Max. total bytes of cache entries kept on disk before the least recently used ones are evicted
+FINGERPRINT_BYTES = 2**20  # No. of bytes hashed from each end of a file to fingerprint its contents
+META_FILE = 'meta.json'
+
+
+def load(filename, dtype=None, usecols=None):
+    """ Loads the cached dataframe for a CSV file, if a valid cache entry for it exists.
+
+    An entry is valid if the file's size, modification time and content fingerprint all match those recorded
+    when the entry was written. Returns None if there is no valid entry.
+
+    PARAMETERS:
+        filename - name of the source csv file
+        dtype, usecols - the loading overrides the dataframe was loaded with (see csvLoader.load_csv())
+    """
+    opened = open_entry(filename, dtype, usecols)
+    if opened is None:
+        return None
+    entry, meta = opened
+
+    try:
+        columns = {col['name']: load_column(entry, col) for col in meta['columns']}
+    except (OSError, ValueError):  # Entry is incomplete or corrupted
+        return None
+    return pd.DataFrame(columns, copy=False)
+
+
+def open_entry(filename, dtype=None, usecols=None):
+    """ Finds the cache entry for a CSV file and marks it as used, without loading any of its columns.
+
+    Returns a tuple of the entry's path and its metadata dict, or None if there is no valid entry (see load()).
+
+    PARAMETERS:
+        filename - name of the source csv file
+        dtype, usecols - the loading overrides the dataframe was loaded with (see csvLoader.load_csv())
+    """
+    entry = entry_dir(filename, dtype, usecols)
+    meta = __read_meta(entry)
+    if meta is None or meta['source'] != source_signature(filename):
+        return None
+    if not all(os.path.isfile(os.path.join(entry, col['file'])) for col in meta['columns']):
+        return None
+
+    meta['last_used'] = time.time()
+    __write_meta(entry, meta)
+    return entry, meta
+
+
+def load_column(entry, col, mmap_mode=None):
+    """ Loads a column saved in a cache entry back into a numpy array or pd series
+
+    PARAMETERS:
+        entry - path of the cache entry
+        col - the column's metadata dict, from the entry's metadata
+        mmap_mode - passed to np.load(). If 'r', the column's values are memory-mapped rather than read into memory
+    """
+    values = np.load(os.path.join(entry, col['file']), mmap_mode=mmap_mode)
+    if col['kind'] == 'array':
+        return values
+
+    categories = pd.Index(col['categories'], dtype=col['categories_dtype'])
+    cat = pd.Series(pd.Categorical.from_codes(values, categories=categories, ordered=col['ordered']))
+    if col['kind'] == 'factorized':
+        return cat.astype(col['dtype'])
+    return cat
+
+
+def column_dtype(col):
+    """Returns the dtype of the column described by a column metadata dict, without loading the column"""
+    if col['kind'] == 'categorical':
+        categories = pd.Index(col['categories'], dtype=col['categories_dtype'])
+        return pd.CategoricalDtype(categories, ordered=col['ordered'])
+    return pd.api.types.pandas_dtype(col['dtype'])
+
+
+def store(filename, data, dtype=None, usecols=None, budget=None):
+    """ Writes a dataframe loaded from a CSV file to the cache as one binary file per column, then evicts
+    least recently used entries until the cache fits within the disk budget.
+
+    Dataframes larger than the whole budget are not cached.
+    Returns True if the dataframe was cached, False otherwise.
+
+    PARAMETERS:
+        filename - name of the source csv file
+        data - the dataframe loaded from that file
+        dtype, usecols - the loading overrides the dataframe was loaded with (see csvLoader.load_csv())
+        budget - max. total bytes the cache may use on disk (default: DISK_BUDGET)
+    """
+    budget = DISK_BUDGET if budget is None else budget
+    if data.memory_usage(deep=False).sum() > budget:
+        return False
+
+    entry = entry_dir(filename, dtype, usecols)
+    tmp = entry + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        os.makedirs(tmp)
+        columns = [__store_column(tmp, i, name, data[name]) for i, name in enumerate(data.columns)]
+        meta = {'source': source_signature(filename),
+                'rows': len(data),
+                'columns': columns,
+                'last_used': time.time()}
+        __write_meta(tmp, meta)
+        shutil.rmtree(entry, ignore_errors=True)  # Stale entry for the same file
+        os.replace(tmp, entry)
+    except (OSError, TypeError) as e:  # e.g. disk full, cache dir not writable or unserializable categories. Caching is best-effort.
+        shutil.rmtree(tmp, ignore_errors=True)
+        print(f"WARNING: Could not write cache ({e})")
+        return False
+
+    evict(budget, keep=entry)
+    return True
+
+
+def evict(budget=None, keep=None):
+    """ Deletes least recently used cache entries until the total size of the cache is within the budget
+
+    PARAMETERS:
+        budget - max. total bytes the cache may use on disk (default: DISK_BUDGET)
+        keep - path of an entry that must not be evicted (e.g. the one just written)
+    """
+    budget = DISK_BUDGET if budget is None else budget
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        meta = __read_meta(path)
+        if meta is not None:
+            entries.append((meta['last_used'], entry_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):  # Oldest first
+        if total <= budget:
+            break
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def entry_dir(filename, dtype=None, usecols=None):
+    """Returns the path of the cache entry for a CSV file loaded with the given overrides"""
+    key = json.dumps([os.path.abspath(filename),
+                      sorted((str(k), str(v)) for k, v in (dtype or {}).items()),
+                      sorted(usecols) if usecols is not None else None])
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+
+def source_signature(filename):
+    """ Returns a dict identifying the current version of a file: its size, modification time and a fingerprint
+    of its contents (hash of its first and last FINGERPRINT_BYTES bytes)
+    """
+    st = os.stat(filename)
+    digest = hashlib.sha1(str(st.st_size).encode())
+    with open(filename, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if st.st_size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, st.st_size - FINGERPRINT_BYTES))
+            digest.update(f.read())
+    return {'path': os.path.abspath(filename),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'fingerprint': digest.hexdigest()}
+
+
+def entry_size(path):
+    """Returns the total size in bytes of the files in a cache entry"""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def __store_column(entry, i, name, series):
+    """ Saves a column to a .npy file in a cache entry and returns the metadata needed to load it back.
+
+    Numpy-backed columns are saved as is. Categoricals are saved as their integer codes plus a JSON list of categories.
+    Any other column (e.g. strings) is factorized and saved the same way as a categorical, then cast back on loading.
+    """
+    col = {'name': name, 'dtype': str(series.dtype)}
+    if isinstance(series.dtype, np.dtype) and not is_object_dtype(series.dtype):
+        col['kind'] = 'array'
+        col['file'] = f"{i}.npy"
+        np.save(os.path.join(entry, col['file']), series.to_numpy())
+        return col
+
+    cat = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    col['kind'] = 'categorical' if cat is series else 'factorized'
+    col['file'] = f"{i}.codes.npy"
+    col['ordered'] = bool(cat.cat.ordered)
+    col['categories_dtype'] = str(cat.cat.categories.dtype)
+    col['categories'] = cat.cat.categories.tolist()
+    np.save(os.path.join(entry, col['file']), cat.cat.codes.to_numpy())
+    return col
+
+
+def __read_meta(entry):
+    """Returns the metadata dict of a cache entry, or None if the entry doesn't exist or is unreadable"""
+    try:
+        with open(os.path.join(entry, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def __write_meta(entry, meta):
+    """Writes the metadata dict of a cache entry"""
+    with open(os.path.join(entry, META_FILE), 'w') as f:
+        json.dump(meta, f)
@@ -0,0 +1,71 @@
+import pandas as pd
+
+import columnCache
+
+
+class ColumnStore:
+    """ A dataset backed by a column cache entry (see columnCache), with each column memory-mapped from its .npy file.
+
+    Only the schema (column names and dtypes) is held in memory. A column's values are only paged in when a
+    dataframe containing it is requested with frame(), so commands that use a few columns of a wide table
+    never read the rest of it.
+
+    The store mimics the parts of the pd dataframe interface used to validate commands (columns, dtypes, empty),
+    so it can be passed to the command modules in place of a dataframe. They then call utils.select_columns() to get
+    a real dataframe holding just the columns they need.
+    """
+
+    def __init__(self, entry, meta):
+        """
+        PARAMETERS:
+            entry - path of the cache entry
+            meta - the entry's metadata dict
+        """
+        self.entry = entry
+        self.source = meta['source']
+        self.__rows = meta['rows']
+        self.__cols = {col['name']: col for col in meta['columns']}
+        self.columns = pd.Index(list(self.__cols))
+        self.dtypes = pd.Series({name: columnCache.column_dtype(col) for name, col in self.__cols.items()}, dtype=object)
+
+    @property
+    def empty(self):
+        return self.__rows == 0 or len(self.columns) == 0
+
+    @property
+    def shape(self):
+        return self.__rows, len(self.columns)
+
+    def __len__(self):
+        return self.__rows
+
+    def __getitem__(self, name):
+        """Returns a single column as a pd series"""
+        return self.frame([name])[name]
+
+    def frame(self, names):
+        """ Returns a pd dataframe of the requested columns, backed by memory maps of their .npy files
+
+        PARAMETERS:
+            names - list of column names
+        """
+        columns = {name: columnCache.load_column(self.entry, self.__cols[name], mmap_mode='r') for name in names}
+        return pd.DataFrame(columns, index=pd.RangeIndex(self.__rows), copy=False)
+
+    def on_disk_bytes(self):
+        """Returns the no. of bytes the columns' .npy files take up on disk"""
+        return columnCache.entry_size(self.entry)
+
+
+def open_store(filename, dtype=None, usecols=None):
+    """ Opens the column store for a CSV file from its cache entry.
+    Returns None if there is no valid cache entry for the file (see columnCache.load()).
+
+    PARAMETERS:
+        filename - name of the source csv file
+        dtype, usecols - the loading overrides the data was loaded with (see csvLoader.load_csv())
+    """
+    opened = columnCache.open_entry(filename, dtype, usecols)
+    if opened is None:
+        return None
+    return ColumnStore(*opened)
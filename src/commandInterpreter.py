@@ -1,10 +1,34 @@
+import importlib
 import sys
+import threading
 
+import profiler
+import render
+import resultCache
+import streaming
 import summaryStats
-import confidenceIntervals
-import dist
-import reg
-import tests
+
+# Command modules that import SciPy and/or the plotting libraries. These take seconds to import, so they are only
+# imported when a command first needs them (or in the background by prewarm()) rather than before the first prompt.
+LAZY_MODULES = ['confidenceIntervals', 'tests', 'reg', 'dist', 'corr']
+OPCODE_MODULES = {'ci': 'confidenceIntervals', 'test': 'tests', 'reg': 'reg', 'dist': 'dist', 'corr': 'corr'}  # Lazy module of each opcode
+
+
+def prewarm():
+    """ Starts importing the lazily-imported command modules in a background thread, so that they are usually
+    ready by the time the first command that needs them is entered. Returns the started thread.
+
+    A command that needs a module before the thread has finished importing it just waits for that import to complete.
+    """
+    thread = threading.Thread(target=__import_lazy_modules, daemon=True)
+    thread.start()
+    return thread
+
+
+def __import_lazy_modules():
+    """Imports each of the lazily-imported command modules"""
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
 
 
 def interpret(command, data):
@@ -20,29 +44,109 @@ def interpret(command, data):
 
         PARAMETERS:
             command - string representing the command inputted by the user
-            data - the input dataframe
+            data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
     """
     command = command.split()
+    if command == []:
+        return
+    opcode = command[0]
+
+    if opcode == 'exit':
+        sys.exit(0)
+
+    if isinstance(data, streaming.StreamingDataset) and opcode not in streaming.OPCODES + ['help', 'jobs', 'cache', 'profile']:
+        print(f"ERROR: {opcode} is not available in streaming mode")
+        return
+
+    if profiler.enabled() and opcode != 'profile':
+        profiler.run(' '.join(command), lambda: __run(command, data))
+    else:
+        __run(command, data)
+
+
+def __run(command, data):
+    """Runs a command (see interpret()), from its result cache if it's cached"""
+    try:
+        with profiler.stage('import'):  # Normally instant, unless the module hasn't been imported yet (see prewarm())
+            if command[0] in OPCODE_MODULES:
+                importlib.import_module(OPCODE_MODULES[command[0]])
+        with profiler.stage('parse'):
+            parsed = __parse(command, data) if resultCache.enabled() else None
+        if parsed is None:
+            __dispatch(command, data)
+        else:
+            resultCache.run(*parsed, data, lambda: __dispatch(command, data))
+    except SystemExit:
+        pass  # Raised by argparse for invalid arguments (or -h), once it has printed the usage. The session carries on
+
+
+def __parse(command, data):
+    """ Returns the name and parsed arguments of a command whose results are cached (see resultCache), or None for
+    any other command. Commands whose results are cached are those that compute from the dataset: summary, ci, dist,
+    reg, corr and the permutation test. The other tests are quick enough to just run again.
+    Invalid arguments make argparse print the usage and exit, as when the command is run.
+    """
     opcode = command[0]
+    kind = command[1] if len(command) > 1 else None
+    match opcode:
+        case 'summary':
+            return 'summary', summaryStats.parser(data).parse_args(command[1:])
+        case 'ci':
+            import confidenceIntervals
+            if kind == 'boot':
+                return 'ci boot', confidenceIntervals.bootstrap_parser(data).parse_args(command[2:])
+            return 'ci', confidenceIntervals.parser(data).parse_args(command[1:])
+        case 'dist' if kind in ('univ', 'u'):
+            import dist
+            return 'dist univ', dist.univ_parser(data).parse_args(command[2:])
+        case 'dist' if kind in ('biv', 'b'):
+            import dist
+            return 'dist biv', dist.biv_parser(data).parse_args(command[2:])
+        case 'reg':
+            import reg
+            if kind == 'batch':
+                return 'reg batch', reg.batch_parser(data).parse_args(command[2:])
+            return 'reg', reg.parser(data).parse_args(command[1:])
+        case 'corr':
+            import corr
+            return 'corr', corr.parser(data).parse_args(command[1:])
+        case 'test' if kind == 'perm':
+            import tests
+            return 'test perm', tests.perm_parser(data).parse_args(command[2:])
+    return None
+
 
+def __dispatch(command, data):
+    """Calls the function of a command's opcode (see interpret()) with its arguments"""
+    opcode = command[0]
     match opcode:
 
-        case 'exit':
-            sys.exit(0)
-        
         case 'help':
             method = command[1]
             match method:
                 case 'summary':
                     summaryStats.print_help()
                 case 'ci':
+                    import confidenceIntervals
                     confidenceIntervals.print_help()
                 case 'dist':
+                    import dist
                     dist.print_help()
                 case 'reg':
+                    import reg
                     reg.print_help()
+                case 'corr':
+                    import corr
+                    corr.print_help()
                 case 'test':
+                    import tests
                     tests.print_help()
+                case 'jobs':
+                    render.print_help()
+                case 'cache':
+                    resultCache.print_help()
+                case 'profile':
+                    profiler.print_help()
                 case _:
                     print(f"ERROR: {method} is not a valid function")
         
@@ -53,11 +157,15 @@ def interpret(command, data):
 
         # Confidence intervals
         case 'ci':
-            args = command[1:]
-            confidenceIntervals.get_cis(data, args)
+            import confidenceIntervals
+            if len(command) > 1 and command[1] == 'boot':
+                confidenceIntervals.get_bootstrap_cis(data, command[2:])
+            else:
+                confidenceIntervals.get_cis(data, command[1:])
 
         # Numerical var distribution
         case 'dist':
+            import dist
             kind = command[1]
             args = command[2:]
             if kind == 'univ' or kind == 'u':
@@ -68,13 +176,35 @@ def interpret(command, data):
                 print("ERROR: Invalid command")
 
 
-        # Simple linear regression & ANOVA
+        # Simple linear regression & ANOVA, or a batch of regressions of one response on many explanatory vars
         case 'reg':
+            import reg
+            if len(command) > 1 and command[1] == 'batch':
+                reg.batch(data, command[2:])
+            else:
+                reg.analyze(data, command[1:])
+
+        # Correlation/covariance matrix
+        case 'corr':
+            import corr
             args = command[1:]
-            reg.analyze(data, args)
+            corr.get_matrix(data, args)
+
+        # Status of the plots rendering in the background
+        case 'jobs':
+            render.show_jobs(command[1:])
+
+        # Status of the result cache
+        case 'cache':
+            resultCache.show_cache(command[1:])
+
+        # Profiling of each command
+        case 'profile':
+            profiler.show_profile(command[1:])
 
         # Hypothesis testing
         case 'test':
+            import tests
             kind = command[1]
             args = command[2:]
             match kind:
@@ -82,6 +212,10 @@ def interpret(command, data):
                     tests.one_sample_ttest(data, args)
                 case '2samp_cat':
                     tests.two_sample_ttest_by_cat(data, args)
+                case 'pairwise':
+                    tests.pairwise_ttests_by_cat(data, args)
+                case 'perm':
+                    tests.permutation_test_by_cat(data, args)
                 case '2samp_col':
                     tests.two_sample_ttest_by_col(data, args)
                 case 'paired':
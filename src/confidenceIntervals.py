@@ -1,7 +1,12 @@
 import argparse
 import numpy as np
+import pandas as pd
 from scipy import stats
 
+import moments
+import resampling
+import streaming
+import datasetProfile
 import utils
 
 
@@ -26,7 +31,32 @@ def get_cis(data, args):
         args - array of command window argument strings obtained by command interpreter module
     """
 
-    # Deriving argument values from args array using argparse
+    profile = datasetProfile.get(data)
+
+    parsed_args = parser(data).parse_args(args)
+    
+    # Check if provided confidence level is valid
+    if parsed_args.lvl >= 1 or parsed_args.lvl <= 0:
+        print("ERROR: Confidence level must be a float between 0 and 1")
+        return
+
+    if isinstance(data, streaming.StreamingDataset):
+        print(__tabulate_streaming(data, parsed_args.vars, parsed_args.lvl, parsed_args.categoricals))
+        return
+
+    data = utils.select_columns(data, parsed_args.vars)  # Categoricals are only needed for grouping, which the profile caches
+    if parsed_args.categoricals == []:
+        table = __tabulate(data, parsed_args.vars, parsed_args.lvl)
+    else:
+        groups = profile.groups(parsed_args.categoricals)
+        table = __tabulate_by_categoricals(data, parsed_args.vars, parsed_args.lvl, groups)
+    
+    print(table)
+
+
+def parser(data):
+    """Returns the argparse parser of the ci command's arguments (see get_cis()) for a dataset"""
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
     parser.add_argument('lvl',
                         nargs='?',
@@ -34,44 +64,195 @@ def get_cis(data, args):
                         type=float)
     parser.add_argument('-v', '--vars',
                         nargs='*',
-                        default=utils.get_numericals(data),
-                        choices=utils.get_numericals(data))
+                        default=profile.numericals,
+                        choices=profile.numericals)
     parser.add_argument('-c', '--categoricals',
                         nargs='*',
                         default=[],
-                        choices=data.columns.values)
-    parsed_args = parser.parse_args(args)
-    
-    # Check if provided confidence level is valid
+                        choices=profile.columns)
+    return parser
+
+
+def get_bootstrap_cis(data, args):
+    """ Prints a table of percentile bootstrap confidence intervals for population values of a summary stat
+    (e.g. the median), which unlike the t-based intervals of get_cis() make no assumption about the distribution of the data.
+
+    Each interval's bounds are the (1-lvl)/2 and 1-(1-lvl)/2 quantiles of the stat over resamples (drawn with replacement)
+    of the variable's non-missing values, which are drawn & evaluated in batches across a process pool (see resampling).
+    The table is laid out as by get_cis().
+
+    COMMAND WINDOW ARGUMENTS:
+        lvl, vars, categoricals - as for get_cis()
+        stat - the summary stat to find CIs for (any stat offered by summary, e.g. mean, median, p90). Default is mean.
+                Denoted in user command by -s or --stat.
+        resamples - no. of bootstrap resamples. Default is 2000. Denoted in user command by -n or --resamples.
+        seed - seed of the random resampling, so that intervals can be reproduced. Default is 0. Denoted in user command by --seed.
+        jobs - max. no. of worker processes. Default is the no. of CPUs. Denoted in user command by -j or --jobs.
+                Intervals are the same whatever the no. of processes.
+
+    FUNCTION PARAMETERS:
+        data - the input dataframe
+        args - array of command window argument strings obtained by command interpreter module
+    """
+
+    profile = datasetProfile.get(data)
+    parsed_args = bootstrap_parser(data).parse_args(args)
+
     if parsed_args.lvl >= 1 or parsed_args.lvl <= 0:
         print("ERROR: Confidence level must be a float between 0 and 1")
         return
+    if not resampling.is_stat(parsed_args.stat):
+        print(f"ERROR: {parsed_args.stat} is not a valid summary stat")
+        return
+    if parsed_args.resamples < 1:
+        print("ERROR: No. of resamples must be at least 1")
+        return
+    if isinstance(data, streaming.StreamingDataset):
+        print("ERROR: Bootstrap intervals are not available in streaming mode, as resampling needs the whole file")
+        return
 
-    # NESTED FUNCTION FOR USE AS AN AGGREGATION FUNCTION IN .agg()
-    # Provided a pandas series/column, returns a confidence interval for the population mean of the variable represented by the series/column
-    # The interval is returned as a single item list containing a tuple that itself contains the lower and upper bounds (in that order) of the interval
-    # Wrapping the interval tuple in a list means that pandas will place the interval into a single column of the df, rather than splitting that column into 2 subcolumns
-    def __get_mean_interval(series):
-        n = series.dropna().size 
-        xbar = series.mean()  # Sample mean
-        s = series.std()  # Sample std
-        cl = parsed_args.lvl  # Confidence level
-        t_value = stats.t.ppf(1 - cl/2, df=n-1)
-        margin_of_err = t_value * (s / np.sqrt(n))
-        interval = (xbar-margin_of_err, xbar+margin_of_err)
-        return [interval]
-
-    # Dictionary to map requested vars to __get_mean_interval() function, for use in .agg()
-    vars_dict = {}
-    for var in parsed_args.vars:
-        vars_dict[var] = __get_mean_interval
+    vars = parsed_args.vars
+    data = utils.select_columns(data, vars)  # Categoricals are only needed for grouping, which the profile caches
+    groups = profile.groups(parsed_args.categoricals) if parsed_args.categoricals else None
 
-    if parsed_args.categoricals == []:
-        table = data.agg(vars_dict)
+    # One array of non-missing values per group & var, in group-major order
+    block = moments.to_block(data, vars, None if groups is None else groups.order)
+    if groups is None:
+        parts = [block]
     else:
-        table = data.groupby(parsed_args.categoricals).agg(vars_dict)
-    
-    print(table)
+        parts = [block[start:start + size] for start, size in zip(groups.starts, groups.sizes)]
+    series = [part[~np.isnan(part[:, i]), i] for part in parts for i in range(len(vars))]
+
+    estimates = resampling.bootstrap(series, parsed_args.stat, parsed_args.resamples, parsed_args.seed, parsed_args.jobs)
+    alpha = 1 - parsed_args.lvl
+    lower, upper = np.full(len(series), np.nan), np.full(len(series), np.nan)
+    found = ~np.isnan(estimates).any(axis=1)  # Empty groups (and e.g. the var of a single value) have no interval
+    if found.any():
+        lower[found], upper[found] = np.quantile(estimates[found], [alpha / 2, 1 - alpha / 2], axis=1)
+    shape = (len(parts), len(vars))
+    print(__build_table(vars, lower.reshape(shape), upper.reshape(shape), None if groups is None else groups.index))
+
+
+def bootstrap_parser(data):
+    """Returns the argparse parser of the ci boot command's arguments (see get_bootstrap_cis()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('lvl',
+                        nargs='?',
+                        default=0.95,
+                        type=float)
+    parser.add_argument('-v', '--vars',
+                        nargs='*',
+                        default=profile.numericals,
+                        choices=profile.numericals)
+    parser.add_argument('-c', '--categoricals',
+                        nargs='*',
+                        default=[],
+                        choices=profile.columns)
+    parser.add_argument('-s', '--stat',
+                        default='mean')
+    parser.add_argument('-n', '--resamples',
+                        default=resampling.RESAMPLES,
+                        type=int)
+    parser.add_argument('--seed',
+                        default=0,
+                        type=int)
+    parser.add_argument('-j', '--jobs',
+                        type=int)
+    return parser
+
+
+def __tabulate(data, vars, cl):
+    """
+    Finds confidence intervals for the population means of provided numerical variables and tabulates them in a dataframe.
+
+    The dataframe will have the numerical variables as columns, and the lower & upper bounds of their intervals as rows.
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - array of numerical variables to find CIs for
+        cl - level of confidence (e.g. 0.99 for a 99% CI)
+    """
+    lower, upper = __mean_intervals(moments.compute(data, vars), cl)
+    return __build_table(vars, lower, upper)
+
+
+def __tabulate_by_categoricals(data, vars, cl, groups):
+    """
+    Divides provided numerical variables into categories based on provided categorical variables, then finds
+    confidence intervals for the population means of each category and tabulates them in a dataframe.
+
+    The columns of the dataframe will be a 2-level multiindex, the upper level being the numerical variables and the
+    lower level being the lower & upper bounds of their intervals.
+    The rows will pertain to the categories, as in the table from summaryStats (a multiindex if several categoricals are provided).
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - array of numerical variables to find CIs for
+        cl - level of confidence (e.g. 0.99 for a 99% CI)
+        groups - datasetProfile.GroupIndex dividing entries into categories along the requested categoricals
+    """
+    lower, upper = __mean_intervals(moments.compute(data, vars, groups), cl)
+    return __build_table(vars, lower, upper, groups.index)
+
+
+def __tabulate_streaming(data, vars, cl, categoricals):
+    """
+    Finds confidence intervals for the population means of provided numerical variables of a streamed file, in one
+    pass over its chunks (see streaming.accumulate()). The table is laid out as by __tabulate() or __tabulate_by_categoricals().
+
+    PARAMETERS:
+        data - the streaming.StreamingDataset
+        vars - array of numerical variables to find CIs for
+        cl - level of confidence (e.g. 0.99 for a 99% CI)
+        categoricals - categorical variables in the data to divide entries into categories along (may be empty)
+    """
+    accumulators, index, _ = streaming.accumulate(data, vars, categoricals)
+    lower, upper = __mean_intervals(accumulators, cl)
+    return __build_table(vars, lower, upper, index)
+
+
+def __build_table(vars, lower, upper, index=None):
+    """
+    Lays out the bounds of confidence intervals in a dataframe.
+
+    Without a group index, the numerical variables form the columns and the lower & upper bounds form the rows.
+    With one, the columns are a 2-level (var, lower/upper) multiindex and the rows are the groups.
+
+    PARAMETERS:
+        vars - array of numerical variables
+        lower, upper - 2-D arrays of the bounds, with one row per group and one column per var
+        index - optional index of the groups
+    """
+    if index is None:
+        return pd.DataFrame(np.vstack((lower, upper)), index=['lower', 'upper'], columns=vars)
+
+    table = {}
+    for i, var in enumerate(vars):
+        table[(var, 'lower')] = lower[:, i]
+        table[(var, 'upper')] = upper[:, i]
+    return pd.DataFrame(table, index=index)
+
+
+def __mean_intervals(accumulators, cl):
+    """
+    Returns the lower & upper bounds of t-based confidence intervals for population means, as 2 arrays shaped like
+    the given accumulators (one row per group, one column per variable). Intervals are NaN where there are fewer than 2 datapoints.
+
+    The t quantile is only evaluated once per distinct no. of degrees of freedom, rather than once per interval.
+
+    PARAMETERS:
+        accumulators - moments.Moments of the variables
+        cl - level of confidence (e.g. 0.99 for a 99% CI)
+    """
+    n = accumulators.count
+    dfs, inverse = np.unique(np.maximum(n - 1, 1), return_inverse=True)
+    t_values = stats.t.ppf(1 - (1 - cl) / 2, df=dfs)[inverse].reshape(n.shape)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margin_of_err = t_values * np.sqrt(accumulators.var() / n)
+    xbar = accumulators.mean()  # Sample means
+    return xbar - margin_of_err, xbar + margin_of_err
 
 
 def print_help():
@@ -81,3 +262,10 @@ def print_help():
     print("\t-v/--vars             List of numerical variables to get summary statistics for (default: all numerical vars in data)")
     print("\t-c/--categoricals     List of categorical variables to categorize datapoints on (empty by default). No categorization if none provided")
     print("\n")
+    print("usage: ci boot [lvl] [-v/--vars] [-c/--categoricals] [-s/--stat] [-n/--resamples] [--seed] [-j/--jobs]")
+    print("\tlvl, -v, -c          As above")
+    print("\t-s/--stat             Summary stat to find bootstrap CIs for, e.g. mean, median, p90 (default: mean)")
+    print("\t-n/--resamples        No. of bootstrap resamples (default: 2000)")
+    print("\t--seed                Seed of the random resampling (default: 0)")
+    print("\t-j/--jobs             Max. no. of worker processes (default: no. of CPUs)")
+    print("\n")
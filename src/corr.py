@@ -0,0 +1,305 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+import moments
+import render
+import streaming
+import datasetProfile
+import utils
+
+
+ROW_BLOCK = 65536  # No. of rows multiplied at once when accumulating PairwiseSums, bounding the size of temporary arrays
+
+
+class PairwiseSums:
+    """ Sums over the datapoints where both of a pair of numerical variables are present, for every pair of a set of
+    variables, from which their pairwise-complete covariance & correlation matrices are derived.
+    Each sum is a square matrix with one row & column per variable.
+
+    Values are shifted by a fixed per-variable shift before summing (see moments.shift_for()), so that the sums
+    can be centred without losing precision. Rows can be added block by block, e.g. one chunk of a streamed file at a time.
+    """
+
+    def __init__(self, shift):
+        """
+        PARAMETERS:
+            shift - the per-variable value subtracted before summing, as an array with one entry per variable
+        """
+        self.shift = shift
+        p = len(shift)
+        self.count = np.zeros((p, p))  # count[i, j] = no. of rows where vars i & j are both present
+        self.sum_x = np.zeros((p, p))  # sum_x[i, j] = sum of (var i - shift) over those rows
+        self.sum_xx = np.zeros((p, p))  # sum_xx[i, j] = sum of (var i - shift)^2 over those rows
+        self.sum_xy = np.zeros((p, p))  # sum_xy[i, j] = sum of (var i - shift)(var j - shift) over those rows
+
+    def add(self, block):
+        """ Adds the rows of a 2-D block of values (one column per variable, with missing values as NaN) to the sums,
+        ROW_BLOCK rows at a time.
+
+        Every sum is a matrix product of the block's shifted values and/or its mask of present values. Sums over rows where
+        a variable is present are found as the column total minus the sum over rows where it's missing, so the
+        mask only enters matrix products for the (often few) variables that have missing values.
+        """
+        for start in range(0, len(block), ROW_BLOCK):
+            rows = block[start:start + ROW_BLOCK]
+            missing = np.isnan(rows)
+            shifted = np.where(missing, 0, rows - self.shift)
+            squared = np.square(shifted)
+
+            has_missing = np.flatnonzero(missing.any(axis=0))
+            mask = missing[:, has_missing].astype(np.float64)
+            n_missing = missing.sum(axis=0)
+
+            self.count += len(rows) - n_missing[:, None] - n_missing[None, :]
+            self.count[np.ix_(has_missing, has_missing)] += mask.T @ mask
+            self.sum_x += shifted.sum(axis=0)[:, None]
+            self.sum_x[:, has_missing] -= shifted.T @ mask
+            self.sum_xx += squared.sum(axis=0)[:, None]
+            self.sum_xx[:, has_missing] -= squared.T @ mask
+            self.sum_xy += shifted.T @ shifted
+        return self
+
+    def covariance(self):
+        """Returns the matrix of sample covariances (n-1 denominator). NaN for pairs with fewer than 2 datapoints"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cross = self.sum_xy - self.sum_x * self.sum_x.T / self.count
+            return np.where(self.count > 1, cross / (self.count - 1), np.nan)
+
+    def correlation(self):
+        """ Returns the matrix of Pearson correlation coefficients, each over the datapoints where both variables are present.
+        NaN for pairs with fewer than 2 datapoints, or where either variable is constant over them
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cross = self.sum_xy - self.sum_x * self.sum_x.T / self.count
+            ss = np.maximum(self.sum_xx - np.square(self.sum_x) / self.count, 0)  # ss[i, j] = corrected SS of var i over rows shared with var j
+            r = np.clip(cross / np.sqrt(ss * ss.T), -1, 1)
+        r = np.where((self.count > 1) & (ss > 0) & (ss.T > 0), r, np.nan)
+        diagonal = np.diag(r).copy()
+        np.fill_diagonal(r, np.where(np.isnan(diagonal), np.nan, 1))  # Exactly 1, rather than rounded
+        return r
+
+
+def get_matrix(data, args):
+    """ Prints the correlation (or covariance) matrix of a set of numerical variables, and optionally saves it
+    as a heatmap or as a binary array.
+
+    Each entry is computed over the datapoints where both of its variables are present. All entries come from
+    a few blocked matrix products over the data (see PairwiseSums), so the matrix scales to thousands of variables.
+
+    COMMAND WINDOW ARGUMENTS:
+        vars - a list of numerical variables to find the matrix of. In the user's command, this list is denoted by -v or --vars.
+                By default, this will be all numerical variables in the dataset.
+
+        categoricals - a list of variables in the dataset whose values shall be used as categories to group datapoints into.
+                        A matrix is then found for each category. Denoted in user command by -c or --categoricals.
+                        By default, the categoricals list will be empty.
+
+        method - 'pearson' (default) for Pearson's correlation coefficient, or 'spearman' for Spearman's rank correlation
+                    coefficient (Pearson's coefficient of the ranks of each variable). Denoted in user command by -m or --method.
+
+        cov - if set, finds the covariance matrix instead of the correlation matrix. Denoted in user command by --cov.
+
+        outfile - optional name of a .png file to save a heatmap of the matrix to (rendered in the background, see render),
+                    or of a .npy file to save the matrix to as a numpy array (of shape (vars, vars), or (categories, vars, vars) with categoricals).
+                    Denoted in user command by -o or --outfile.
+
+    FUNCTION PARAMETERS:
+        data - the input dataframe (or streaming.StreamingDataset)
+        args - array of command window argument strings obtained by command interpreter module
+    """
+
+    profile = datasetProfile.get(data)
+    parsed_args = parser(data).parse_args(args)
+
+    vars = list(dict.fromkeys(parsed_args.vars))
+    outfile = parsed_args.outfile
+    if outfile is not None and outfile[-4:] not in ('.png', '.npy'):
+        print("ERROR: output file must be a .png or .npy file")
+        return
+    if not vars:
+        print("ERROR: No numerical variables to find the matrix of")
+        return
+
+    if isinstance(data, streaming.StreamingDataset):
+        if parsed_args.method == 'spearman':
+            print("ERROR: spearman is not available in streaming mode, as ranks need the whole file")
+            return
+        index, sums = __accumulate_streaming(data, vars, parsed_args.categoricals)
+    else:
+        data = utils.select_columns(data, vars)  # Categoricals are only needed for grouping, which the profile caches
+        groups = profile.groups(parsed_args.categoricals) if parsed_args.categoricals else None
+        index, sums = __accumulate(data, vars, groups, parsed_args.method == 'spearman')
+
+    matrices = np.stack([s.covariance() if parsed_args.cov else s.correlation() for s in sums])
+    print(__build_table(matrices, vars, index))
+    print("\n")
+
+    if outfile is not None and outfile[-4:] == '.npy':
+        np.save(outfile, matrices if index is not None else matrices[0])
+    elif outfile is not None:
+        title = 'COVARIANCE' if parsed_args.cov else f"{parsed_args.method.upper()} CORRELATION"
+        render.submit(' '.join(['corr'] + args), outfile, __plot_heatmaps, matrices, vars, index, title, parsed_args.cov)
+
+
+def parser(data):
+    """Returns the argparse parser of the corr command's arguments (see get_matrix()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--vars',
+                        nargs='*',
+                        default=profile.numericals,
+                        choices=profile.numericals)
+    parser.add_argument('-c', '--categoricals',
+                        nargs='*',
+                        default=[],
+                        choices=profile.columns)
+    parser.add_argument('-m', '--method',
+                        default='pearson',
+                        choices=['pearson', 'spearman'])
+    parser.add_argument('--cov',
+                        action='store_true')
+    parser.add_argument('-o', '--outfile')
+    return parser
+
+
+def __accumulate(data, vars, groups, ranked):
+    """
+    Returns a tuple of the group index (None if no groups are provided) and a list of the PairwiseSums of each group
+    (or of the whole dataset, if no groups are provided).
+
+    The values are taken ROW_BLOCK rows at a time (of each group's rows, if grouped), so no block of every row is made.
+    Ranks are the exception, as they need all of a group's values at once: each group's ranks are found in one block.
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - list of numerical variables
+        groups - optional datasetProfile.GroupIndex dividing the datapoints into groups
+        ranked - whether to replace each variable's values by their ranks (within each group), for Spearman's coefficient
+    """
+    sums = []
+    for rows in ([None] if groups is None else [groups.rows(k) for k in range(len(groups))]):
+        if ranked:  # Average ranks for ties. Missing values stay missing
+            values = data[vars] if rows is None else data[vars].iloc[rows]
+            block = values.rank().to_numpy(dtype=np.float64, na_value=np.nan)
+            sums.append(PairwiseSums(moments.shift_for(block)).add(block))
+            continue
+
+        group_sums = None
+        for start in range(0, len(data) if rows is None else len(rows), ROW_BLOCK):
+            chunk = data.iloc[start:start + ROW_BLOCK] if rows is None else data.iloc[rows[start:start + ROW_BLOCK]]
+            block = moments.to_block(chunk, vars)
+            if group_sums is None:  # Shifted by the first block's shift
+                group_sums = PairwiseSums(moments.shift_for(block))
+            group_sums.add(block)
+        sums.append(group_sums if group_sums is not None else PairwiseSums(np.zeros(len(vars))))
+    return (None if groups is None else groups.index), sums
+
+
+def __accumulate_streaming(data, vars, categoricals):
+    """
+    Like __accumulate(), but in one pass over the chunks of a streamed file. Each group's sums are shifted by
+    the first chunk's shift, and each chunk's rows are added to the sums of their groups.
+
+    PARAMETERS:
+        data - the streaming.StreamingDataset
+        vars - list of numerical variables
+        categoricals - categorical variables in the data to divide entries into categories along (may be empty)
+    """
+    categoricals = list(categoricals)
+    sums, shift = {}, None
+    for chunk in data.chunks(vars + categoricals):
+        if not categoricals:
+            block = moments.to_block(chunk, vars)
+            shift = moments.shift_for(block) if shift is None else shift
+            sums.setdefault(None, PairwiseSums(shift)).add(block)
+            continue
+
+        groups = datasetProfile.build_groups(chunk, categoricals)
+        block = moments.to_block(chunk, vars, groups.order)
+        shift = moments.shift_for(block) if shift is None else shift
+        for k, key in enumerate(groups.index):
+            sums.setdefault(key, PairwiseSums(shift)).add(block[groups.starts[k]:groups.starts[k] + groups.sizes[k]])
+
+    if not sums:  # File has no rows
+        sums[None] = PairwiseSums(np.zeros(len(vars)))
+    if not categoricals:
+        return None, [sums[None]]
+
+    keys = sorted(sums)
+    if len(categoricals) == 1:
+        index = pd.Index(keys, name=categoricals[0])
+    else:
+        index = pd.MultiIndex.from_tuples(keys, names=categoricals)
+    return index, [sums[key] for key in keys]
+
+
+def __build_table(matrices, vars, index=None):
+    """
+    Lays out matrices in a dataframe with the vars as columns. Without a group index, the vars form the rows.
+    With one, the rows are a multiindex of the groups and the vars.
+
+    PARAMETERS:
+        matrices - 3-D array holding a matrix for each group (or just one matrix, without a group index)
+        vars - list of numerical variables, in the order of the rows & columns of the matrices
+        index - optional index of the groups
+    """
+    if index is None:
+        return pd.DataFrame(matrices[0], index=vars, columns=vars)
+    frames = [pd.DataFrame(matrix, index=vars, columns=vars) for matrix in matrices]
+    return pd.concat(frames, keys=index)
+
+
+def __plot_heatmaps(matrices, vars, index, title, cov):
+    """
+    Returns a figure with a heatmap of each group's matrix (or of the one matrix, without a group index).
+    Variable names are only labelled on the axes if there are few enough of them to be legible.
+
+    PARAMETERS:
+        matrices - 3-D array holding a matrix for each group
+        vars - list of numerical variables
+        index - optional index of the groups
+        title - title of the plot
+        cov - whether the matrices are covariance matrices, whose colour scale spans their largest magnitude
+                (rather than -1 to 1, for correlation matrices)
+    """
+    n = len(matrices)
+    ncols = int(np.ceil(np.sqrt(n)))
+    nrows = int(np.ceil(n / ncols))
+    fig = render.figure((5 * ncols + 1, 5 * nrows))
+    axes = fig.subplots(nrows, ncols, squeeze=False)
+    finite = matrices[np.isfinite(matrices)]
+    if cov:
+        lim = np.abs(finite).max() if len(finite) else 1
+    else:
+        lim = 1
+
+    for k, ax in enumerate(axes.flat):
+        if k >= n:
+            ax.axis('off')
+            continue
+        image = ax.imshow(matrices[k], cmap='RdBu_r', vmin=-lim, vmax=lim, interpolation='nearest')
+        if len(vars) <= 40:
+            ax.set_xticks(range(len(vars)), vars, rotation=90)
+            ax.set_yticks(range(len(vars)), vars)
+        else:
+            ax.set_xticks([])
+            ax.set_yticks([])
+        if index is not None:
+            label = index[k]
+            ax.set_title('_'.join(map(str, label)) if isinstance(label, tuple) else str(label))
+
+    fig.colorbar(image, ax=axes.ravel().tolist())
+    fig.suptitle(title)
+    return fig
+
+
+def print_help():
+    """Prints a help message for this module"""
+    print("usage: corr [-v/--vars] [-c/--categoricals] [-m/--method] [--cov] [-o/--outfile]")
+    print("\t-v/--vars             List of numerical variables to find the matrix of (default: all numerical vars in data)")
+    print("\t-c/--categoricals     List of categorical variables to categorize datapoints on (default: None). A matrix is found for each category")
+    print("\t-m/--method           Correlation coefficient: 'pearson' or 'spearman' (default: 'pearson')")
+    print("\t--cov                 Find the covariance matrix instead of the correlation matrix")
+    print("\t-o/--outfile          Name of .png file to save a heatmap of the matrix to, or of .npy file to save the matrix to, if so desired")
+    print("\n")
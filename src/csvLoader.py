@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype
+
+
+SAMPLE_ROWS = 100_000  # No. of rows read up front to infer the schema
+CHUNK_ROWS = 1_000_000  # No. of rows parsed per chunk
+MAX_CATEGORY_RATIO = 0.5  # A string column becomes categorical if (no. of unique values / no. of values) in the sample is at most this
+
+
+def load_csv(filename, dtype=None, usecols=None, sample_rows=SAMPLE_ROWS, chunk_rows=CHUNK_ROWS):
+    """ Loads a CSV file into a compact pd dataframe, reading it in chunks.
+
+    A sample of the file is read first to infer a compact schema:
+        - String columns with few unique values are read as pandas categoricals
+        - Numerical columns are downcast to the smallest dtype that holds their values without loss
+    The file is then parsed chunk by chunk using that schema, so that the full-width (e.g. object, int64) version
+    of the data never has to be held in memory at once.
+
+    PARAMETERS:
+        filename - name of csv file to load
+        dtype - optional dict mapping column names to dtypes. These override the inferred schema for those columns
+        usecols - optional list of the columns to load. All columns are loaded if not provided
+        sample_rows - no. of rows to read when inferring the schema
+        chunk_rows - no. of rows to parse per chunk
+    """
+    dtype = dict(dtype) if dtype else {}
+    schema = infer_schema(filename, dtype, usecols, sample_rows)
+
+    chunks = []
+    for chunk in pd.read_csv(filename, dtype=schema, usecols=usecols, chunksize=chunk_rows):
+        for col in chunk.columns:
+            if col not in dtype and is_numeric_dtype(chunk[col]) and not is_bool_dtype(chunk[col]):
+                chunk[col] = __downcast(chunk[col])
+        chunks.append(chunk)
+
+    if not chunks:  # File has a header but no rows
+        return pd.read_csv(filename, dtype=schema, usecols=usecols)
+
+    # Each chunk only knows the categories that appear in it, so these have to be unified before concatenating.
+    # Otherwise, pd.concat() would fall back to object columns.
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            categories = pd.Index([])
+            for chunk in chunks:
+                categories = categories.union(chunk[col].cat.categories)
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def infer_schema(filename, dtype=None, usecols=None, sample_rows=SAMPLE_ROWS):
+    """ Reads a sample of a CSV file and returns a dict mapping column names to the dtypes they should be parsed as.
+
+    Only string columns judged to be low-cardinality get an entry (as 'category'), along with any
+    user-supplied overrides. Other columns are left to the parser, and numerical ones are downcast after parsing.
+
+    PARAMETERS:
+        filename - name of csv file to sample
+        dtype - optional dict mapping column names to dtypes, which are passed through unchanged
+        usecols - optional list of the columns to load
+        sample_rows - no. of rows to read for the sample
+    """
+    dtype = dtype or {}
+    sample = pd.read_csv(filename, nrows=sample_rows, usecols=usecols, dtype=dtype)
+
+    schema = dict(dtype)
+    for col in sample.columns:
+        if col in dtype or is_numeric_dtype(sample[col]) or is_bool_dtype(sample[col]):
+            continue
+        values = sample[col].dropna()
+        if len(values) > 0 and values.nunique() / len(values) <= MAX_CATEGORY_RATIO:
+            schema[col] = 'category'
+    return schema
+
+
+def memory_usage(data):
+    """Returns the no. of bytes used by a dataframe, including the contents of object columns"""
+    return int(data.memory_usage(deep=True).sum())
+
+
+def __downcast(series):
+    """ Returns a numerical series converted to the smallest dtype that holds all its values without loss.
+
+    Integers are downcast to the smallest signed integer type that fits their range.
+    Floats are only converted to float32 if every value survives the round trip unchanged.
+    """
+    if is_integer_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    if is_float_dtype(series) and series.dtype != np.float32:
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=True):
+            return series.astype(np.float32)
+    return series
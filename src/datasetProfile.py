@@ -0,0 +1,173 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+import histogramIndex
+import profiler
+import utils
+
+
+HISTOGRAM_BUDGET = 256 * 2**20  # Max. bytes of histograms & binned rows cached by a profile (see DatasetProfile.histogram())
+
+
+class GroupIndex:
+    """ The division of a dataset's rows into the groups formed by each observed combination of values of some categoricals.
+
+    ATTRIBUTES:
+        codes - array giving the group no. of each row (-1 for rows missing a value of any of the categoricals)
+        index - the index of the groups, in group no. order. This is the same (sorted) index that data.groupby(categoricals)
+                would produce: a simple index for one categorical, or a multiindex for several.
+        sizes - array of the no. of rows in each group
+        order - array of row nos. sorted by group, leaving out rows without a group. The rows of group k are
+                order[starts[k]:starts[k]+sizes[k]]
+        starts - array of the position in order at which each group's rows start
+    """
+
+    def __init__(self, codes, index):
+        self.codes = codes
+        self.index = index
+        self.sizes = np.bincount(codes[codes >= 0], minlength=len(index))
+        order = np.argsort(codes, kind='stable')
+        self.order = order[len(order) - self.sizes.sum():]  # Drop rows without a group, which sort first
+        self.starts = np.concatenate(([0], np.cumsum(self.sizes)[:-1])).astype(np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    def rows(self, k):
+        """Returns the row nos. of group no. k"""
+        return self.order[self.starts[k]:self.starts[k] + self.sizes[k]]
+
+    def names(self):
+        """ Returns a list of the name of each group, in group no. order: the values of the categoricals joined by underscores
+        (suffixed by the group no. if any names collide)
+        """
+        names = ['_'.join(str(v) for v in key) if isinstance(key, tuple) else str(key) for key in self.index]
+        if len(set(names)) < len(names):  # Distinct groups whose joined names collide
+            names = [f"{name}_{k}" for k, name in enumerate(names)]
+        return names
+
+    def labels(self):
+        """ Returns a categorical giving each row the name of its group (see names()), NaN for rows without a group"""
+        return pd.Categorical.from_codes(self.codes, categories=self.names())
+
+
+class DatasetProfile:
+    """ Derived state about the loaded dataset that is shared by all commands, so that it is only computed once per session.
+
+    Holds the list of numerical columns, and (built on first request, then cached) the levels of each categorical,
+    the GroupIndex of every combination of categoricals that a command has grouped on, and the histograms of the
+    numerical vars (or pairs of them) that have been plotted, for each grouping they've been plotted with
+    (up to HISTOGRAM_BUDGET bytes of them).
+    Use get() to obtain the profile of a dataset.
+    """
+
+    def __init__(self, data):
+        """
+        PARAMETERS:
+            data - the input dataframe or column store
+        """
+        self.data = data
+        self.columns = list(data.columns)
+        self.numericals = utils.get_numericals(data)
+        self.__levels = {}
+        self.__groups = {}
+        self.__histograms = collections.OrderedDict()  # Histograms & binned rows (see histogram()), least recently used first
+        self.__histogram_bytes = 0
+
+    def levels(self, categorical):
+        """Returns an array of the distinct non-missing values of a categorical, in order of first appearance"""
+        if categorical not in self.__levels:
+            values = utils.select_columns(self.data, [categorical])[categorical]
+            self.__levels[categorical] = np.asarray(values.dropna().unique())
+        return self.__levels[categorical]
+
+    def groups(self, categoricals):
+        """ Returns the GroupIndex for a list of categoricals, building and caching it on first request
+
+        PARAMETERS:
+            categoricals - list of categorical variables to group on
+        """
+        key = tuple(categoricals)
+        if key not in self.__groups:
+            with profiler.stage('group'):
+                self.__groups[key] = build_groups(utils.select_columns(self.data, categoricals), categoricals)
+        return self.__groups[key]
+
+    def histogram(self, vars, categoricals=()):
+        """ Returns the HistogramPyramid of 1 numerical var, or a pair of them, with a group for each group of some
+        categoricals (or a single group of all rows, if none). Each var's (or pair's) rows are binned once, on first
+        request, and the counts of each grouping are then cached. The binned rows and the counts share a budget of
+        HISTOGRAM_BUDGET bytes, beyond which the least recently used are dropped (see __cache()).
+
+        PARAMETERS:
+            vars - list of 1 or 2 numerical variables
+            categoricals - list of categorical variables to group on
+        """
+        key = ('histogram', tuple(vars), tuple(categoricals))
+        pyramid = self.__cached(key)
+        if pyramid is None:
+            groups = self.groups(categoricals) if categoricals else None
+            with profiler.stage('histogram'):
+                binned = self.__cached(('binned', tuple(vars)))
+                if binned is None:
+                    binned = histogramIndex.bin_rows(utils.select_columns(self.data, list(vars)), list(vars))
+                    self.__cache(('binned', tuple(vars)), binned, binned.cells.nbytes)
+                if groups is not None:
+                    pyramid = histogramIndex.HistogramPyramid(binned, groups.codes, len(groups))
+                else:
+                    pyramid = histogramIndex.HistogramPyramid(binned)
+            self.__cache(key, pyramid, pyramid.nbytes())
+        return pyramid
+
+    def __cached(self, key):
+        """Returns a cached histogram or binned rows, marking it as most recently used, or None if it isn't cached"""
+        if key not in self.__histograms:
+            return None
+        self.__histograms.move_to_end(key)
+        return self.__histograms[key][0]
+
+    def __cache(self, key, value, nbytes):
+        """ Caches a histogram or binned rows, then drops the least recently used ones until they all fit in
+        HISTOGRAM_BUDGET bytes. Anything larger than the budget on its own isn't kept at all
+        """
+        self.__histograms[key] = (value, nbytes)
+        self.__histogram_bytes += nbytes
+        while self.__histogram_bytes > HISTOGRAM_BUDGET:
+            _, (_, dropped) = self.__histograms.popitem(last=False)
+            self.__histogram_bytes -= dropped
+
+
+def build_groups(data, categoricals):
+    """ Returns a new GroupIndex dividing the rows of a dataframe along some categoricals
+
+    PARAMETERS:
+        data - dataframe containing the categoricals
+        categoricals - list of categorical variables to group on
+    """
+    grouped = data.groupby(list(categoricals), sort=True, observed=True)
+    codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)  # ngroup() gives NaN for rows that are left out
+    return GroupIndex(codes, grouped.size().index)
+
+
+__current = None  # Profile of the dataset currently in use
+
+
+def get(data):
+    """ Returns the profile of a dataset. The profile is cached, and only rebuilt when a different dataset is passed
+    or the cache has been invalidated.
+
+    PARAMETERS:
+        data - the input dataframe or column store
+    """
+    global __current
+    if __current is None or __current.data is not data:
+        __current = DatasetProfile(data)
+    return __current
+
+
+def invalidate():
+    """Discards the cached profile. Must be called if the loaded dataset is modified in place"""
+    global __current
+    __current = None
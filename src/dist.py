@@ -1,13 +1,27 @@
 import argparse
-import seaborn as sns
-from PIL import Image
+import os
 
+import numpy as np
+
+import datasetProfile
+import kde
+import render
 import utils
 
 
+MAX_BINS = 1024  # Max. no. of histogram bins. Otherwise there are about sqrt(no. of datapoints) bins (the nearest power of 2)
+MAX_BINS_2D = 256  # Max. no. of heatmap bins along each dimension. Otherwise there are about 2 * cbrt(no. of datapoints)
+FACET_COLUMNS = 3  # No. of plots per row when plotting a distribution for each category
+COLORMAP = 'magma_r'
+
+
 def show_dist(data, args):
-    """ Shows a seaborn figure containing the histogram and probability function (pdf) plot of a numerical variable's distribution
+    """ Saves a figure containing the histogram and probability function (pdf) plot of a numerical variable's distribution
     If categoricals are passed, then categorizes the datapoints and shows multiple of these distribution plots.
+    The figure is rendered by the background worker (see render), so the command returns before it has been saved.
+    The pdf is a Gaussian kernel density estimate computed by binning and FFT convolution (see kde). Both are drawn
+    from the var's histogram pyramid (see histogramIndex), which is cached in the dataset profile, so repeated plots
+    of the var, with any categoricals, don't pass over its values again.
 
     COMMAND WINDOW ARGUMENTS:
 
@@ -22,79 +36,164 @@ def show_dist(data, args):
         If no categoricals are provided, no categorization will take place and the distribution will be shown for the dataset holistically.
         By default, the categoricals list will be empty.
 
+        page_size - if provided with categoricals, the plots of the categories are split into pages of at most this many plots,
+                    which are rendered in parallel (see render.submit_pages()) and saved to separate files, named after
+                    outFile with the page no. appended (e.g. output_01.png), along with a JSON index of the pages (e.g. output.json).
+                    All pages share the same bins and axis limits. Denoted in user command by -p or --page-size.
+
     FUNCTION PARAMETERS:
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
 
-    # Deriving argument values from args array using argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('var', choices=utils.get_numericals(data))
-    parser.add_argument('-o', '--outfile',
-                        nargs='?',
-                        default='output.png')
-    parser.add_argument('-c', '--categoricals',
-                        nargs='*',
-                        default=[],
-                        choices=data.columns.values)
-    parsed_args = parser.parse_args(args)
+    profile = datasetProfile.get(data)
+
+    parsed_args = univ_parser(data).parse_args(args)
     
     # Check if specified output file is a png
     if utils.check_valid_png(parsed_args.outfile) == -1:
         return 
+    if __invalid_page_size(parsed_args):
+        return
     
+    # The histograms are built (or fetched from the profile) here, as the profile isn't safe to use from the worker
+    description = ' '.join(['dist', 'univ'] + args)
     if parsed_args.categoricals == []:
-        plot = __plot_dist(data, parsed_args.var)
+        pyramid = profile.histogram([parsed_args.var])
+        render.submit(description, parsed_args.outfile, __plot_dist, pyramid, parsed_args.var)
     else:
-        plot = __plot_dist_by_categoricals(data, parsed_args.var, parsed_args.categoricals)
+        pyramid = profile.histogram([parsed_args.var], parsed_args.categoricals)
+        names = profile.groups(parsed_args.categoricals).names()
+        level = __hist_level(pyramid)
+        ylim = (0, 1.05 * max(1, pyramid.max(level)))  # The same scale for every category, on every page
+        title = f"DISTRIBUTION OF {parsed_args.var} BY {parsed_args.categoricals}"
+        if parsed_args.page_size is None:
+            render.submit(description, parsed_args.outfile, __plot_dist_by_categoricals,
+                          pyramid, names, title, parsed_args.var, level, ylim)
+        else:
+            info = {'vars': [parsed_args.var], 'categoricals': parsed_args.categoricals,
+                    'bins': pyramid.bins(level), 'range': pyramid.ranges[0]}
+            __submit_pages(description, parsed_args.outfile, parsed_args.page_size, __plot_dist_by_categoricals,
+                           pyramid, names, title, (parsed_args.var, level, ylim), info)
+
+
+def univ_parser(data):
+    """Returns the argparse parser of the dist univ command's arguments (see show_dist()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('var', choices=profile.numericals)
+    parser.add_argument('-o', '--outfile',
+                        nargs='?',
+                        default='output.png')
+    parser.add_argument('-c', '--categoricals',
+                        nargs='*',
+                        default=[],
+                        choices=profile.columns)
+    parser.add_argument('-p', '--page-size',
+                        type=int,
+                        default=None)
+    return parser
 
-    # Save plot to png file
-    plot.figure.savefig(parsed_args.outfile)
 
-    # Display saved image
-    img = Image.open(parsed_args.outfile)
-    img.show()
+def __plot_dist(pyramid, var):
+    """ Returns a figure showing the probability curve (pdf) and a histogram of a provided numerical var.
 
+    PARAMETERS:
+        pyramid - histogramIndex.HistogramPyramid of the var
+        var - numerical var to get distribution for
+    """
+    fig = render.figure()
+    ax = fig.subplots()
+    __draw_dist(ax, pyramid, 0, __hist_level(pyramid))
+    ax.set_xlabel(var)
+    ax.set_title(f"DISTRIBUTION OF {var}")
+    fig.tight_layout()
+    return fig
 
-def __plot_dist(data, var):
-    """ Returns a seaborn figure graph showing the probability curve (pdf) and a histogram of a provided numerical var.
+
+def __plot_dist_by_categoricals(pyramid, names, title, var, level, ylim):
+    """ Returns a figure containing a series of plots, each plot showing the probability curve (pdf)
+    and histogram of each category in a provided pd series. All histograms share the same bins.
 
     PARAMETERS:
-        data - The pandas dataframe holding the data
+        pyramid - histogramIndex.HistogramPyramid of the var, with a group for each category
+        names - list of the name of each category
+        title - title of the figure
         var - numerical var to get distribution for
+        level - level of the pyramid to draw the histograms from
+        ylim - (bottom, top) limits of the count axis
+    """
+    fig, axes = __facets(names)
+    for k, ax in enumerate(axes):
+        __draw_dist(ax, pyramid, k, level)
+        ax.set_xlabel(var)
+        ax.set_ylim(ylim)
+
+    __finish_facets(fig, title)
+    return fig
+
+
+def __hist_level(pyramid):
+    """ Returns the level of a 1-D histogram pyramid with about sqrt(no. of datapoints) bins, up to MAX_BINS.
+    With several groups, the mean no. of datapoints per group is used, so each plot's histogram has a sensible no. of bins.
     """
-    plot = sns.displot(data=data, kde=True, color='r', x=var, bins='sqrt')
-    plot.set_titles(f"DISTRIBUTION OF {var}")
-    return plot
+    return pyramid.level_for(min(MAX_BINS, np.sqrt(pyramid.totals.mean())))
 
 
-def __plot_dist_by_categoricals(data, var, categoricals):
-    """ Returns a seaborn figure containing a series of plots, each plot showing the probability curve (pdf)
-    and histogram of each category in a provided pd series.
+def __draw_dist(ax, pyramid, k, level):
+    """ Draws the histogram of group k of a 1-D histogram pyramid at a level, and the group's kernel density estimate
+    (computed from the base bins) scaled to the histogram's counts
 
     PARAMETERS:
-        data - The pandas dataframe holding the data
-        var - numerical var to get distribution for
-        categoricals - categorical variable(s) to categorize values of var along
+        ax - the matplotlib axes to draw on
+        pyramid - histogramIndex.HistogramPyramid of the var
+        k - group no.
+        level - level of the pyramid to draw the histogram from
     """
+    [edges] = pyramid.edges(level)
+    counts = pyramid.counts(level, k)
+    ax.stairs(counts, edges, fill=True, color='r', alpha=0.4)
+    ax.set_ylabel('Count')
 
-    if len(categoricals) > 1:  # If more than 1 category requested
-        plot_data = data.set_index(categoricals)  # Make index a multiindex of the categoricals
-        # Since inplace=True is not passed to set_index(), this does not change the index of the original data df.
+    base = pyramid.counts(0, k)
+    found = base > 0
+    estimate = kde.density_1d(pyramid.centers(0)[0][found], base[found])
+    if estimate is not None:
+        grid, density = estimate
+        inside = (grid >= edges[0]) & (grid <= edges[-1])  # The histogram's range, as seaborn clips its curves to the data
+        ax.plot(grid[inside], density[inside] * counts.sum() * (edges[1] - edges[0]), color='r')
+
+
+def __facets(names):
+    """ Returns a figure with a grid of plots, FACET_COLUMNS per row, and a list of the axes of one plot per category,
+    titled with the category's name. Unused plots in the last row are hidden.
+
+    PARAMETERS:
+        names - list of the name of each category
+    """
+    n_cols = min(len(names), FACET_COLUMNS)
+    n_rows = int(np.ceil(len(names) / FACET_COLUMNS))
+    fig = render.figure((4 * n_cols, 4 * n_rows))
+    axes = fig.subplots(n_rows, n_cols, squeeze=False, sharex=True, sharey=True).ravel()
+    for ax, name in zip(axes, names):
+        ax.set_title(name)
+    for ax in axes[len(names):]:
+        ax.set_visible(False)
+    return fig, list(axes[:len(names)])
 
-        plot_data.index = ['_'.join(row) for row in plot_data.index.values]  # Fuses plot data's multiindex of categoricals into a single index
-        plot = sns.displot(data=plot_data, x=var, kde=True, bins='sqrt', col=plot_data.index.values, col_wrap=3)
-    else:
-        plot = sns.displot(data=data, x=var, kde=True, bins='sqrt', col=categoricals[0], col_wrap=3)
-    
-    plot.figure.subplots_adjust(top=0.9)
-    plot.figure.suptitle(f"DISTRIBUTION OF {var} BY {categoricals}")
-    return plot
+
+def __finish_facets(fig, title):
+    """Titles a figure of facets (see __facets()), and lays its plots out below the title"""
+    fig.suptitle(title)
+    fig.tight_layout(rect=(0, 0, 1, 1 - 0.5 / fig.get_size_inches()[1]))  # Half an inch for the title, however tall the figure
 
 
 def show_biv_dist(data, args):
-    """ Shows a plot of the joint/bivariate distribution of 2 numerical variables.
+    """ Saves a plot of the joint/bivariate distribution of 2 numerical variables.
     If categoricals are provided, then categorizes the datapoints and shows multiple of these distribution plots.
+    As for show_dist(), the plot is rendered by the background worker.
+    Heatmaps show the counts of the pair's 2-D histogram, and gaussian plots show contours of a kernel density
+    estimate computed from it by FFT convolution (see kde). As for show_dist(), the histogram pyramid is cached.
 
     COMMAND WINDOW ARGUMENTS:
 
@@ -111,15 +210,54 @@ def show_biv_dist(data, args):
         If no categoricals are provided, no categorization will take place and the distribution will be shown for the dataset holistically.
         By default, the categoricals list will be empty.
 
+        page_size - if provided with categoricals, splits the plots of the categories into pages of at most this many plots,
+                    saved to separate files along with a JSON index, as for show_dist(). Denoted in user command by -p or --page-size.
+
     FUNCTION PARAMETERS:
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
 
-    # Deriving argument values from args array using argparse
+    profile = datasetProfile.get(data)
+
+    parsed_args = biv_parser(data).parse_args(args)
+
+    # Check if specified output file is a png
+    if utils.check_valid_png(parsed_args.outfile) == -1:
+        return
+    if __invalid_page_size(parsed_args):
+        return
+
+    description = ' '.join(['dist', 'biv'] + args)
+    if parsed_args.categoricals == []:
+        pyramid = profile.histogram([parsed_args.v1, parsed_args.v2])
+        render.submit(description, parsed_args.outfile, __plot_biv_dist,
+                      pyramid, parsed_args.v1, parsed_args.v2, parsed_args.plot_type)
+    else:
+        pyramid = profile.histogram([parsed_args.v1, parsed_args.v2], parsed_args.categoricals)
+        names = profile.groups(parsed_args.categoricals).names()
+        level = __heatmap_level(pyramid)
+        vmax = pyramid.max(level)  # The same colour scale for every category, on every page
+        title = f"DISTRIBUTION OF {parsed_args.v1}, {parsed_args.v2} BY {parsed_args.categoricals}"
+        if parsed_args.page_size is None:
+            render.submit(description, parsed_args.outfile, __plot_biv_dist_by_categoricals,
+                          pyramid, names, title, parsed_args.v1, parsed_args.v2, parsed_args.plot_type, level, vmax, None)
+        else:
+            # Separate pages can't share axes, so every plot is given the data's range with a margin for the density's tails
+            limits = [(low - 0.1 * (high - low), high + 0.1 * (high - low)) for low, high in pyramid.ranges]
+            info = {'vars': [parsed_args.v1, parsed_args.v2], 'categoricals': parsed_args.categoricals,
+                    'plot_type': parsed_args.plot_type, 'bins': pyramid.bins(level), 'range': pyramid.ranges}
+            __submit_pages(description, parsed_args.outfile, parsed_args.page_size, __plot_biv_dist_by_categoricals,
+                           pyramid, names, title,
+                           (parsed_args.v1, parsed_args.v2, parsed_args.plot_type, level, vmax, limits), info)
+
+
+def biv_parser(data):
+    """Returns the argparse parser of the dist biv command's arguments (see show_biv_dist()) for a dataset"""
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
-    parser.add_argument('v1', choices=utils.get_numericals(data))
-    parser.add_argument('v2', choices=utils.get_numericals(data))
+    parser.add_argument('v1', choices=profile.numericals)
+    parser.add_argument('v2', choices=profile.numericals)
     parser.add_argument('plot_type',
                         nargs='?',
                         choices=('heatmap', 'gaussian'),
@@ -130,81 +268,164 @@ def show_biv_dist(data, args):
     parser.add_argument('-c', '--categoricals',
                         nargs='*',
                         default=[],
-                        choices=data.columns.values)
-    parsed_args = parser.parse_args(args)
-
-    # Check if specified output file is a png
-    if utils.check_valid_png(parsed_args.outfile) == -1:
-        return
-
-    if parsed_args.categoricals == []:
-        plot = __plot_biv_dist(data, parsed_args.v1, parsed_args.v2, parsed_args.plot_type)
-    else:
-        plot = __plot_biv_dist_by_categoricals(data, parsed_args.v1, parsed_args.v2, parsed_args.plot_type,
-                                           parsed_args.categoricals)
+                        choices=profile.columns)
+    parser.add_argument('-p', '--page-size',
+                        type=int,
+                        default=None)
+    return parser
 
-    # Save plot to png file
-    plot.figure.savefig(parsed_args.outfile)
 
-    # Display saved image
-    img = Image.open(parsed_args.outfile)
-    img.show()
-
-
-def __plot_biv_dist(data, v1, v2, plot_type):
-    """ Returns a seaborn FacetGrid with a single plot of a bivariate distribution of 2 numerical vars.
+def __plot_biv_dist(pyramid, v1, v2, plot_type):
+    """ Returns a figure with a single plot of a bivariate distribution of 2 numerical vars.
 
     PARAMETERS:
-        data - The pandas dataframe holding the data
+        pyramid - histogramIndex.HistogramPyramid of the pair of vars
         v1, v2 - numerical vars to get bivariate distribution for
         plot_type - type of plot to generate, 'gaussian' or 'heatmap'.
     """
-    kind = 'kde' if (plot_type == 'gaussian') else 'hist'  # Determine "kind" parameter for displot
-    plot = sns.displot(data=data, x=v1, y=v2, kind=kind)
-    plot.set_titles(f"DISTRIBUTION OF {v1}, {v2}")
-    return plot
+    fig = render.figure()
+    ax = fig.subplots()
+    if plot_type == 'heatmap':
+        level = __heatmap_level(pyramid)
+        __draw_heatmap(ax, pyramid, 0, level, pyramid.max(level))
+    else:
+        __draw_biv_density(ax, pyramid, 0)
+    ax.set_xlabel(v1)
+    ax.set_ylabel(v2)
+    ax.set_title(f"DISTRIBUTION OF {v1}, {v2}")
+    fig.tight_layout()
+    return fig
 
 
-def __plot_biv_dist_by_categoricals(data, v1, v2, plot_type, categoricals):
-    """ Returns a seaborn FacetGrid containing a series of plots of bivariate distributions, with each plot corresponding to a category.
+def __plot_biv_dist_by_categoricals(pyramid, names, title, v1, v2, plot_type, level, vmax, limits):
+    """ Returns a figure containing a series of plots of bivariate distributions, with each plot corresponding to a category.
+    Heatmaps of all categories share the same bins and colour scale.
 
     PARAMETERS:
-        data - The pandas dataframe holding the data
+        pyramid - histogramIndex.HistogramPyramid of the pair of vars, with a group for each category
+        names - list of the name of each category
+        title - title of the figure
         v1, v2 - numerical vars to get bivariate distribution for
         plot_type - type of plot to generate, 'gaussian' or 'heatmap'
-        categoricals - categorical variable(s) to categorize values of var along
+        level - level of the pyramid to draw heatmaps from
+        vmax - count given the darkest colour in heatmaps
+        limits - optional list of the (low, high) limits of the v1 & v2 axes (by default, they fit the plots)
     """
+    fig, axes = __facets(names)
+    for k, ax in enumerate(axes):
+        if plot_type == 'heatmap':
+            __draw_heatmap(ax, pyramid, k, level, vmax)
+        else:
+            __draw_biv_density(ax, pyramid, k)
+        ax.set_xlabel(v1)
+        ax.set_ylabel(v2)
+        if limits is not None:
+            ax.set_xlim(limits[0])
+            ax.set_ylim(limits[1])
+
+    __finish_facets(fig, title)
+    return fig
+
+
+def __heatmap_level(pyramid):
+    """ Returns the level of a 2-D histogram pyramid with about 2 * cbrt(no. of datapoints) bins along each dimension
+    (the Rice rule), up to MAX_BINS_2D. As for __hist_level(), the mean no. of datapoints per group is used.
+    """
+    return pyramid.level_for(min(MAX_BINS_2D, 2 * np.cbrt(pyramid.totals.mean())))
 
-    kind = 'kde' if (plot_type == 'gaussian') else 'hist'
 
-    if len(categoricals) > 1:  # If more than 1 category requested
-        plot_data = data.set_index(categoricals)  # Make index of plot data a multiindex of the categoricals
-        # Since inplace=True is not passed to set_index(), this does not change the index of the original data df.
+def __draw_heatmap(ax, pyramid, k, level, vmax):
+    """ Draws the counts of group k of a 2-D histogram pyramid at a level as a heatmap, leaving empty bins blank
 
-        plot_data.index = ['_'.join(row) for row in
-                           plot_data.index.values]  # Fuses plot_data's multiindex of categoricals into a single index
-        plot = sns.displot(data=data, x=v1, y=v2, kind=kind, col=plot_data.index.values, col_wrap=3)
-    else:
-        plot = sns.displot(data=data, x=v1, y=v2, kind=kind, col=categoricals[0], col_wrap=3)
+    PARAMETERS:
+        ax - the matplotlib axes to draw on
+        pyramid - histogramIndex.HistogramPyramid of the pair of vars
+        k - group no.
+        level - level of the pyramid to draw
+        vmax - count given the darkest colour
+    """
+    edges_x, edges_y = pyramid.edges(level)
+    counts = np.ma.masked_equal(pyramid.counts(level, k), 0)
+    ax.pcolormesh(edges_x, edges_y, counts, cmap=COLORMAP, vmin=0, vmax=max(vmax, 1))
+
+
+def __draw_biv_density(ax, pyramid, k):
+    """ Draws contours of the kernel density estimate of group k of a 2-D histogram pyramid (computed from the base bins),
+    at the levels enclosing 5%, 15%, ... of the probability mass (lowest in density first), as seaborn's kdeplot does by default
 
-    plot.figure.subplots_adjust(top=0.9)
-    plot.figure.suptitle(f"DISTRIBUTION OF {v1}, {v2} BY {categoricals}")
-    return plot
+    PARAMETERS:
+        ax - the matplotlib axes to draw on
+        pyramid - histogramIndex.HistogramPyramid of the pair of vars
+        k - group no.
+    """
+    base = pyramid.counts(0, k)
+    rows, cols = np.nonzero(base)
+    centers_x, centers_y = pyramid.centers(0)
+    x, y = centers_x[cols], centers_y[rows]
+    estimate = kde.density_2d(x, y, base[rows, cols])
+    if estimate is None:  # Too few (or collinear) datapoints for a density, so the occupied bins are shown instead
+        ax.scatter(x, y, s=4)
+        return
+    grid_x, grid_y, density = estimate
+    levels = np.unique(kde.iso_proportion_levels(density, np.linspace(0.05, 1, 10)))
+    ax.contour(grid_x, grid_y, density, levels=levels, cmap=COLORMAP)
+
+
+def __invalid_page_size(parsed_args):
+    """Prints an error and returns True if a page size was given without categoricals, or isn't positive"""
+    if parsed_args.page_size is None:
+        return False
+    if parsed_args.page_size < 1:
+        print("ERROR: The page size must be at least 1")
+        return True
+    if parsed_args.categoricals == []:
+        print("ERROR: Pages can only be used with categoricals (-c)")
+        return True
+    return False
+
+
+def __submit_pages(description, outfile, page_size, plot, pyramid, names, title, args, info):
+    """ Splits the categories of a plot into pages of page_size, and queues them to be rendered in parallel (see
+    render.submit_pages()). Page i is saved to outfile with _i appended to its name, and the index to outfile's name with a .json extension.
+
+    PARAMETERS:
+        description - short description of the plot
+        outfile - name of the .png file the pages are named after
+        page_size - max. no. of categories per page
+        plot - function returning the figure of a page, called as plot(pyramid, names, title, *args) with the pyramid & names of the page's categories
+        pyramid - histogramIndex.HistogramPyramid of the var(s), with a group for each category
+        names - list of the name of each category
+        title - title of the plot, to which the page no. is added
+        args - tuple of the remaining arguments of plot
+        info - dict of information about the plot for the index
+    """
+    stem, extension = os.path.splitext(outfile)
+    starts = range(0, len(names), page_size)
+    digits = len(str(len(starts)))
+    pages = []
+    for i, start in enumerate(starts, 1):
+        stop = min(start + page_size, len(names))
+        page_title = f"{title} (PAGE {i} OF {len(starts)})"
+        pages.append((f"{stem}_{i:0{digits}d}{extension}", (pyramid.subset(start, stop), names[start:stop], page_title) + args,
+                      {'categories': names[start:stop]}))
+    render.submit_pages(description, f"{stem}.json", plot, pages, {'title': title, **info})
 
 
 def print_help():
     """Prints a help message for this module"""
     print("FOR UNIVARIATE DIST:")
-    print("\tusage: dist [U/univ] [var] [-o/--outfile] [-c/--categoricals]")
+    print("\tusage: dist [U/univ] [var] [-o/--outfile] [-c/--categoricals] [-p/--page-size]")
     print("\t\tvar                   Numerical variable to show dist for")
     print("\t\t-o/--outfile          Name of .png file to save outputted plot image to, if so desired")
     print("\t\t-c/--categoricals     List of categorical variables to categorize datapoints on (default: None). No categorization if none provided")
+    print("\t\t-p/--page-size        Max. no. of categories per page. If given, pages are rendered in parallel to separate files, with a .json index")
     print("\n")
 
     print("FOR BIVARIATE DIST:")
-    print("\tusage: dist [B/biv] [v1] [v2] [plot_type] [-o/--outfile] [-c/--categoricals]")
+    print("\tusage: dist [B/biv] [v1] [v2] [plot_type] [-o/--outfile] [-c/--categoricals] [-p/--page-size]")
     print("\t\tv1, v2                Numerical variables to show dist for")
     print("\t\tplot_type                  Type of plot to generate, 'gaussian' or 'heatmap' (default: 'heatmap')")
     print("\t\t-o/--outfile          Name of .png file to save outputted plot image to, if so desired")
     print("\t\t-c/--categoricals     List of categorical variables to categorize datapoints on (default: None). No categorization if none provided")
+    print("\t\t-p/--page-size        Max. no. of categories per page. If given, pages are rendered in parallel to separate files, with a .json index")
     print("\n")
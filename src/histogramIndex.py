@@ -0,0 +1,174 @@
+import copy
+
+import numpy as np
+
+import moments
+
+
+BASE_BINS = 4096  # No. of base (finest) bins of a 1-D histogram. A power of 2, so that every coarser level halves it
+BASE_BINS_2D = 256  # No. of base bins along each dimension of a 2-D histogram. A power of 2, as for BASE_BINS
+ROW_CHUNK = 2**22  # No. of rows binned at once, bounding the size of temporary arrays
+
+
+class BinnedRows:
+    """ The base bin that each row's value of a numerical var (or pair of values of 2 numerical vars) falls in.
+    Binning every row is the only pass over the data that a histogram needs, so this is kept and reused to
+    count the rows of any grouping of the dataset.
+
+    ATTRIBUTES:
+        ranges - list holding the (low, high) range spanned by the bins along each dimension: the smallest & largest value
+        bins - no. of base bins along each dimension
+        cells - array giving the flat base bin no. of each row (-1 for rows missing a value of any of the vars).
+                For pairs, bin (i, j) of the 1st & 2nd vars is cell j * bins + i
+    """
+
+    def __init__(self, ranges, bins, cells):
+        self.ranges = ranges
+        self.bins = bins
+        self.cells = cells
+
+
+class HistogramPyramid:
+    """ Counts of a numerical var's values (or of 2 numerical vars' pairs of values) in evenly spaced bins, for each
+    group of rows, at several resolutions. Level 0 holds the base bins, and each further level merges every 2 adjacent
+    bins (along each dimension) of the level before, down to a single bin. All levels and groups span the same range.
+
+    Only the groups with at least one row counted are allocated, and counts are kept in the smallest unsigned integer
+    type that holds the largest group's total (e.g. uint8 for groups of up to 255 rows), so that grouping on many
+    categories doesn't take a dense array of 64-bit counts per category. Use counts() to read a group's counts.
+
+    ATTRIBUTES:
+        ranges - list holding the (low, high) range spanned by the bins along each dimension
+        n_groups - no. of groups
+        totals - array of the no. of rows counted in each group
+        groups - sorted array of the group nos. with any rows counted, whose counts are allocated
+        levels - list of arrays of counts, one per level. The 1st axis of each is the position of the group in groups,
+                 then there is one axis per dimension: for pairs, counts[i, y, x] is the count of bin x of the 1st var &
+                 bin y of the 2nd var (rows of the 2nd var's bins, as matplotlib expects for images)
+    """
+
+    def __init__(self, binned, codes=None, n_groups=1):
+        """
+        PARAMETERS:
+            binned - BinnedRows of the var(s)
+            codes - array giving the group no. of each row (-1 for rows without a group). By default, all rows form 1 group
+            n_groups - no. of groups
+        """
+        self.ranges = binned.ranges
+        self.n_groups = n_groups
+        dims = len(binned.ranges)
+        n_cells = binned.bins ** dims
+
+        self.totals = np.zeros(n_groups, dtype=np.int64)
+        for cells, chunk_codes in HistogramPyramid.__chunks(binned, codes):
+            self.totals += np.bincount(chunk_codes, minlength=n_groups)
+        self.groups = np.flatnonzero(self.totals)
+        positions = np.full(n_groups, -1, dtype=np.int64)
+        positions[self.groups] = np.arange(len(self.groups))
+        dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64) if self.totals.max(initial=0) <= np.iinfo(dtype).max)
+
+        counts = np.zeros(len(self.groups) * n_cells, dtype=dtype)
+        for cells, chunk_codes in HistogramPyramid.__chunks(binned, codes):
+            flat = positions[chunk_codes] * n_cells + cells
+            if len(counts) <= 4 * len(flat):
+                np.add(counts, np.bincount(flat, minlength=len(counts)), out=counts, casting='unsafe')
+            else:  # Counts of many groups, most of them empty in any chunk, so only the occupied cells are counted
+                occupied, found = np.unique(flat, return_counts=True)
+                counts[occupied] += found.astype(dtype)
+
+        # A group's count in any bin is at most its total, so every level fits in the same type
+        self.levels = [counts.reshape((len(self.groups),) + (binned.bins,) * dims)]
+        while self.levels[-1].shape[-1] > 1:
+            counts = self.levels[-1]
+            for axis in range(1, counts.ndim):  # Sum each pair of adjacent bins along every dimension
+                counts = counts.reshape(counts.shape[:axis] + (counts.shape[axis] // 2, 2) + counts.shape[axis + 1:]).sum(axis=axis + 1, dtype=dtype)
+            self.levels.append(counts)
+
+    def counts(self, level, k):
+        """Returns the counts of group no. k at a level, as 64-bit integers (all 0 for a group without any rows counted)"""
+        i = np.searchsorted(self.groups, k)
+        if i < len(self.groups) and self.groups[i] == k:
+            return self.levels[level][i].astype(np.int64)
+        return np.zeros(self.levels[level].shape[1:], dtype=np.int64)
+
+    def max(self, level):
+        """Returns the largest count in any bin of any group at a level"""
+        return int(self.levels[level].max(initial=0))
+
+    def bins(self, level):
+        """Returns the no. of bins along each dimension at a level"""
+        return self.levels[level].shape[-1]
+
+    def nbytes(self):
+        """Returns the no. of bytes taken by the counts"""
+        return sum(counts.nbytes for counts in self.levels) + self.totals.nbytes
+
+    def subset(self, start, stop):
+        """Returns a HistogramPyramid of groups no. start to stop - 1 only (e.g. the groups plotted on one page)"""
+        pyramid = copy.copy(self)
+        first, last = np.searchsorted(self.groups, [start, stop])
+        pyramid.n_groups = stop - start
+        pyramid.totals = self.totals[start:stop]
+        pyramid.groups = self.groups[first:last] - start
+        pyramid.levels = [counts[first:last] for counts in self.levels]
+        return pyramid
+
+    def level_for(self, bins):
+        """Returns the no. of the level whose no. of bins along each dimension is closest (on a log scale) to a target no."""
+        finest = len(self.levels) - 1  # Levels halve the no. of bins, so the base level has 2^finest bins
+        return int(np.clip(finest - np.round(np.log2(max(bins, 1))), 0, finest))
+
+    def edges(self, level):
+        """Returns a list of the bin edges along each dimension at a level"""
+        bins = self.levels[level].shape[-1]
+        return [np.linspace(low, high, bins + 1) for low, high in self.ranges]
+
+    def centers(self, level):
+        """Returns a list of the bin centres along each dimension at a level"""
+        return [(edges[:-1] + edges[1:]) / 2 for edges in self.edges(level)]
+
+    @staticmethod
+    def __chunks(binned, codes):
+        """ Yields the base bin nos. and the group nos. of the rows of each run of ROW_CHUNK rows that have a value
+        of every var and (if codes are given) a group. Without codes, every row is in group 0
+        """
+        for i in range(0, len(binned.cells), ROW_CHUNK):
+            cells = binned.cells[i:i + ROW_CHUNK]
+            if codes is None:
+                valid = cells >= 0
+                yield cells[valid], np.zeros(np.count_nonzero(valid), dtype=np.int64)
+            else:
+                chunk_codes = codes[i:i + ROW_CHUNK]
+                valid = (cells >= 0) & (chunk_codes >= 0)
+                yield cells[valid], chunk_codes[valid]
+
+
+def bin_rows(data, vars):
+    """ Returns the BinnedRows of 1 numerical var (with BASE_BINS bins) or of a pair of numerical vars (with BASE_BINS_2D
+    bins along each dimension). The bins span the values of the rows that have a value of every var.
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - list of 1 or 2 numerical vars
+    """
+    block = moments.to_block(data, vars)
+    valid = ~np.isnan(block).any(axis=1)
+    bins = BASE_BINS if len(vars) == 1 else BASE_BINS_2D
+
+    ranges = []
+    for d in range(len(vars)):
+        values = block[valid, d]
+        low, high = (values.min(), values.max()) if len(values) > 0 else (0.0, 1.0)
+        if low == high:  # A single value, which is put in the middle of a bin of width 1
+            low, high = low - 0.5, high + 0.5
+        ranges.append((float(low), float(high)))
+
+    cells = np.full(len(block), -1, dtype=np.int32)
+    for i in range(0, len(block), ROW_CHUNK):
+        chunk, chunk_valid = block[i:i + ROW_CHUNK], valid[i:i + ROW_CHUNK]
+        flat = np.zeros(chunk_valid.sum(), dtype=np.int32)
+        for d, (low, high) in enumerate(ranges):
+            position = (chunk[chunk_valid, d] - low) / (high - low) * bins
+            flat += np.clip(position.astype(np.int32), 0, bins - 1) * bins**d  # The largest value falls in the last bin
+        cells[i:i + ROW_CHUNK][chunk_valid] = flat
+    return BinnedRows(ranges, bins, cells)
@@ -0,0 +1,146 @@
+import numpy as np
+from scipy import signal
+
+
+GRIDSIZE = 200  # No. of grid points (per dimension) at which densities are evaluated
+CUT = 3  # Grids extend this many bandwidths beyond the smallest & largest values
+BIN_CHUNK = 2**22  # No. of values binned at once, bounding the size of temporary arrays
+
+
+def scott_factor(n, d):
+    """Returns Scott's rule factor n^(-1/(d+4)), by which the standard deviation (or covariance, squared) of d-dimensional data is scaled into a bandwidth"""
+    return n ** (-1 / (d + 4))
+
+
+def density_1d(values, weights=None, gridsize=GRIDSIZE, cut=CUT):
+    """ Estimates the probability density of some values with a Gaussian kernel, on an evenly spaced grid.
+    Returns a tuple of the grid and the density at each grid point, or None if there are fewer than 2 distinct values.
+    Values can be weighted by how many times each occurs (e.g. the centres of histogram bins, weighted by their counts).
+
+    The bandwidth is the standard deviation of the values scaled by Scott's rule (as for scipy's gaussian_kde).
+    Rather than evaluating the kernel at every value, the values are first linearly binned onto the grid, which is
+    then convolved with the kernel using an FFT, so the cost after binning doesn't depend on the no. of values.
+
+    PARAMETERS:
+        values - 1-D array of values, with no missing values
+        weights - optional array of the no. of times each value occurs (default: once)
+        gridsize - no. of grid points
+        cut - no. of bandwidths the grid extends beyond the smallest & largest values
+    """
+    n = len(values) if weights is None else weights.sum()
+    if n < 2:
+        return None
+    mean = np.average(values, weights=weights)
+    std = np.sqrt(np.average(np.square(values - mean), weights=weights) * n / (n - 1))
+    if not std > 0:
+        return None
+    bandwidth = std * scott_factor(n, 1)
+
+    grid = np.linspace(values.min() - cut * bandwidth, values.max() + cut * bandwidth, gridsize)
+    step = grid[1] - grid[0]
+    counts = linear_bin_1d(values, grid[0], step, gridsize, weights)
+
+    offsets = np.arange(-(gridsize - 1), gridsize) * step
+    kernel = np.exp(-0.5 * np.square(offsets / bandwidth)) / (bandwidth * np.sqrt(2 * np.pi))
+    density = signal.fftconvolve(counts, kernel, mode='same') / n
+    return grid, np.maximum(density, 0)  # FFT rounding can leave tiny negative values
+
+
+def density_2d(x, y, weights=None, gridsize=GRIDSIZE, cut=CUT):
+    """ Estimates the joint probability density of pairs of values with a Gaussian kernel, on an evenly spaced 2-D grid.
+    Returns a tuple of the x grid, the y grid and a 2-D array of the density (one row per y grid point, one column
+    per x grid point), or None if there are fewer than 3 pairs or the values are collinear.
+    As for density_1d(), pairs can be weighted by how many times each occurs.
+
+    The kernel's covariance is the covariance of the data scaled by Scott's rule (as for scipy's gaussian_kde).
+    As for density_1d(), the pairs are linearly binned onto the grid, which is then convolved with the kernel using an FFT.
+
+    PARAMETERS:
+        x, y - 1-D arrays of the values of each pair, with no missing values
+        weights - optional integer array of the no. of times each pair occurs (default: once)
+        gridsize - no. of grid points along each dimension
+        cut - no. of bandwidths the grid extends beyond the smallest & largest values along each dimension
+    """
+    n = len(x) if weights is None else weights.sum()
+    if n < 3:
+        return None
+    covariance = np.cov(x, y, fweights=weights) * scott_factor(n, 2)**2
+    determinant = np.linalg.det(covariance)
+    if not determinant > 0:
+        return None
+    bandwidths = np.sqrt(np.diag(covariance))
+
+    grid_x = np.linspace(x.min() - cut * bandwidths[0], x.max() + cut * bandwidths[0], gridsize)
+    grid_y = np.linspace(y.min() - cut * bandwidths[1], y.max() + cut * bandwidths[1], gridsize)
+    step_x, step_y = grid_x[1] - grid_x[0], grid_y[1] - grid_y[0]
+    counts = linear_bin_2d(x, y, (grid_x[0], grid_y[0]), (step_x, step_y), gridsize, weights)
+
+    offsets = np.arange(-(gridsize - 1), gridsize)
+    dx, dy = np.meshgrid(offsets * step_x, offsets * step_y)
+    inverse = np.linalg.inv(covariance)
+    exponent = inverse[0, 0] * dx**2 + 2 * inverse[0, 1] * dx * dy + inverse[1, 1] * dy**2
+    kernel = np.exp(-0.5 * exponent) / (2 * np.pi * np.sqrt(determinant))
+    density = signal.fftconvolve(counts, kernel, mode='same') / n
+    return grid_x, grid_y, np.maximum(density, 0)
+
+
+def linear_bin_1d(values, start, step, size, weights=None):
+    """ Linearly bins values onto an evenly spaced grid: each value's weight is split between its 2 neighbouring
+    grid points, in proportion to how close it is to each. Returns the total weight at each grid point.
+
+    PARAMETERS:
+        values - 1-D array of values, all within the grid
+        start - first grid point
+        step - spacing of the grid
+        size - no. of grid points
+        weights - optional array of the weight of each value (default: 1)
+    """
+    totals = np.zeros(size)
+    for i in range(0, len(values), BIN_CHUNK):
+        position = np.clip((values[i:i + BIN_CHUNK] - start) / step, 0, size - 1)
+        lower = np.minimum(position.astype(np.int64), size - 2)
+        fraction = position - lower
+        weight = 1 if weights is None else weights[i:i + BIN_CHUNK]
+        totals += np.bincount(lower, weights=(1 - fraction) * weight, minlength=size)
+        totals += np.bincount(lower + 1, weights=fraction * weight, minlength=size)
+    return totals
+
+
+def linear_bin_2d(x, y, start, step, size, weights=None):
+    """ Linearly bins pairs of values onto an evenly spaced 2-D grid, splitting each pair's weight between its 4 neighbouring
+    grid points (bilinearly). Returns the total weight at each grid point, with one row per y grid point.
+
+    PARAMETERS:
+        x, y - 1-D arrays of the values of each pair, all within the grid
+        start - tuple of the first x & y grid points
+        step - tuple of the x & y spacing of the grid
+        size - no. of grid points along each dimension
+        weights - optional array of the weight of each pair (default: 1)
+    """
+    totals = np.zeros(size * size)
+    for i in range(0, len(x), BIN_CHUNK):
+        px = np.clip((x[i:i + BIN_CHUNK] - start[0]) / step[0], 0, size - 1)
+        py = np.clip((y[i:i + BIN_CHUNK] - start[1]) / step[1], 0, size - 1)
+        lx, ly = np.minimum(px.astype(np.int64), size - 2), np.minimum(py.astype(np.int64), size - 2)
+        fx, fy = px - lx, py - ly
+        weight = 1 if weights is None else weights[i:i + BIN_CHUNK]
+        cell = ly * size + lx
+        totals += np.bincount(cell, weights=(1 - fx) * (1 - fy) * weight, minlength=size * size)
+        totals += np.bincount(cell + 1, weights=fx * (1 - fy) * weight, minlength=size * size)
+        totals += np.bincount(cell + size, weights=(1 - fx) * fy * weight, minlength=size * size)
+        totals += np.bincount(cell + size + 1, weights=fx * fy * weight, minlength=size * size)
+    return totals.reshape(size, size)
+
+
+def iso_proportion_levels(density, proportions):
+    """ Returns the density thresholds whose contours enclose the given proportions of the probability mass lowest in density
+    (as seaborn's 2-D KDE plots draw them), e.g. the contour for 0.05 leaves out the 5% of the mass in the least dense regions.
+
+    PARAMETERS:
+        density - 2-D array of the density on an evenly spaced grid
+        proportions - increasing array of proportions between 0 and 1
+    """
+    values = np.sort(density.ravel())
+    mass = np.cumsum(values)
+    mass /= mass[-1]
+    return values[np.minimum(np.searchsorted(mass, proportions), len(values) - 1)]
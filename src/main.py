@@ -1,19 +1,110 @@
+import argparse
+import os
 import sys
 
 import commandInterpreter
+import datasetProfile
+import profiler
+import resultCache
+import scriptRunner
+import streaming
 import utils
 
 
-# Command-line arg is name of input CSV file
-try:
-    filename = sys.argv[1]
-except IndexError:  # If no file was provided
+def __dtype_override(token):
+    """Argparse type for a column dtype override given as COLUMN=DTYPE (e.g. price=float32)"""
+    col, sep, dtype = token.partition('=')
+    if not sep or not col or not dtype:
+        raise argparse.ArgumentTypeError(f"invalid dtype override: {token} (expected COLUMN=DTYPE)")
+    return col, dtype
+
+
+# Command-line args are the name of the input CSV file, then optional loading overrides
+parser = argparse.ArgumentParser()
+parser.add_argument('filename', nargs='?')
+parser.add_argument('--usecols',
+                    nargs='*',
+                    default=None)
+parser.add_argument('--dtype',
+                    nargs='*',
+                    default=[],
+                    type=__dtype_override)
+parser.add_argument('--no-cache',
+                    action='store_true')
+parser.add_argument('--cache-budget',
+                    type=float,
+                    default=None)  # In MB
+parser.add_argument('--in-memory',
+                    action='store_true')
+parser.add_argument('--stream',
+                    action='store_true')
+parser.add_argument('--stream-threshold',
+                    type=float,
+                    default=None)  # In MB
+parser.add_argument('--no-result-cache',
+                    action='store_true')
+parser.add_argument('--result-cache-budget',
+                    type=float,
+                    default=resultCache.MEMORY_BUDGET / 2**20)  # In MB
+parser.add_argument('--persist-results',
+                    action='store_true')
+parser.add_argument('--profile',
+                    action='store_true')
+parser.add_argument('--profile-cprofile',
+                    action='store_true')  # Implies --profile
+parser.add_argument('--profile-memory',
+                    action='store_true')  # Implies --profile
+parser.add_argument('--profile-dir',
+                    default=profiler.OUTDIR)
+parser.add_argument('--script',
+                    default=None)  # File of commands to run in place of the command loop, or - for standard input
+parser.add_argument('--outdir',
+                    default='script_output')
+parser.add_argument('-j', '--jobs',
+                    type=int,
+                    default=1)  # No. of script commands run at the same time, or 0 for the no. of CPUs
+cli_args = parser.parse_args()
+
+if cli_args.filename is None:  # If no file was provided
     print("ERROR: No input CSV file provided")
     sys.exit()
 
-data = utils.check_and_load_csv_file(filename)
+if cli_args.script is not None:  # Read the script before loading the file, so that a missing script fails fast
+    script = scriptRunner.read_script(cli_args.script)
+    if script is None:
+        sys.exit(1)
+    if cli_args.jobs < 0:
+        print("ERROR: --jobs must be 0 (for the no. of CPUs) or more")
+        sys.exit(1)
+
+prewarm = commandInterpreter.prewarm()  # Import the SciPy/plotting command modules while the file loads
+
+cache_budget = int(cli_args.cache_budget * 2**20) if cli_args.cache_budget is not None else None
+if cli_args.stream:
+    stream_threshold = -1  # Stream regardless of size
+elif cli_args.stream_threshold is not None:
+    stream_threshold = int(cli_args.stream_threshold * 2**20)
+else:
+    stream_threshold = streaming.STREAM_THRESHOLD
+# An absolute path, as script mode runs each command in its own directory and streamed files are reopened by every command
+data = utils.check_and_load_csv_file(os.path.abspath(cli_args.filename), dtype=dict(cli_args.dtype), usecols=cli_args.usecols,
+                                     use_cache=not cli_args.no_cache, cache_budget=cache_budget,
+                                     lazy=not cli_args.in_memory, stream_threshold=stream_threshold)
 if data.empty:
     sys.exit()
+datasetProfile.get(data)  # Build the profile shared by all commands up front
+if not cli_args.no_result_cache:
+    resultCache.enable(os.path.abspath(cli_args.filename), dict(cli_args.dtype), cli_args.usecols,
+                       budget=int(cli_args.result_cache_budget * 2**20), persist=cli_args.persist_results)
+if cli_args.profile or cli_args.profile_cprofile or cli_args.profile_memory:
+    profiler.enable(cli_args.profile_cprofile, cli_args.profile_memory, cli_args.profile_dir)
+
+# Script mode: run the script's commands, then exit with a non-zero status if any failed
+if cli_args.script is not None:
+    if cli_args.jobs != 1:  # Finish importing before forking workers, or they may inherit a held import lock
+        prewarm.join()
+    failed = scriptRunner.run(script, data, cli_args.outdir, cli_args.jobs)
+    sys.exit(1 if failed else 0)
 
 print("-"*40 + "\n")
 
@@ -0,0 +1,183 @@
+import numpy as np
+
+
+STATS = ['mean', 'count', 'sum', 'std', 'var', 'min', 'max']  # Statistics that can be derived from a Moments object
+ROW_CHUNK = 2**16  # No. of rows compute() reduces into the accumulators at a time, bounding the size of temporary arrays
+
+
+class Moments:
+    """ Accumulators for a set of numerical variables, optionally split into groups, from which the statistics
+    in STATS are derived. Each accumulator is a 2-D array with one row per group and one column per variable.
+
+    Sums are accumulated over values minus a per-variable shift (roughly a typical value of the variable),
+    which stops the variance losing precision for variables whose mean is large compared to their spread.
+    """
+
+    def __init__(self, count, shift, total, sumsq, minimum, maximum):
+        """
+        PARAMETERS:
+            count - no. of non-missing values
+            shift - the per-variable value subtracted before summing, as an array with one entry per variable
+            total - sum of (value - shift)
+            sumsq - sum of (value - shift)^2
+            minimum, maximum - smallest & largest values (+inf & -inf respectively where count is 0)
+        """
+        self.count = count
+        self.shift = shift
+        self.total = total
+        self.sumsq = sumsq
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.shift + self.total / self.count, np.nan)
+
+    def m2(self):
+        """Returns the sum of squared deviations from the mean"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            m2 = self.sumsq - np.square(self.total) / self.count
+        return np.where(self.count > 0, np.maximum(m2, 0), np.nan)
+
+    def var(self):
+        """Returns the sample variance (n-1 denominator), as pandas does"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2() / (self.count - 1), np.nan)
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def sum(self):
+        return self.total + self.shift * self.count
+
+    def min(self):
+        return np.where(self.count > 0, self.minimum, np.nan)
+
+    def max(self):
+        return np.where(self.count > 0, self.maximum, np.nan)
+
+    def stat(self, name):
+        """Returns the statistic with the given name (one of STATS)"""
+        if name == 'count':
+            return self.count
+        return getattr(self, name)()
+
+
+def compute(data, vars, groups=None):
+    """ Computes the Moments of some numerical variables in a single vectorized pass over a 2-D block of their values,
+    reducing ROW_CHUNK rows at a time into the accumulators, so that temporary arrays stay small however many rows there are.
+
+    If a group index is given, the rows are taken in group order and every accumulator is reduced over each group's
+    contiguous run of rows (which may span several chunks). Otherwise, the whole dataset is treated as a single group.
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - list of numerical variables
+        groups - optional datasetProfile.GroupIndex dividing the rows into groups
+    """
+    block = to_block(data, vars, None if groups is None else groups.order)
+    shift = shift_for(block)
+    starts = np.zeros(1, dtype=np.int64) if groups is None else groups.starts
+    sizes = np.array([len(block)]) if groups is None else groups.sizes
+    ends = starts + sizes
+
+    shape = (len(starts), block.shape[1])
+    count = np.zeros(shape, dtype=np.int64)
+    total = np.zeros(shape)
+    sumsq = np.zeros(shape)
+    minimum = np.full(shape, np.inf)
+    maximum = np.full(shape, -np.inf)
+
+    buffer = np.empty((min(ROW_CHUNK, len(block)), block.shape[1]))  # Reused by every chunk for its transformed values
+    for start in range(0, len(block), ROW_CHUNK):
+        rows = block[start:start + ROW_CHUNK]
+        values = buffer[:len(rows)]
+
+        # The (non-empty) groups with rows in this chunk, and the position in the chunk at which each one's rows start
+        overlapping = np.arange(np.searchsorted(ends, start, side='right'), np.searchsorted(starts, start + len(rows)))
+        overlapping = overlapping[sizes[overlapping] > 0]
+        offsets = np.maximum(starts[overlapping] - start, 0)
+
+        missing = np.isnan(rows)
+        count[overlapping] += np.add.reduceat(~missing, offsets, axis=0, dtype=np.int64)
+        np.subtract(rows, shift, out=values)
+        np.copyto(values, 0, where=missing)
+        total[overlapping] += np.add.reduceat(values, offsets, axis=0)
+        np.square(values, out=values)
+        sumsq[overlapping] += np.add.reduceat(values, offsets, axis=0)
+        np.copyto(values, rows)
+        np.copyto(values, np.inf, where=missing)
+        minimum[overlapping] = np.minimum(minimum[overlapping], np.minimum.reduceat(values, offsets, axis=0))
+        np.copyto(values, -np.inf, where=missing)
+        maximum[overlapping] = np.maximum(maximum[overlapping], np.maximum.reduceat(values, offsets, axis=0))
+
+    return Moments(count=count, shift=shift, total=total, sumsq=sumsq, minimum=minimum, maximum=maximum)
+
+
+def to_block(data, vars, rows=None):
+    """ Returns the values of some numerical variables as a 2-D float array, with missing values as NaN
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - list of numerical variables, one per column of the block
+        rows - optional array of the row nos. to take, in order (default: all rows)
+    """
+    block = np.empty((len(data) if rows is None else len(rows), len(vars)))
+    for i, var in enumerate(vars):
+        values = data[var].to_numpy(dtype=np.float64, na_value=np.nan)
+        block[:, i] = values if rows is None else values[rows]
+    return block
+
+
+def shift_for(block):
+    """ Returns the shift subtracted from each column of a block before summing: the median of its first few rows,
+    or 0 for columns without any values there
+    """
+    head = block[:1024]
+    valid = ~np.isnan(head)
+    shift = np.zeros(block.shape[1])
+    if valid.any():
+        cols = valid.any(axis=0)
+        shift[cols] = np.nanmedian(head[:, cols], axis=0)
+    return shift
+
+
+def merge(a, b):
+    """ Combines the Moments of two disjoint sets of datapoints (e.g. two chunks of a file) with the same groups & variables
+    into the Moments of their union, using the parallel form of Welford's algorithm on each group's count, mean and M2
+    (sum of squared deviations from the mean). The result uses the shift of a.
+
+    PARAMETERS:
+        a, b - the Moments to combine
+    """
+    n = a.count + b.count
+    mean_a = np.nan_to_num(a.mean())
+    mean_b = np.nan_to_num(b.mean())
+    delta = mean_b - mean_a
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, mean_a + delta * b.count / n, 0)
+        m2 = np.nan_to_num(a.m2()) + np.nan_to_num(b.m2()) + np.where(n > 0, np.square(delta) * a.count * b.count / n, 0)
+        total = n * (mean - a.shift)
+        sumsq = np.where(n > 0, m2 + np.square(total) / n, 0)
+
+    return Moments(count=n, shift=a.shift, total=total, sumsq=sumsq,
+                   minimum=np.minimum(a.minimum, b.minimum), maximum=np.maximum(a.maximum, b.maximum))
+
+
+def regroup(accumulators, positions, n_groups):
+    """ Returns a copy of some Moments with their groups moved to new positions among n_groups groups.
+    Groups that nothing is moved to are empty.
+
+    PARAMETERS:
+        accumulators - the Moments to regroup
+        positions - array giving the new group no. of each of the current groups
+        n_groups - total no. of groups in the result
+    """
+    identities = {'count': 0, 'total': 0.0, 'sumsq': 0.0, 'minimum': np.inf, 'maximum': -np.inf}
+    regrouped = {}
+    for name, identity in identities.items():
+        values = getattr(accumulators, name)
+        regrouped[name] = np.full((n_groups, values.shape[1]), identity, dtype=values.dtype)
+        regrouped[name][positions] = values
+    return Moments(shift=accumulators.shift, **regrouped)
@@ -0,0 +1,174 @@
+import numpy as np
+
+import moments
+
+
+ROW_BLOCK = 16384  # No. of rows summed at once, bounding the size of temporary arrays (with BLOCK_COLUMNS, to 32 MB each)
+BLOCK_COLUMNS = 256  # No. of explanatory variables compute_blocked() processes at once, bounding the size of the block of their values
+
+
+class CrossProducts:
+    """ Sufficient statistics for the simple linear regressions of a response variable y on each of a set of
+    explanatory variables x. Every statistic is an array with one entry per explanatory variable, computed over
+    the datapoints where neither that x nor y is missing.
+
+    Sums of squares & products are kept centred on the means (rather than as raw sums of x, x^2, xy, ...),
+    which stops them losing precision for variables whose mean is large compared to their spread.
+    Everything the regression parameter & ANOVA tables need is derived from these statistics.
+    """
+
+    def __init__(self, count, mean_x, mean_y, sxx, syy, sxy):
+        """
+        PARAMETERS:
+            count - no. of datapoints where neither x nor y is missing
+            mean_x, mean_y - means of x and y over those datapoints
+            sxx, syy - corrected sums of squares of x and y
+            sxy - corrected sum of products of x and y
+        """
+        self.count = count
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.sxx = sxx
+        self.syy = syy
+        self.sxy = sxy
+
+    def slope(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sxy / self.sxx
+
+    def intercept(self):
+        return self.mean_y - self.slope() * self.mean_x
+
+    def regression_ss(self):
+        """Returns the regression sum of squares"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.square(self.sxy) / self.sxx
+
+    def residual_ss(self):
+        """Returns the residual sum of squares (sum of squared errors)"""
+        return np.maximum(self.syy - self.regression_ss(), 0)
+
+    def residual_df(self):
+        return self.count - 2
+
+    def error_variance(self):
+        """Returns the estimated variance of the errors"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.residual_df() > 0, self.residual_ss() / self.residual_df(), np.nan)
+
+    def slope_se(self):
+        """Returns the standard error of the slope estimate"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.error_variance() / self.sxx)
+
+    def intercept_se(self):
+        """Returns the standard error of the intercept estimate"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.error_variance() * (1 / self.count + np.square(self.mean_x) / self.sxx))
+
+    def r_squared(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.regression_ss() / self.syy
+
+    def f_statistic(self):
+        """Returns the F statistic of the regression's F-test (regression MS / residual MS)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.regression_ss() / self.error_variance()
+
+
+def compute(data, xs, y):
+    """ Computes the CrossProducts of a response variable against some explanatory variables in a single vectorized pass,
+    ROW_BLOCK rows at a time (see compute_block()), so that temporary arrays don't grow with the no. of rows
+
+    PARAMETERS:
+        data - the input dataframe
+        xs - list of explanatory variables
+        y - the response variable
+    """
+    total = None
+    for start in range(0, max(len(data), 1), ROW_BLOCK):  # An empty dataframe still gives (empty) CrossProducts
+        rows = data.iloc[start:start + ROW_BLOCK]
+        part = compute_block(moments.to_block(rows, xs), moments.to_block(rows, [y])[:, 0])
+        total = part if total is None else merge(total, part)
+    return total
+
+
+def compute_block(block, response):
+    """ Computes the CrossProducts of a response variable against some explanatory variables from their values,
+    ROW_BLOCK rows at a time, merging the CrossProducts of each run of rows with merge()
+
+    PARAMETERS:
+        block - 2-D float array of the explanatory variables' values, one column per variable, with missing values as NaN
+        response - float array of the response variable's values, with missing values as NaN
+    """
+    total = None
+    for start in range(0, max(len(block), 1), ROW_BLOCK):
+        part = __cross_products(block[start:start + ROW_BLOCK], response[start:start + ROW_BLOCK])
+        total = part if total is None else merge(total, part)
+    return total
+
+
+def __cross_products(block, response):
+    """ Computes the CrossProducts of a response variable against some explanatory variables from a run of their values.
+
+    Each x is shifted by a typical value before summing (see moments.shift_for()), so that the raw sums can be
+    centred without losing precision. Sums involving y are computed for all x's at once as products with the
+    matrix of (shifted, masked) x values, or with the mask of rows where both x & y are present.
+    """
+    shift_x = moments.shift_for(block)
+    shift_y = moments.shift_for(response[:, None])[0]
+
+    x0 = block - shift_x
+    valid = ~np.isnan(x0) & ~np.isnan(response)[:, None]
+    np.copyto(x0, 0, where=~valid)
+    y0 = np.where(np.isnan(response), 0, response - shift_y)
+
+    count = valid.sum(axis=0)
+    sum_x = x0.sum(axis=0)
+    sum_y = valid.T @ y0
+    sum_xx = np.einsum('ij,ij->j', x0, x0)
+    sum_yy = valid.T @ np.square(y0)
+    sum_xy = x0.T @ y0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(count > 0, sum_x / count, 0)
+        mean_y = np.where(count > 0, sum_y / count, 0)
+    return CrossProducts(count=count, mean_x=shift_x + mean_x, mean_y=shift_y + mean_y,
+                         sxx=np.maximum(sum_xx - count * np.square(mean_x), 0),
+                         syy=np.maximum(sum_yy - count * np.square(mean_y), 0),
+                         sxy=sum_xy - count * mean_x * mean_y)
+
+
+def merge(a, b):
+    """ Combines the CrossProducts of two disjoint sets of datapoints (e.g. two chunks of a file) with the same variables
+    into the CrossProducts of their union, using the parallel form of Welford's algorithm extended to co-moments
+
+    PARAMETERS:
+        a, b - the CrossProducts to combine
+    """
+    n = a.count + b.count
+    dx = b.mean_x - a.mean_x
+    dy = b.mean_y - a.mean_y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(n > 0, a.count * b.count / n, 0)
+        share = np.where(n > 0, b.count / n, 0)
+    return CrossProducts(count=n, mean_x=a.mean_x + dx * share, mean_y=a.mean_y + dy * share,
+                         sxx=a.sxx + b.sxx + np.square(dx) * weight,
+                         syy=a.syy + b.syy + np.square(dy) * weight,
+                         sxy=a.sxy + b.sxy + dx * dy * weight)
+
+
+def compute_blocked(data, xs, y, block_columns=BLOCK_COLUMNS):
+    """ Computes the CrossProducts of a response variable against many explanatory variables (see compute()),
+    block_columns explanatory variables at a time, so that memory use doesn't grow with the no. of explanatory variables
+    (nor, as compute() also takes the rows a run at a time, with the no. of rows)
+
+    PARAMETERS:
+        data - the input dataframe
+        xs - list of explanatory variables
+        y - the response variable
+        block_columns - max. no. of explanatory variables per block
+    """
+    parts = [compute(data, xs[i:i + block_columns], y) for i in range(0, len(xs), block_columns)]
+    return CrossProducts(**{name: np.concatenate([getattr(part, name) for part in parts])
+                            for name in ('count', 'mean_x', 'mean_y', 'sxx', 'syy', 'sxy')})
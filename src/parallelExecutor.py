@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+def cpu_count():
+    """ Returns the no. of CPUs this process may run on, or 1 in a worker process of a ParallelExecutor,
+    as its CPUs are already in use by the other workers
+    """
+    if ParallelExecutor.in_worker():
+        return 1
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class SharedFrame:
+    """ A dataframe with each of its numerical columns copied into a block of shared memory, from which any process
+    can rebuild the dataframe (see attach()) with the numerical columns' values read straight from the blocks, not copied.
+    The remaining columns (e.g. categoricals) are kept as they are, so are copied to each process.
+    The blocks are freed by close(), which must be called once every process is done with them.
+
+    ATTRIBUTES:
+        columns - list of the dataframe's columns, in order
+        blocks - dict of the (block name, dtype) of each numerical column
+        others - dict of the values of each remaining column
+        index - the dataframe's index
+    """
+
+    def __init__(self, data):
+        """
+        PARAMETERS:
+            data - the dataframe to share
+        """
+        self.columns = list(data.columns)
+        self.blocks = {}
+        self.others = {}
+        self.index = data.index
+        self.__owned = []
+        self.__attached = []
+        for col in self.columns:
+            values = data[col]
+            if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+                array = values.to_numpy()
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+                self.__owned.append(block)
+                self.blocks[col] = (block.name, array.dtype.str)
+            else:
+                self.others[col] = values
+
+    def attach(self):
+        """ Returns the dataframe, with its numerical columns backed by (read-only views of) the shared memory blocks.
+        The blocks are kept open for as long as this SharedFrame is.
+        """
+        columns = {}
+        for col in self.columns:
+            if col in self.blocks:
+                name, dtype = self.blocks[col]
+                block = shared_memory.SharedMemory(name=name)
+                self.__attached.append(block)
+                array = np.ndarray(len(self.index), np.dtype(dtype), buffer=block.buf)
+                array.flags.writeable = False  # Shared by every process, so never to be modified in place
+                columns[col] = array
+            else:
+                columns[col] = self.others[col].array
+        return pd.DataFrame(columns, index=self.index, copy=False)
+
+    def nbytes(self):
+        """Returns the total size of the shared memory blocks in bytes"""
+        return sum(block.size for block in self.__owned)
+
+    def close(self):
+        """Frees the shared memory blocks"""
+        for block in self.__owned:
+            block.close()
+            block.unlink()
+        self.__owned = []
+
+
+class ParallelExecutor:
+    """ Runs tasks on a dataset in a pool of worker processes, each of which sees the same dataset without copying it:
+    a dataframe's numerical columns are placed in shared memory once (see SharedFrame), and each worker attaches to them
+    when it starts. Column stores are memory-mapped from disk, and streamed datasets reopen their file, so these are just
+    inherited by the workers. Workers are forked, so if processes can't be forked (or jobs is 1), tasks run in this process.
+    Use as a context manager, so that the pool and shared memory are released when done.
+    """
+
+    __worker_data = None  # The dataset, as seen by a worker process (see __init_worker())
+    __worker_shared = None  # The SharedFrame a worker process is attached to, kept so its blocks stay open
+    __is_worker = False
+
+    def __init__(self, data, jobs=None):
+        """
+        PARAMETERS:
+            data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
+            jobs - no. of worker processes (default: no. of CPUs available, see cpu_count())
+        """
+        self.data = data
+        self.jobs = jobs or cpu_count()
+        self.__shared = None
+        self.__pool = None
+        if self.jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            if isinstance(data, pd.DataFrame):
+                self.__shared = SharedFrame(data)
+            self.__pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context('fork'),
+                                              initializer=ParallelExecutor.__init_worker, initargs=(self.__shared or data,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def map(self, function, tasks):
+        """ Calls function(data, *task) for each task, returning an iterator of the results in the order of the tasks
+        (even though they may finish in any order). function, the tasks and the results must be picklable.
+
+        PARAMETERS:
+            function - a module-level function taking the dataset, then the arguments of a task
+            tasks - list of tuples of the arguments of each task
+        """
+        if self.__pool is None:
+            return (function(self.data, *task) for task in tasks)
+        futures = [self.__pool.submit(ParallelExecutor.run_in_worker, function, task) for task in tasks]
+        return (future.result() for future in futures)
+
+    def close(self):
+        """Shuts the worker processes down, then frees the shared memory"""
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+        if self.__shared is not None:
+            self.__shared.close()
+            self.__shared = None
+
+    @staticmethod
+    def in_worker():
+        """Returns True in a worker process of a ParallelExecutor"""
+        return ParallelExecutor.__is_worker
+
+    @staticmethod
+    def __init_worker(data):
+        """Sets up a worker process: attaches to the dataset's shared memory, if it has any"""
+        ParallelExecutor.__is_worker = True
+        if isinstance(data, SharedFrame):
+            ParallelExecutor.__worker_shared = data
+            data = data.attach()
+        ParallelExecutor.__worker_data = data
+
+    @staticmethod
+    def run_in_worker(function, task):
+        """Runs a task in a worker process on its dataset. Submitted to the pool by map(), which pickles it by name"""
+        return function(ParallelExecutor.__worker_data, *task)
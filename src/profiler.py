@@ -0,0 +1,242 @@
+import argparse
+import cProfile
+import contextlib
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+import parallelExecutor
+import render
+
+
+OUTDIR = 'profile_output'  # Default directory the traces of profiled commands are saved to
+PACKAGES = ['argparse', 'pandas', 'numpy', 'scipy', 'matplotlib']  # Libraries that cProfile time is broken down by
+TOP_FUNCTIONS = 5  # No. of functions listed in the breakdown, by time spent in the function itself
+TOP_ALLOCATIONS = 3  # No. of source lines listed in the breakdown, by memory they allocated
+
+__settings = None  # While profiling, dict of whether to capture with cProfile/tracemalloc and where to save traces
+__thread = None  # Id of the thread commands run on. Stages are only timed on it (plots are timed by their render job)
+__stack = []  # [name, start time, seconds spent in nested stages] of each stage being timed, innermost last
+__stages = {}  # Seconds spent in each stage of the command being profiled, excluding nested stages
+__count = 0  # No. of commands profiled this session, numbering their traces
+
+
+def enable(cprofile=False, memory=False, outdir=OUTDIR):
+    """ Starts profiling every command (see run())
+
+    PARAMETERS:
+        cprofile - whether to also profile commands with cProfile, which breaks their time down by library & function
+        memory - whether to also trace memory allocations with tracemalloc, for the peak memory used & where it was allocated
+        outdir - name of the directory to save each command's traces to. It is created if it doesn't exist
+    """
+    global __settings
+    __settings = {'cprofile': cprofile, 'memory': memory, 'outdir': os.path.abspath(outdir)}
+    os.makedirs(__settings['outdir'], exist_ok=True)
+    render.profile_jobs(cprofile)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stops profiling commands"""
+    global __settings
+    if __settings is not None and __settings['memory']:
+        tracemalloc.stop()
+    __settings = None
+    render.profile_jobs(False)
+
+
+def enabled():
+    """Returns True if commands are being profiled"""
+    return __settings is not None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """ Times a stage of the command being profiled (e.g. building a group index). Time spent in stages nested
+    within it is counted towards those stages instead. Does nothing if no command is being profiled, or on another thread.
+
+    PARAMETERS:
+        name - name of the stage
+    """
+    if not __stack or threading.get_ident() != __thread:
+        yield
+        return
+    __stack.append([name, time.perf_counter(), 0.0])
+    try:
+        yield
+    finally:
+        name, start, nested = __stack.pop()
+        seconds = time.perf_counter() - start
+        __stages[name] = __stages.get(name, 0.0) + seconds - nested
+        __stack[-1][2] += seconds
+
+
+def run(command, function):
+    """ Runs a command, timing its stages (see stage()), and capturing it with cProfile and/or tracemalloc if enabled.
+    Time spent in no other stage is counted as 'compute'. The command's plots are waited for, so that the time spent
+    drawing ('plot') and saving ('savefig') them in the background is included, apart from the command's own time.
+    Then prints a compact breakdown, and saves the trace as JSON (and the cProfile stats as a .pstats file, which can be
+    loaded with pstats.Stats) to the output directory.
+
+    PARAMETERS:
+        command - the command string
+        function - function running the command
+    """
+    global __thread, __count
+    __count += 1
+    name = f"{__count:03d}_{command.split()[0]}"
+    if parallelExecutor.ParallelExecutor.in_worker():  # Workers number their commands separately
+        name += f"_{os.getpid()}"
+    first_job = len(render.jobs())
+    profile = cProfile.Profile() if __settings['cprofile'] else None
+    memory = __settings['memory']
+    if memory:
+        tracemalloc.reset_peak()
+        before = __snapshot()
+
+    __thread = threading.get_ident()
+    __stages.clear()
+    __stack.append(['compute', time.perf_counter(), 0.0])
+    try:
+        if profile is not None:
+            profile.enable()
+        function()
+    finally:
+        if profile is not None:
+            profile.disable()
+        _, start, nested = __stack.pop()
+        seconds = time.perf_counter() - start
+        __stages['compute'] = seconds - nested
+
+    trace = {'command': command, 'time': time.time(), 'seconds': round(seconds, 6), 'render_seconds': 0.0,
+             'stages': {}, 'jobs': []}
+    if memory:
+        trace['memory'] = __memory_trace(before)
+
+    jobs = render.jobs()[first_job:]
+    if jobs:
+        render.wait()
+    for job in jobs:
+        trace['jobs'].append({'job': job.id, 'file': job.outfile, 'status': job.status, 'stages': job.stages})
+        for stage_name, stage_seconds in job.stages.items():
+            __stages[stage_name] = __stages.get(stage_name, 0.0) + stage_seconds
+            trace['render_seconds'] = round(trace['render_seconds'] + stage_seconds, 6)
+    trace['stages'] = {stage_name: round(seconds, 6) for stage_name, seconds in __stages.items()}
+
+    files = [f"{name}.json"]
+    if profile is not None:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        for job in jobs:
+            if job.profile is not None:
+                stats.add(job.profile)
+        trace['packages'], trace['functions'] = __cprofile_trace(stats)
+        stats.dump_stats(os.path.join(__settings['outdir'], f"{name}.pstats"))
+        files.append(f"{name}.pstats")
+    with open(os.path.join(__settings['outdir'], files[0]), 'w') as file:
+        json.dump(trace, file, indent=2)
+
+    __print_breakdown(trace, files)
+
+
+def show_profile(args):
+    """ Turns profiling of commands on or off, or shows whether it's on
+
+    COMMAND WINDOW ARGUMENTS:
+
+        state - 'on' or 'off'. If not given, prints whether profiling is on
+
+        cprofile - if present, also profiles commands with cProfile. Denoted in user command by --cprofile
+
+        memory - if present, also traces memory allocations with tracemalloc. Denoted in user command by --memory
+
+        outdir - directory to save traces to. Default is profile_output. Denoted in user command by -o or --outdir
+
+    FUNCTION PARAMETERS:
+        args - array of command window argument strings obtained by command interpreter module
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('state',
+                        nargs='?',
+                        choices=['on', 'off'])
+    parser.add_argument('--cprofile',
+                        action='store_true')
+    parser.add_argument('--memory',
+                        action='store_true')
+    parser.add_argument('-o', '--outdir',
+                        default=OUTDIR)
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.state == 'on':
+        enable(parsed_args.cprofile, parsed_args.memory, parsed_args.outdir)
+    elif parsed_args.state == 'off':
+        disable()
+    if __settings is None:
+        print("Profiling is off")
+    else:
+        captures = [capture for capture in ['cprofile', 'memory'] if __settings[capture]]
+        print(f"Profiling is on{' (with ' + ' & '.join(captures) + ')' if captures else ''}. "
+              f"Traces are saved to {__settings['outdir']}")
+    print("\n")
+
+
+def __snapshot():
+    """Returns a tracemalloc snapshot of the memory allocated by everything but tracemalloc itself"""
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def __memory_trace(before):
+    """ Returns a dict of the peak memory allocated (over what was allocated when before was taken) since before was taken,
+    and the source lines that allocated the most since
+    """
+    peak = tracemalloc.get_traced_memory()[1] - sum(stat.size for stat in before.statistics('filename'))
+    growth = __snapshot().compare_to(before, 'lineno')
+    top = sorted(growth, key=lambda stat: stat.size_diff, reverse=True)[:TOP_ALLOCATIONS]
+    return {'peak_bytes': max(peak, 0),
+            'top': [{'line': f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                     'bytes': stat.size_diff} for stat in top if stat.size_diff > 0]}
+
+
+def __cprofile_trace(stats):
+    """ Returns a dict of the seconds spent in each library (see PACKAGES) or elsewhere ('other'), and a list of the
+    functions that the most time was spent in (excluding the functions they called), from cProfile stats
+    """
+    packages = {}
+    functions = []
+    for (filename, line, function), (_, _, own, _, _) in stats.stats.items():
+        package = next((package for package in PACKAGES if package in filename.split(os.sep) or
+                        filename.endswith(f"{package}.py") or (filename == '~' and package in function)), 'other')
+        packages[package] = packages.get(package, 0.0) + own
+        location = function if filename == '~' else f"{os.path.basename(filename)}:{line}({function})"
+        functions.append((own, location))
+    functions = [{'function': location, 'seconds': round(own, 6)} for own, location in sorted(functions, reverse=True)[:TOP_FUNCTIONS]]
+    return {package: round(seconds, 6) for package, seconds in sorted(packages.items(), key=lambda item: -item[1])}, functions
+
+
+def __print_breakdown(trace, files):
+    """Prints a compact breakdown of a command's trace"""
+    rendering = f" (+{trace['render_seconds']:.3f}s rendering)" if trace['jobs'] else ""
+    print(f"PROFILE: {trace['seconds']:.3f}s{rendering} | " +
+          " | ".join(f"{name} {seconds:.3f}s" for name, seconds in trace['stages'].items()))
+    if 'packages' in trace:
+        cpu = sum(trace['packages'].values()) or 1
+        print("  by library: " + ", ".join(f"{package} {seconds / cpu:.0%}" for package, seconds in trace['packages'].items()))
+        print("  top functions: " + ", ".join(f"{function['function']} {function['seconds']:.3f}s" for function in trace['functions']))
+    if 'memory' in trace:
+        print(f"  peak memory: +{trace['memory']['peak_bytes'] / 2**20:.1f} MB | " +
+              ", ".join(f"{site['line']} +{site['bytes'] / 2**20:.1f} MB" for site in trace['memory']['top']))
+    print(f"  traces: {', '.join(os.path.join(__settings['outdir'], file) for file in files)}")
+    print("\n")
+
+
+def print_help():
+    """Prints a help message for this module"""
+    print("usage: profile [on|off] [--cprofile] [--memory] [-o/--outdir]")
+    print("\ton/off        Turn profiling of each command on or off (default: show whether it's on)")
+    print("\t--cprofile    Also profile with cProfile, breaking time down by library and function")
+    print("\t--memory      Also trace memory allocations with tracemalloc")
+    print("\t-o/--outdir   Directory to save each command's traces (JSON and .pstats) to (default: profile_output)")
@@ -1,76 +1,242 @@
 import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from PIL import Image
 from scipy import stats
 
+import datasetProfile
+import moments
+import ols
+import render
+import sketches
+import streaming
 import utils
 
 
+PLOT_POINTS = 10_000  # Max. no. of datapoints scattered on the regression plot. Larger datasets are randomly sampled down to this
+
+
 def analyze(data, args):
     """ For an explanatory var and a response var provided by the user, outputs:
         - A table including sample estimates and confidence intervals of the linear regression intercept and slope parameters
             for the regression fit of those two variables
-        - A seaborn plot including a scatterplot and the fitted regression line
+        - A plot including a scatterplot and the fitted regression line, with a confidence band for the mean response
         - An ANOVA table
+    Both tables and the band are derived from the sufficient statistics of the fit (see ols.CrossProducts), found in
+    a single pass, so in streaming mode the file is read once. The scatterplot shows a uniform random sample of at most
+    PLOT_POINTS datapoints, taken in the same pass, so plotting time doesn't grow with the no. of datapoints.
+    The plot is rendered by the background worker (see render), so the ANOVA table is printed without waiting for it.
 
     COMMAND WINDOW ARGUMENTS:
         x - explanatory variable
         y - response variable
         cl - level of confidence (e.g. 0.99 for a 99% CI) for the confidence intervals of regression parameters and to
-                be used for the prediction interval shown on the regression plot
+                be used for the confidence band shown on the regression plot
                 (alpha and beta). Default is 0.95
         outFile - the name of a png file to be created (if it does not exist already) and to save the plot to.
                     In the user's command, this is denoted by -o or --outfile.
                     Set to 'output.png' file by default.
 
     FUNCTION PARAMETERS:
-        data - the input dataframe
+        data - the input dataframe (or streaming.StreamingDataset)
         args - array of command window argument strings obtained by command interpreter module
     """
 
-    # Deriving argument values from args array using argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('x', choices=utils.get_numericals(data))  # Explanatory var
-    parser.add_argument('y', choices=utils.get_numericals(data))  # Response var
-    parser.add_argument('cl',
-                        nargs='?',
-                        default=0.95,
-                        type=float)
-    parser.add_argument('-o', '--outfile',
-                        nargs='?',
-                        default='output.png')
-    parsed_args = parser.parse_args(args)
+    parsed_args = parser(data).parse_args(args)
 
     # Check if specified output file is a png
     if utils.check_valid_png(parsed_args.outfile) == -1:
         return
 
-    parameter_stats = __get_model_param_stats(data, parsed_args.x, parsed_args.y, parsed_args.cl)
+    # Every statistic in both tables is derived from the one set of cross products, found in a single pass over the data
+    if isinstance(data, streaming.StreamingDataset):
+        products, sample = streaming.accumulate_cross_products(data, [parsed_args.x], parsed_args.y, PLOT_POINTS)
+    else:
+        data = utils.select_columns(data, [parsed_args.x, parsed_args.y])
+        points = moments.to_block(data, [parsed_args.x, parsed_args.y])  # Built once, for both the fit and the plot's sample
+        products = ols.compute_block(points[:, :1], points[:, 1])
+        sample = sketches.RowSample(PLOT_POINTS, seed=0).update(points[~np.isnan(points).any(axis=1)])
+
+    if products.count[0] < 3:
+        print("ERROR: At least 3 datapoints where neither variable is missing are needed for a regression")
+        return
+
+    parameter_stats = __get_model_param_stats(products, parsed_args.cl)
     print("PARAMETERS:")
     print(parameter_stats)
     print("\n")
 
-    # Create and show regression plot
-    fig = plt.figure()
-    plot = sns.regplot(data=data, x=parsed_args.x, y=parsed_args.y, ci=parsed_args.cl*100)
-    plot.set_title(f"REGRESSION: {parsed_args.y} AGAINST {parsed_args.x}")
-    fig.add_axes(plot)
-    fig.savefig(parsed_args.outfile)
-    img = Image.open(parsed_args.outfile)
-    img.show()
+    # Render regression plot in the background
+    render.submit(' '.join(['reg'] + args), parsed_args.outfile, __plot,
+                  products, sample, parsed_args.x, parsed_args.y, parsed_args.cl)
 
     # ANOVA
     print("ANOVA:")
-    anova_table = __anova(data, parsed_args.x, parsed_args.y)
+    anova_table = __anova(products)
     print(anova_table)
 
     print("\n")
 
 
-def __get_model_param_stats(data, exp_var, resp_var, cl):
+def parser(data):
+    """Returns the argparse parser of the reg command's arguments (see analyze()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('x', choices=profile.numericals)  # Explanatory var
+    parser.add_argument('y', choices=profile.numericals)  # Response var
+    parser.add_argument('cl',
+                        nargs='?',
+                        default=0.95,
+                        type=float)
+    parser.add_argument('-o', '--outfile',
+                        nargs='?',
+                        default='output.png')
+    return parser
+
+
+def batch(data, args):
+    """ For a response var and a set of explanatory vars provided by the user, fits the simple linear regression of the
+    response on each explanatory var and outputs a single table with, for each explanatory var:
+        - The no. of datapoints used (those where neither var is missing)
+        - Sample estimates of the intercept and slope, and confidence intervals for both
+        - R^2, and the FR statistic & p-value of the F-test of the regression
+    All regressions are derived from one vectorized pass over the data (see ols.compute_blocked()), and no plots are made,
+    so hundreds of candidate explanatory vars can be screened at once.
+
+    COMMAND WINDOW ARGUMENTS:
+        y - response variable
+        xs - list of explanatory variables. In the user's command, this is denoted by -x or --xs.
+                By default, this will be all numerical variables in the dataset other than y.
+        cl - level of confidence (e.g. 0.99 for a 99% CI) for the confidence intervals of the intercepts & slopes. Default is 0.95
+        sort - what to sort the table by: 'p' (ascending p-value, the default) or 'r2' (descending R^2).
+                Denoted in user command by -s or --sort.
+        top - optional no. of rows of the sorted table to show. Denoted in user command by -n or --top.
+
+    FUNCTION PARAMETERS:
+        data - the input dataframe (or streaming.StreamingDataset)
+        args - array of command window argument strings obtained by command interpreter module
+    """
+
+    profile = datasetProfile.get(data)
+    parsed_args = batch_parser(data).parse_args(args)
+
+    xs = parsed_args.xs if parsed_args.xs else [var for var in profile.numericals if var != parsed_args.y]
+    xs = list(dict.fromkeys(xs))
+    if not xs:
+        print("ERROR: No explanatory variables to regress on")
+        return
+
+    if isinstance(data, streaming.StreamingDataset):
+        products, _ = streaming.accumulate_cross_products(data, xs, parsed_args.y)
+    else:
+        data = utils.select_columns(data, xs + [parsed_args.y])
+        products = ols.compute_blocked(data, xs, parsed_args.y)
+
+    table = __screen(products, xs, parsed_args.cl)
+    if parsed_args.sort == 'p':
+        table = table.sort_values('p', kind='stable')
+    else:
+        table = table.sort_values('R2', ascending=False, kind='stable')
+    if parsed_args.top is not None:
+        table = table.head(parsed_args.top)
+
+    print(f"REGRESSIONS OF {parsed_args.y}:")
+    print(table)
+    print("\n")
+
+
+def batch_parser(data):
+    """Returns the argparse parser of the reg batch command's arguments (see batch()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('y', choices=profile.numericals)  # Response var
+    parser.add_argument('-x', '--xs',
+                        nargs='*',
+                        choices=profile.numericals)
+    parser.add_argument('cl',
+                        nargs='?',
+                        default=0.95,
+                        type=float)
+    parser.add_argument('-s', '--sort',
+                        default='p',
+                        choices=['p', 'r2'])
+    parser.add_argument('-n', '--top',
+                        type=int)
+    return parser
+
+
+def __screen(products, xs, cl):
+    """ Return a dataframe of the parameter estimates & fit statistics of the regressions of a response var on each
+    of a set of explanatory vars, with one row per explanatory var. Regressions with fewer than 3 datapoints are left as NaN.
+
+    PARAMETERS:
+        products - ols.CrossProducts of the response var against the explanatory vars
+        xs - list of the explanatory vars
+        cl - level of confidence for the confidence intervals of the intercepts & slopes (e.g. 0.99 for a 99% CI).
+    """
+    df = products.residual_df()
+    fitted = df > 0
+    slope = np.where(fitted, products.slope(), np.nan)
+
+    intercept = np.where(fitted, products.intercept(), np.nan)
+
+    t_values = np.full(len(xs), np.nan)
+    t_values[fitted] = stats.t.ppf(1 - (1 - cl) / 2, df=df[fitted])
+    intercept_margin_of_err = t_values * products.intercept_se()
+    slope_margin_of_err = t_values * products.slope_se()
+
+    fr = products.f_statistic()
+    p = np.full(len(xs), np.nan)
+    p[fitted] = stats.f.sf(fr[fitted], 1, df[fitted])
+
+    output = {'n': products.count,
+              'intercept': intercept,
+              f"intercept CI({cl*100}%) lower": intercept - intercept_margin_of_err,
+              f"intercept CI({cl*100}%) upper": intercept + intercept_margin_of_err,
+              'slope': slope,
+              f"slope CI({cl*100}%) lower": slope - slope_margin_of_err,
+              f"slope CI({cl*100}%) upper": slope + slope_margin_of_err,
+              'R2': np.where(fitted, products.r_squared(), np.nan),
+              'FR': np.where(fitted, fr, np.nan),
+              'p': p}
+    return pd.DataFrame(data=output, index=pd.Index(xs, name='x'))
+
+
+def __plot(products, sample, exp_var, resp_var, cl):
+    """ Returns a figure with a scatterplot of a sample of the datapoints, the fitted regression line, and a confidence band
+    for the mean response. The band's half-width at x is t * s * sqrt(1/n + (x - xbar)^2 / Sxx), where s^2 is the
+    estimated error variance, so it needs no resampling.
+
+    PARAMETERS:
+        products - ols.CrossProducts of the response var against the explanatory var
+        sample - sketches.RowSample of (x, y) datapoints
+        exp_var - name of explanatory variable (x)
+        resp_var - name of response variable (y)
+        cl - level of confidence for the band (e.g. 0.99 for a 99% band)
+    """
+    n = products.count[0]
+    points = sample.rows
+    fig = render.figure()
+    ax = fig.subplots()
+    # Smaller, more transparent markers for bigger samples, so dense regions still read as dense
+    ax.scatter(points[:, 0], points[:, 1], s=max(4, 20 * min(1, 500 / len(points))), alpha=max(0.2, min(0.8, 500 / len(points))),
+               edgecolors='none', label=f"{len(points)} of {n} datapoints" if len(points) < n else None)
+
+    xs = np.linspace(points[:, 0].min(), points[:, 0].max(), 200)
+    fitted = products.intercept()[0] + products.slope()[0] * xs
+    t_value = stats.t.ppf(1 - (1 - cl) / 2, df=products.residual_df()[0])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margin_of_err = t_value * np.sqrt(products.error_variance()[0] * (1 / n + np.square(xs - products.mean_x[0]) / products.sxx[0]))
+    ax.fill_between(xs, fitted - margin_of_err, fitted + margin_of_err, alpha=0.25, color='C1', label=f"{cl*100}% CI")
+    ax.plot(xs, fitted, color='C1')
+
+    ax.set_xlabel(exp_var)
+    ax.set_ylabel(resp_var)
+    ax.set_title(f"REGRESSION: {resp_var} AGAINST {exp_var}")
+    ax.legend()
+    return fig
+
+
+def __get_model_param_stats(products, cl):
     """ Return a dataframe of statistics for the slope(beta) and intercept(alpha) linear regression parameters
 
     For each of these 2 parameters, the dataframe will show:
@@ -78,29 +244,13 @@ def __get_model_param_stats(data, exp_var, resp_var, cl):
         - The lower & upper bound of a confidence interval for the population value of that parameter
 
     PARAMETERS:
-        data - the input dataframe
-        exp_var - name of explanatory variable (x)
-        resp_var - name of response variable (y)
+        products - ols.CrossProducts of the response var against the explanatory var
         cl - level of confidence for confidence interval (e.g. 0.99 for a 99% CI).
     """
-    x = data[exp_var]
-    y = data[resp_var]
-    n = len(data[[exp_var, resp_var]].dropna())  # No. of datapoints where neither exp_var nor resp_var values are missing
-
-    bhat, ahat = np.polyfit(x, y, 1)  # Sample estimates of alpha and beta
-
-    y_pred = ahat + (bhat*x)
-    residuals = np.subtract(y, y_pred)
-    rss = np.sum(np.square(residuals))  # Residual sum of squares / sum of squared errors
-    estimated_error_variance = rss/n-2  # Estimated variance of errors
-
-    sxx = __sum_of_squares(x)
+    ahat, bhat = products.intercept()[0], products.slope()[0]  # Sample estimates of alpha and beta
+    se_alpha, se_beta = products.intercept_se()[0], products.slope_se()[0]  # Standard errors of alpha & beta estimates
 
-    # Standard errors of alpha & beta estimates
-    se_beta = np.sqrt(estimated_error_variance/sxx)
-    se_alpha = np.sqrt(estimated_error_variance * (1/n + (np.mean(x)**2/sxx)))
-
-    t_value = stats.t.ppf(1 - cl / 2, df=n-2)
+    t_value = stats.t.ppf(1 - (1 - cl) / 2, df=products.residual_df()[0])
     alpha_margin_of_err = t_value * se_alpha
     beta_margin_of_err = t_value * se_beta
 
@@ -112,24 +262,9 @@ def __get_model_param_stats(data, exp_var, resp_var, cl):
               f"CI({cl*100}%) upper": [ci_alpha[1], ci_beta[1]]
               }
     return pd.DataFrame(data=output, index=['intercept', 'slope'])
- 
-
-def __sum_of_squares(series):
-    """Calculates the corrected sum of squares of a given series/array"""
-    mean = np.mean(series)
-    squares = np.square(series - mean)
-    return np.sum(squares)
-
-
-def __sum_of_prods(s1, s2):
-    """Calculates the corrected sum of products of 2 given series/arrays"""
-    m1 = np.mean(s1)
-    m2 = np.mean(s2)
-    products = np.multiply(s1-m1, s2-m2)
-    return np.sum(products)
 
 
-def __anova(data, exp_var, resp_var):
+def __anova(products):
     """
     Prints an ANOVA table for the given data
 
@@ -137,33 +272,29 @@ def __anova(data, exp_var, resp_var):
         - degrees of freedom (total, regression, residual)
         - sum of squares (total, regression, residual)
         - mean sum of squares (total, regression, residual)
-        - FR test statistic and resulting p-value of F-test with that statistic
+        - FR test statistic and resulting p-value of F-test with that statistic (on the regression row)
 
     PARAMETERS:
-        data - the input dataframe
-        exp_var - name of explanatory variable (x)
-        resp_var - name of response variable (y)
+        products - ols.CrossProducts of the response var against the explanatory var
     """
-    y = data[resp_var]
-    x = data[exp_var]
-    n = len(data[[exp_var, resp_var]].dropna())  # No. of datapoints where neither exp_var nor resp_var values are missing
+    n = products.count[0]  # No. of datapoints where neither exp_var nor resp_var values are missing
 
-    tss = __sum_of_squares(y)  # TSS = SYY
-    regss = __sum_of_prods(x, y)**2 / __sum_of_squares(x)  # Regression SS
-    rss = tss - regss  # Residual SS / SSE
+    tss = products.syy[0]  # TSS = SYY
+    regss = products.regression_ss()[0]  # Regression SS
+    rss = products.residual_ss()[0]  # Residual SS / SSE
 
-    tms = tss / n-1
+    tms = tss / (n-1)
     regms = regss
-    rms = rss/n-2
+    rms = rss / (n-2)
 
-    fr = regms/rms
+    fr = products.f_statistic()[0]
     p = stats.f.sf(fr, 1, n-2)
 
     output = {'df': [1, n-2, n-1],
               'SS': [regss, rss, tss],
               'MS': [regms, rms, tms],
-              'FR': [fr],
-              'p': [p]}
+              'FR': [fr, np.nan, np.nan],
+              'p': [p, np.nan, np.nan]}
     return pd.DataFrame(data=output, index=['regression', 'residual', 'total'])
 
 
@@ -175,3 +306,10 @@ def print_help():
     print("\tcl              Level of confidence for intervals (e.g. 0.99 for a 99% CI). Default is 0.95")
     print("\t-o/--outfile    Name of .png file to save outputted plot image to, if so desired")
     print("\n")
+    print("usage: reg batch [y] [cl] [-x/--xs] [-s/--sort] [-n/--top]")
+    print("\ty               Response variable")
+    print("\t-x/--xs         List of explanatory variables to regress y on, one at a time (default: all other numerical vars)")
+    print("\tcl              Level of confidence for intercept & slope intervals (e.g. 0.99 for a 99% CI). Default is 0.95")
+    print("\t-s/--sort       Sort the table by p-value ('p', default) or by R^2 ('r2')")
+    print("\t-n/--top        No. of rows of the sorted table to show (default: all)")
+    print("\n")
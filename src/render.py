@@ -0,0 +1,326 @@
+import argparse
+import atexit
+import cProfile
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import parallelExecutor
+
+
+POOL_SIZE = 4  # Max. no. of idle figures kept for reuse by later plots
+
+
+class Job:
+    """ A plot being rendered to a file by the background worker.
+
+    ATTRIBUTES:
+        id - no. of the job, counting from 1 in order of submission
+        description - short description of the plot (e.g. the command that requested it)
+        outfile - name of the file the plot is saved to
+        status - 'queued', 'running', 'done' or 'failed'
+        files - list of the files the job saved, once it's done: outfile, plus the pages of a plot made of several
+        error - message of the exception that the job failed with, if it did
+        started, finished - times (from time.perf_counter()) at which rendering started & finished, if it has
+        stages - dict of the seconds spent drawing the plot ('plot') and saving it ('savefig'), once it's finished
+        profile - cProfile.Profile of the rendering, if it was profiled (see profile_jobs())
+    """
+
+    def __init__(self, id, description, outfile, plot, args):
+        self.id = id
+        self.description = description
+        self.outfile = outfile
+        self.status = 'queued'
+        self.files = []
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.stages = {}
+        self.profile = None
+        self.__plot = plot
+        self.__args = args
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+
+    def run(self, pool, profile=False):
+        """ Builds the job's figure, saves it with the Agg backend, then clears it and returns it to the figure pool.
+        Jobs whose plot function saves its own output (see submit_pages()) return the list of files saved instead of a figure.
+
+        PARAMETERS:
+            pool - the FigurePool the figure was taken from
+            profile - whether to profile the rendering with cProfile
+        """
+        self.status = 'running'
+        self.started = time.perf_counter()
+        self.profile = cProfile.Profile() if profile else None
+        fig = None
+        try:
+            if self.profile is not None:
+                self.profile.enable()
+            result = self.__plot(*self.__args)
+            self.stages['plot'] = time.perf_counter() - self.started
+            if isinstance(result, list):
+                self.files = result
+            elif result is not None:
+                fig = result
+                fig.savefig(self.outfile)
+                self.stages['savefig'] = time.perf_counter() - self.started - self.stages['plot']
+                self.files = [self.outfile]
+            self.status = 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            if fig is not None:
+                pool.release(fig)
+            self.__args = ()  # Release the data the plot was drawn from
+            with self.__lock:
+                self.finished = time.perf_counter()
+                callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """ Calls callback(job) once the job has finished (whether done or failed), from the worker thread,
+        or straight away if it already has
+        """
+        with self.__lock:
+            if self.finished is None:
+                self.__callbacks.append(callback)
+                return
+        callback(self)
+
+
+class FigurePool:
+    """ Figures, each with an Agg canvas, that are reused from plot to plot. A figure is taken from the pool by figure(),
+    and given back (cleared of everything drawn on it) once the plot has been saved, so the artists of finished plots are
+    freed as soon as they're saved rather than whenever garbage is next collected, and at most POOL_SIZE idle figures are kept.
+    Only used from the worker thread.
+    """
+
+    def __init__(self, size):
+        """
+        PARAMETERS:
+            size - max. no. of idle figures kept
+        """
+        self.__size = size
+        self.__idle = []
+
+    def acquire(self, figsize=None):
+        """ Returns an empty figure, reusing an idle one if there is any
+
+        PARAMETERS:
+            figsize - optional (width, height) of the figure in inches (default: matplotlib's default size)
+        """
+        import matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figsize = matplotlib.rcParams['figure.figsize'] if figsize is None else figsize
+        if self.__idle:
+            fig = self.__idle.pop()
+            fig.set_size_inches(figsize)
+        else:
+            fig = Figure(figsize=figsize)
+            FigureCanvasAgg(fig)
+        return fig
+
+    def release(self, fig):
+        """Clears a figure and keeps it for reuse, unless the pool is full (in which case it's dropped)"""
+        fig.clear()
+        if len(self.__idle) < self.__size and fig not in self.__idle:
+            self.__idle.append(fig)
+
+    def __len__(self):
+        return len(self.__idle)
+
+
+__jobs = []  # Every job submitted this session, in order
+__pool = FigurePool(POOL_SIZE)
+__queue = queue.Queue()
+__worker = None
+__lock = threading.Lock()
+__profile = False  # Whether jobs are profiled with cProfile (see profile_jobs())
+
+
+def submit(description, outfile, plot, *args):
+    """ Queues a plot to be rendered in the background worker, and returns its Job without waiting for it.
+    Jobs are rendered one at a time, in order of submission.
+
+    As the worker runs alongside the command loop, plot must draw on a figure from figure() (not pyplot, whose state
+    is global), and must only read its args, which must not be modified after submission.
+
+    PARAMETERS:
+        description - short description of the plot
+        outfile - name of the file to save the plot to (its format is inferred from the extension)
+        plot - function returning the matplotlib Figure to save
+        args - arguments to call plot with
+    """
+    global __worker
+    outfile = os.path.abspath(outfile)  # Fixed now, in case the working directory changes before the job runs (see scriptRunner)
+    with __lock:
+        job = Job(len(__jobs) + 1, description, outfile, plot, args)
+        __jobs.append(job)
+        if __worker is None:
+            __worker = threading.Thread(target=__work, daemon=True)
+            __worker.start()
+            atexit.register(wait)  # However the session ends, queued plots are saved before the worker is stopped
+    __queue.put(job)
+    print(notice(job))
+    print("\n")
+    return job
+
+
+def notice(job):
+    """Returns the message printed when a job is submitted"""
+    return f"Rendering {job.outfile} in the background (job {job.id}). Enter 'jobs' to check its status"
+
+
+def submit_pages(description, index_file, plot, pages, index, jobs=None):
+    """ Queues a plot made of several pages (e.g. a few of many categories per page) to be rendered in the background,
+    and returns its Job without waiting for it. The worker renders the pages, one file each, in a pool of processes,
+    then writes a JSON index of them.
+
+    As pages are rendered in forked processes, plot and its args must be picklable, and should be no bigger than
+    a page needs, as they're copied to the process rendering the page.
+
+    PARAMETERS:
+        description - short description of the plot
+        index_file - name of the .json file to write the index to
+        plot - function returning the matplotlib Figure of a page, drawn on a figure from figure()
+        pages - list holding a tuple for each page of the name of the file to save it to, the arguments to call plot with,
+                and a dict of information about the page for its entry in the index
+        index - dict of information about the whole plot for the index
+        jobs - max. no. of worker processes (default: no. of CPUs available)
+    """
+    pages = [(os.path.abspath(outfile), args, info) for outfile, args, info in pages]
+    return submit(description, index_file, __render_pages, os.path.abspath(index_file), plot, pages, index, jobs)
+
+
+def figure(figsize=None):
+    """ Returns an empty figure from the figure pool for a plot function to draw on. Must only be called by plot functions
+    run by the worker (see submit()), which saves the figure once the function returns it, then gives it back to the pool.
+
+    PARAMETERS:
+        figsize - optional (width, height) of the figure in inches (default: matplotlib's default size)
+    """
+    return __pool.acquire(figsize)
+
+
+def profile_jobs(enabled):
+    """Sets whether jobs rendered from now on are profiled with cProfile (see Job.profile)"""
+    global __profile
+    __profile = enabled
+
+
+def wait():
+    """Waits until every submitted job has finished rendering"""
+    __queue.join()
+
+
+def jobs():
+    """Returns a list of every job submitted this session, in order"""
+    return list(__jobs)
+
+
+def jobs_table():
+    """Returns a dataframe with the description, output file, status, render time in seconds and error of every job, indexed by job no."""
+    rows = []
+    for job in jobs():
+        seconds = job.finished - job.started if job.finished is not None else None
+        rows.append([job.id, job.description, job.outfile, job.status, seconds, job.error or ''])
+    table = pd.DataFrame(rows, columns=['job', 'description', 'outfile', 'status', 'seconds', 'error'])
+    return table.set_index('job').round({'seconds': 3})
+
+
+def show_jobs(args):
+    """ Prints the status of every render job submitted this session
+
+    COMMAND WINDOW ARGUMENTS:
+
+        -w/--wait - if present, waits for all jobs to finish before printing
+
+    FUNCTION PARAMETERS:
+        args - array of command window argument strings obtained by command interpreter module
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--wait',
+                        action='store_true')
+    parsed_args = parser.parse_args(args)
+    if parsed_args.wait:
+        wait()
+    if not __jobs:
+        print("No plots have been rendered")
+    else:
+        print(jobs_table().to_string())  # In full, as errors are long
+    print("\n")
+
+
+def __render_pages(index_file, plot, pages, index, jobs):
+    """ Saves each page of a plot, in a pool of forked processes (or in this thread if there is only 1 page or CPU, or
+    processes can't be forked), then writes the index listing each page's file and information (see submit_pages()).
+    Returns the list of files saved: the index, then the pages
+    """
+    jobs = min(jobs or parallelExecutor.cpu_count(), len(pages))
+    if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for outfile, args, _ in pages:
+            __render_page(outfile, plot, args)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = [pool.submit(__render_page, outfile, plot, args) for outfile, args, _ in pages]
+            for future in futures:
+                future.result()
+
+    with open(index_file, 'w') as file:
+        directory = os.path.dirname(index_file)  # Pages are listed relative to the index, so they can be moved together
+        json.dump({**index, 'pages': [{'file': os.path.relpath(outfile, directory), **info} for outfile, _, info in pages]},
+                  file, indent=2)
+    return [index_file] + [outfile for outfile, _, _ in pages]
+
+
+def __render_page(outfile, plot, args):
+    """Saves the figure returned by plot(*args) to a file, then returns the figure to the pool"""
+    fig = plot(*args)
+    try:
+        fig.savefig(outfile)
+    finally:
+        __pool.release(fig)
+
+
+def __work():
+    """Runs queued jobs, one at a time, for the rest of the session"""
+    while True:
+        job = __queue.get()
+        try:
+            job.run(__pool, __profile)
+        finally:
+            __queue.task_done()
+
+
+def __after_fork():
+    """ Starts a forked process (e.g. a worker of a ParallelExecutor) with no jobs. The parent's worker thread isn't
+    copied into the child, so the child starts its own when it first submits a job
+    """
+    global __jobs, __queue, __worker, __lock
+    __jobs = []
+    __queue = queue.Queue()
+    __worker = None
+    __lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=__after_fork)
+
+
+def print_help():
+    """Prints a help message for this module"""
+    print("usage: jobs [-w/--wait]")
+    print("\t-w/--wait     Wait for all plots to finish rendering before listing them")
+    print("\n")
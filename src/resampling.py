@@ -0,0 +1,164 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import moments
+import sketches
+from parallelExecutor import cpu_count
+
+
+RESAMPLES = 2000  # Default no. of bootstrap resamples/permutations
+TASK_RESAMPLES = 250  # No. of resamples per task. Tasks, not workers, are seeded, so results don't depend on the no. of workers
+BATCH_BYTES = 64 * 2**20  # Max. bytes of the index matrix (and the matching resampled values) drawn at once within a task
+SERIAL_WORK = 2_000_000  # Below this many resampled values in total, resampling runs in this process rather than a pool
+
+__series = []  # Arrays being resampled by the current call. Inherited by forked workers, so they are never pickled
+
+
+def is_stat(stat):
+    """Returns True if a stat can be computed on resamples: any of the summary stats (see summaryStats)"""
+    return stat in moments.STATS or sketches.is_sketch_stat(stat)
+
+
+def evaluate(stat, samples):
+    """ Computes a stat of each row of a 2-D array of samples (with no missing values), returning a 1-D array
+
+    PARAMETERS:
+        stat - name of a summary stat (see is_stat())
+        samples - 2-D array with one sample per row
+    """
+    match stat:
+        case 'mean':
+            return samples.mean(axis=1)
+        case 'count':
+            return np.full(len(samples), samples.shape[1], dtype=np.float64)
+        case 'sum':
+            return samples.sum(axis=1)
+        case 'std':
+            return samples.std(axis=1, ddof=1) if samples.shape[1] > 1 else np.full(len(samples), np.nan)
+        case 'var':
+            return samples.var(axis=1, ddof=1) if samples.shape[1] > 1 else np.full(len(samples), np.nan)
+        case 'min':
+            return samples.min(axis=1)
+        case 'max':
+            return samples.max(axis=1)
+        case 'median':
+            return np.median(samples, axis=1)
+        case 'mode':
+            return __row_modes(samples)
+        case 'iqr':
+            q1, q3 = np.quantile(samples, [0.25, 0.75], axis=1)
+            return q3 - q1
+        case _:
+            return np.quantile(samples, sketches.percentile(stat), axis=1)
+
+
+def bootstrap(series, stat, resamples=RESAMPLES, seed=0, jobs=None):
+    """ Draws bootstrap resamples of each of some arrays of values, and computes a stat of every resample.
+    Returns a 2-D array with one row per array and one column per resample (NaN for empty arrays).
+
+    PARAMETERS:
+        series - list of 1-D arrays of values, with no missing values (e.g. a variable's values in each group)
+        stat - name of the stat to compute (see is_stat())
+        resamples - no. of resamples of each array
+        seed - seed from which the random generator of every task is derived
+        jobs - max. no. of worker processes (default: no. of CPUs available, see cpu_count())
+    """
+    return __run(series, stat, resamples, seed, jobs, split=None)
+
+
+def permutation(series, split, stat, resamples=RESAMPLES, seed=0, jobs=None):
+    """ Randomly permutes each of some arrays of values, and computes the difference between the stat of the first split
+    values and the stat of the remaining values of every permutation, as for a 2-sample permutation test.
+    Returns a 2-D array with one row per array and one column per permutation.
+
+    PARAMETERS:
+        series - list of 1-D arrays of values, with no missing values (e.g. the pooled values of 2 groups)
+        split - list giving, for each array, the no. of values in the first sample (the remaining values form the second)
+        stat - name of the stat to compute (see is_stat())
+        resamples - no. of permutations of each array
+        seed - seed from which the random generator of every task is derived
+        jobs - max. no. of worker processes (default: no. of CPUs available, see cpu_count())
+    """
+    return __run(series, stat, resamples, seed, jobs, split=split)
+
+
+def difference(values, split, stat):
+    """Returns the stat of the first split values of an array minus the stat of the rest (the observed permutation statistic)"""
+    return evaluate(stat, values[None, :split])[0] - evaluate(stat, values[None, split:])[0]
+
+
+def __run(series, stat, resamples, seed, jobs, split):
+    """ Splits the resamples of every array into tasks of TASK_RESAMPLES, each with its own seed spawned (in a fixed order)
+    from the given seed, then runs the tasks in a process pool, or in this process if the work is small
+    or processes can't be forked. The result is the same either way.
+    """
+    global __series
+    tasks = []
+    for i, values in enumerate(series):
+        if len(values) == 0:
+            continue
+        for start in range(0, resamples, TASK_RESAMPLES):
+            tasks.append((i, start, min(TASK_RESAMPLES, resamples - start)))
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+
+    results = np.full((len(series), resamples), np.nan)
+    jobs = min(jobs or cpu_count(), len(tasks))
+    work = sum(len(series[i]) * count for i, _, count in tasks)
+
+    __series = series
+    try:
+        if jobs <= 1 or work < SERIAL_WORK or 'fork' not in multiprocessing.get_all_start_methods():
+            outputs = [__run_task(i, count, task_seed, stat, None if split is None else split[i])
+                       for (i, _, count), task_seed in zip(tasks, seeds)]
+        else:
+            # Forked workers inherit __series, so only the task descriptions & results cross between processes
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = [pool.submit(__run_task, i, count, task_seed, stat, None if split is None else split[i])
+                           for (i, _, count), task_seed in zip(tasks, seeds)]
+                outputs = [future.result() for future in futures]
+    finally:
+        __series = []
+
+    for (i, start, count), output in zip(tasks, outputs):
+        results[i, start:start + count] = output
+    return results
+
+
+def __run_task(i, count, seed, stat, split):
+    """ Computes the stat of count resamples (or permutations, if split is given) of the ith array being resampled,
+    drawing them in batches whose index matrices take at most BATCH_BYTES
+    """
+    values = __series[i]
+    n = len(values)
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_BYTES // (8 * n))
+    output = np.empty(count)
+    for start in range(0, count, batch):
+        rows = min(batch, count - start)
+        if split is None:
+            samples = values[rng.integers(0, n, size=(rows, n))]
+            output[start:start + rows] = evaluate(stat, samples)
+        else:
+            samples = values[rng.permuted(np.broadcast_to(np.arange(n), (rows, n)), axis=1)]
+            output[start:start + rows] = evaluate(stat, samples[:, :split]) - evaluate(stat, samples[:, split:])
+    return output
+
+
+def __row_modes(samples):
+    """Returns the mode of each row of a 2-D array. Where a row has several, returns the smallest"""
+    rows, n = samples.shape
+    values = np.sort(samples, axis=1).ravel()
+    new_run = np.ones(values.shape, dtype=bool)
+    new_run[1:] = values[1:] != values[:-1]
+    new_run[::n] = True  # Every row starts a new run
+
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, len(values)))
+    first_run = np.searchsorted(starts, np.arange(rows) * n)  # Index of the first run of each row
+    longest = np.maximum.reduceat(lengths, first_run)
+
+    # Runs are in ascending order within each row, so the first of the longest runs holds the smallest mode
+    candidates = np.where(lengths == np.repeat(longest, np.diff(np.append(first_run, len(starts)))), np.arange(len(starts)), len(starts))
+    return values[starts[np.minimum.reduceat(candidates, first_run)]]
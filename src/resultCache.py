@@ -0,0 +1,391 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import columnCache
+import columnStore
+import profiler
+import render
+import streaming
+
+
+MEMORY_BUDGET = 64 * 2**20  # Default max. total bytes of the results kept in memory
+DISK_BUDGET = 2**30  # Default max. total bytes of the results kept on disk, if they're persisted
+CACHE_DIR = os.path.join(columnCache.CACHE_DIR, 'results')  # Where persisted results are kept, one subdirectory each
+META_FILE = 'meta.json'
+IGNORED_ARGS = ['jobs']  # Args that don't change a command's results (resamples are seeded per task, see resampling)
+
+
+class Result:
+    """ What a command produced: the text it printed, and the files its plots were saved to.
+
+    ATTRIBUTES:
+        output - the printed text, with the notice of each plot being rendered replaced by one of it being restored
+        files - list of (file name, contents) tuples of the plots' files. Names are relative to the working directory
+                the command ran in, unless its output file was given as an absolute path
+        source - signature of the version of the file the dataset was read from (see columnCache.source_signature())
+        size - no. of bytes the result takes up
+    """
+
+    def __init__(self, output, files, source):
+        self.output = output
+        self.files = files
+        self.source = source
+        self.size = len(output.encode()) + sum(len(contents) for _, contents in files)
+
+    def replay(self):
+        """Saves the plots' files again, then prints the text the command printed"""
+        for name, contents in self.files:
+            try:
+                with open(name, 'wb') as file:
+                    file.write(contents)
+            except OSError as e:
+                print(f"ERROR: Could not save {name}: {e.strerror}")
+                return
+        print(self.output, end='')
+
+
+class ResultCache:
+    """ Results of commands, each stored under a key identifying the command and the dataset it ran on (see key()).
+    The results are kept in memory, least recently used first out once they take up more than the budget, and can also be
+    persisted to disk (in CACHE_DIR), so that they're kept across sessions. Persisted results are evicted the same way
+    once they take up more than the disk budget. Safe to use from the render worker thread.
+    """
+
+    def __init__(self, budget=MEMORY_BUDGET, persist=False, disk_budget=DISK_BUDGET):
+        """
+        PARAMETERS:
+            budget - max. total bytes of the results kept in memory
+            persist - whether to persist results to disk
+            disk_budget - max. total bytes of the results persisted to disk
+        """
+        self.budget = budget
+        self.persist = persist
+        self.disk_budget = disk_budget
+        self.hits = 0
+        self.misses = 0
+        self.__results = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the result stored under a key (from memory, or else disk), or None if there is none"""
+        with self.__lock:
+            result = self.__results.get(key)
+            if result is not None:
+                self.__results.move_to_end(key)
+            elif self.persist:
+                result = self.__read(key)
+                if result is not None:
+                    self.__keep(key, result)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, key, result):
+        """Stores a result under a key"""
+        with self.__lock:
+            self.__keep(key, result)
+            if self.persist:
+                self.__write(key, result)
+                self.__evict(keep=key)
+
+    def invalidate(self, source):
+        """ Drops every result of a file that was computed from a different version of it than the current one,
+        as they can never be used again
+
+        PARAMETERS:
+            source - dict identifying the current version of the file (see columnCache.source_signature())
+        """
+        with self.__lock:
+            for key in [key for key, result in self.__results.items() if self.__is_stale(result.source, source)]:
+                self.__size -= self.__results.pop(key).size
+            if self.persist and os.path.isdir(CACHE_DIR):
+                for name in os.listdir(CACHE_DIR):
+                    meta = self.__read_meta(name)
+                    if meta is not None and self.__is_stale(meta['source'], source):
+                        shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+
+    def clear(self):
+        """Drops every result kept in memory and on disk"""
+        with self.__lock:
+            self.__results.clear()
+            self.__size = 0
+            if self.persist:
+                shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    def __len__(self):
+        return len(self.__results)
+
+    def memory_bytes(self):
+        """Returns the total size of the results kept in memory in bytes"""
+        return self.__size
+
+    def __keep(self, key, result):
+        """Keeps a result in memory, evicting the least recently used ones until the rest are within the budget"""
+        if key in self.__results:
+            self.__size -= self.__results.pop(key).size
+        if result.size > self.budget:
+            return
+        self.__results[key] = result
+        self.__size += result.size
+        while self.__size > self.budget:
+            _, evicted = self.__results.popitem(last=False)
+            self.__size -= evicted.size
+
+    @staticmethod
+    def __is_stale(cached, current):
+        """Returns True if a file signature is of the same file as the current signature, but of another version"""
+        return cached['path'] == current['path'] and cached != current
+
+    @staticmethod
+    def __read_meta(key):
+        """Returns the metadata dict of a persisted result, or None if it doesn't exist or is unreadable"""
+        try:
+            with open(os.path.join(CACHE_DIR, key, META_FILE)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def __read(self, key):
+        """Returns the persisted Result of a key (marking it as used), or None if there isn't a readable one"""
+        meta = self.__read_meta(key)
+        if meta is None:
+            return None
+        try:
+            files = []
+            for i, name in enumerate(meta['files']):
+                with open(os.path.join(CACHE_DIR, key, f"{i}.bin"), 'rb') as file:
+                    files.append((name, file.read()))
+        except OSError:
+            return None
+        meta['last_used'] = time.time()
+        with open(os.path.join(CACHE_DIR, key, META_FILE), 'w') as file:
+            json.dump(meta, file)
+        return Result(meta['output'], files, meta['source'])
+
+    def __write(self, key, result):
+        """ Persists the Result of a key. It's written to a temporary directory first, then renamed, so that other
+        processes (e.g. parallel script workers) never read a partly written result
+        """
+        entry = os.path.join(CACHE_DIR, key)
+        temp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(temp, exist_ok=True)
+            for i, (_, contents) in enumerate(result.files):
+                with open(os.path.join(temp, f"{i}.bin"), 'wb') as file:
+                    file.write(contents)
+            with open(os.path.join(temp, META_FILE), 'w') as file:
+                json.dump({'source': result.source, 'output': result.output, 'files': [name for name, _ in result.files],
+                           'last_used': time.time()}, file)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(temp, entry)
+        except OSError as e:
+            shutil.rmtree(temp, ignore_errors=True)
+            print(f"WARNING: Could not persist result ({e})")
+
+    def __evict(self, keep=None):
+        """Deletes least recently used persisted results until the rest are within the disk budget (see columnCache.evict())"""
+        entries = []
+        for name in os.listdir(CACHE_DIR):
+            meta = self.__read_meta(name)
+            if meta is not None:
+                entries.append((meta['last_used'], columnCache.entry_size(os.path.join(CACHE_DIR, name)), name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):  # Oldest first
+            if total <= self.disk_budget:
+                break
+            if name != keep:
+                shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+                total -= size
+
+
+__cache = None  # The session's ResultCache, if results are being cached
+__source = None  # Signature of the loaded version of the dataset's file, as of enable()
+__overrides = None  # The loading overrides of the dataset (dtype, usecols)
+__live = {}  # Signature of each streamed file, by (path, size, modification time), so it's only hashed again if it changes
+
+
+def enable(filename, dtype=None, usecols=None, budget=MEMORY_BUDGET, persist=False, disk_budget=DISK_BUDGET):
+    """ Starts caching the results of commands run on the dataset loaded from a file (see run()).
+    Results that were persisted for an earlier version of the file are deleted.
+
+    PARAMETERS:
+        filename - name of the csv file the dataset was loaded from
+        dtype, usecols - the loading overrides the dataset was loaded with (see csvLoader.load_csv())
+        budget - max. total bytes of the results kept in memory
+        persist - whether to persist results to disk, so that they're kept across sessions
+        disk_budget - max. total bytes of the results persisted to disk
+    """
+    global __cache, __source, __overrides
+    __cache = ResultCache(budget, persist, disk_budget)
+    __source = columnCache.source_signature(filename)
+    __overrides = [sorted((str(k), str(v)) for k, v in (dtype or {}).items()), sorted(usecols) if usecols is not None else None]
+    __cache.invalidate(__source)
+
+
+def enabled():
+    """Returns True if results are being cached"""
+    return __cache is not None
+
+
+def fingerprint(data):
+    """ Returns a dict identifying the version of the file a dataset was read from. For loaded datasets, that's the
+    version that was loaded. Streamed datasets are read from the file by every command, so that's its current version,
+    and if the file has changed since the last call, results of its earlier versions are dropped.
+
+    PARAMETERS:
+        data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
+    """
+    if isinstance(data, columnStore.ColumnStore):
+        return data.source
+    if not isinstance(data, streaming.StreamingDataset):
+        return __source
+    st = os.stat(data.filename)
+    version = (os.path.abspath(data.filename), st.st_size, st.st_mtime_ns)
+    if version not in __live:
+        __live.clear()
+        __live[version] = columnCache.source_signature(data.filename)
+        __cache.invalidate(__live[version])
+    return __live[version]
+
+
+def key(name, parsed_args, data):
+    """ Returns the key of a command's result: a hash of the dataset's version & loading overrides, whether it's streamed
+    (as streamed commands approximate some stats), the command's name, and its normalized arguments. As arguments are normalized after parsing, defaults are filled in (so 'summary' and
+    'summary -v [every numerical var]' share a key) and either spelling of a flag is the same. Output files are compared
+    by the path given, so a plot command run again from another directory (e.g. in script mode) saves the cached plot
+    to the same place relative to it. Lists keep their order, as it sets the order of the rows/columns of the output.
+
+    PARAMETERS:
+        name - name of the command (e.g. 'ci boot')
+        parsed_args - the command's argparse namespace
+        data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
+    """
+    args = {arg: value for arg, value in vars(parsed_args).items() if arg not in IGNORED_ARGS}
+    if args.get('outfile') is not None:
+        args['outfile'] = os.path.normpath(args['outfile'])
+    identity = [fingerprint(data), __overrides, isinstance(data, streaming.StreamingDataset), name, args]
+    return hashlib.sha1(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+def run(name, parsed_args, data, command):
+    """ Replays the cached result of a command, if there is one, or else runs it and caches its result.
+
+    The command's printed output is cached as soon as it returns, unless it printed an error. If it submitted plots
+    to be rendered (see render), its result is only cached once they have all been saved, along with their files.
+
+    PARAMETERS:
+        name - name of the command (e.g. 'ci boot')
+        parsed_args - the command's argparse namespace
+        data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
+        command - function running the command
+    """
+    with profiler.stage('cache'):
+        result_key = key(name, parsed_args, data)
+        source = fingerprint(data)
+        result = __cache.get(result_key)
+        if result is not None:
+            result.replay()
+            return
+
+    cwd = os.getcwd()
+    output = __Tee(sys.stdout)
+    first_job = len(render.jobs())
+    with contextlib.redirect_stdout(output):
+        command()
+    text = output.getvalue()
+    if any(line.startswith('ERROR') for line in text.splitlines()):
+        return
+
+    jobs = render.jobs()[first_job:]
+    relative = not os.path.isabs(getattr(parsed_args, 'outfile', None) or '')
+
+    def saved_name(filename):
+        """Returns the name a plot file is saved under: relative to the directory the command was run in, if it was given so"""
+        return os.path.relpath(filename, cwd) if relative else filename
+
+    for job in jobs:
+        text = text.replace(render.notice(job), f"Restored {saved_name(job.outfile)} from the result cache")
+    if not jobs:
+        __cache.put(result_key, Result(text, [], source))
+        return
+
+    remaining = [len(jobs)]
+    lock = threading.Lock()
+
+    def finished(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        if all(job.status == 'done' for job in jobs):
+            files = []
+            for filename in [filename for job in jobs for filename in job.files]:
+                with open(filename, 'rb') as file:
+                    files.append((saved_name(filename), file.read()))
+            __cache.put(result_key, Result(text, files, source))
+
+    for job in jobs:
+        job.add_done_callback(finished)
+
+
+def show_cache(args):
+    """ Prints the no. of results cached, their size and how often they were used, or clears the cache
+
+    COMMAND WINDOW ARGUMENTS:
+
+        --clear - if present, drops every cached result, in memory and on disk
+
+    FUNCTION PARAMETERS:
+        args - array of command window argument strings obtained by command interpreter module
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clear',
+                        action='store_true')
+    parsed_args = parser.parse_args(args)
+    if __cache is None:
+        print("ERROR: Results aren't being cached")
+        return
+    if parsed_args.clear:
+        __cache.clear()
+        print("Cleared the result cache")
+    else:
+        print(f"{len(__cache)} results in memory ({__cache.memory_bytes() / 2**20:.1f} of {__cache.budget / 2**20:.1f} MB)")
+        if __cache.persist:
+            size = sum(columnCache.entry_size(os.path.join(CACHE_DIR, name)) for name in os.listdir(CACHE_DIR)) if os.path.isdir(CACHE_DIR) else 0
+            print(f"{size / 2**20:.1f} of {__cache.disk_budget / 2**20:.1f} MB persisted to {CACHE_DIR}")
+        print(f"{__cache.hits} hits, {__cache.misses} misses this session")
+    print("\n")
+
+
+class __Tee(io.StringIO):
+    """Text stream that keeps what's written to it, while passing it on to another stream"""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.__stream = stream
+
+    def write(self, text):
+        self.__stream.write(text)
+        return super().write(text)
+
+    def flush(self):
+        self.__stream.flush()
+
+
+def print_help():
+    """Prints a help message for this module"""
+    print("usage: cache [--clear]")
+    print("\t--clear       Drop every cached result, in memory and on disk")
@@ -0,0 +1,157 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+import commandInterpreter
+import parallelExecutor
+import render
+
+
+def read_script(filename):
+    """ Returns a list of (line no., command) tuples of the commands in a script file, one command per line.
+    Blank lines and comments (lines starting with #) are left out. Prints an error and returns None if the file can't be read.
+
+    PARAMETERS:
+        filename - name of the script file, or '-' to read the script from standard input
+    """
+    try:
+        if filename == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(filename) as file:
+                lines = file.read().splitlines()
+    except OSError as e:
+        print(f"ERROR: Could not read script {filename}: {e.strerror}")
+        return None
+    return [(i, line.strip()) for i, line in enumerate(lines, 1) if line.strip() and not line.strip().startswith('#')]
+
+
+def run(commands, data, outdir, jobs=1):
+    """ Runs the commands of a script on a dataset, without stopping at commands that fail.
+
+    Each command runs in its own subdirectory of outdir (e.g. 003_dist), so that files it saves under relative names
+    (such as plots saved to the default output.png) don't overwrite those of other commands. Everything the command prints
+    is saved to output.txt in that directory. Once every plot has been rendered (see render), a manifest.json listing each
+    command's status, error, time taken, files and render jobs is written to outdir.
+
+    As commands only read the dataset, they're independent of each other, so with jobs > 1 they run at the same time in
+    a pool of worker processes sharing the dataset (see parallelExecutor). Each worker renders its commands' plots itself.
+    Progress is still reported, and the manifest still lists commands, in script order.
+
+    A command fails if it raises an exception, or prints an error (either this tool's 'ERROR: ...' or argparse's usage error).
+    An exit command ends the script early: the commands after it aren't run. Returns the no. of commands that failed.
+
+    PARAMETERS:
+        commands - list of (line no., command) tuples, as returned by read_script()
+        data - the input dataframe (or dataset standing in for one, see columnStore and streaming)
+        outdir - name of the directory to save the output to. It is created if it doesn't exist
+        jobs - no. of commands to run at the same time (0 for the no. of CPUs available)
+    """
+    outdir = os.path.abspath(outdir)
+    os.makedirs(outdir, exist_ok=True)
+    exits = [k for k, (_, command) in enumerate(commands) if command.split()[0] == 'exit']
+    if exits:
+        commands = commands[:exits[0] + 1]
+    digits = max(3, len(str(len(commands))))
+    tasks = [(line_no, command, outdir, f"{k:0{digits}d}_{command.split()[0]}")
+             for k, (line_no, command) in enumerate(commands, 1)]
+    entries = []
+    start = time.perf_counter()
+
+    with parallelExecutor.ParallelExecutor(data, jobs) as executor:
+        for k, entry in enumerate(executor.map(__run_command, tasks), 1):
+            entries.append(entry)
+            error = entry['error']
+            print(f"[{k}/{len(commands)}] {entry['command']}: {'FAILED (' + error + ')' if error else 'ok'} in {entry['seconds']:.3f}s")
+
+    render.wait()
+    jobs = {job.id: job for job in render.jobs()}
+    for entry in entries:
+        entry['jobs'] = [__job_entry(jobs[job], outdir) if isinstance(job, int) else job for job in entry['jobs']]
+        if entry['status'] == 'ok' and any(job['status'] == 'failed' for job in entry['jobs']):
+            entry['status'] = 'failed'
+            entry['error'] = next(job['error'] for job in entry['jobs'] if job['status'] == 'failed')
+        entry['files'] = sorted(os.path.relpath(os.path.join(root, name), outdir)
+                                for root, _, names in os.walk(os.path.join(outdir, entry['directory']))
+                                for name in names)
+
+    failed = sum(entry['status'] == 'failed' for entry in entries)
+    manifest = {
+        'commands': entries,
+        'failed': failed,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+    with open(os.path.join(outdir, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    print(f"Ran {len(entries)} commands ({failed} failed) in {manifest['seconds']:.3f}s. Output saved to {outdir}")
+    return failed
+
+
+def __run_command(data, line_no, command, outdir, directory):
+    """ Runs a command of a script in its own subdirectory of outdir, saving its output there, and returns its manifest
+    entry. Its render jobs are listed by job no., to be looked up once rendered, except in a worker process of a
+    ParallelExecutor, where they're rendered before returning (as the worker's jobs are lost once it's done)
+    """
+    os.makedirs(os.path.join(outdir, directory), exist_ok=True)
+    cwd = os.getcwd()
+    first_job = len(render.jobs())
+    output = io.StringIO()
+    error = None
+
+    start = time.perf_counter()
+    try:
+        os.chdir(os.path.join(outdir, directory))
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            commandInterpreter.interpret(command, data)
+    except SystemExit:  # Only raised by the exit command, as interpret() handles argparse's
+        pass
+    except Exception:
+        error = traceback.format_exc().strip().splitlines()[-1]
+        output.write(traceback.format_exc())
+    finally:
+        os.chdir(cwd)
+    seconds = time.perf_counter() - start
+
+    text = output.getvalue()
+    with open(os.path.join(outdir, directory, 'output.txt'), 'w') as file:
+        file.write(text)
+    if error is None:
+        error = __printed_error(text)
+
+    jobs = [job.id for job in render.jobs()[first_job:]]
+    if parallelExecutor.ParallelExecutor.in_worker():
+        render.wait()
+        jobs = [__job_entry(job, outdir) for job in render.jobs()[first_job:]]
+    return {
+        'line': line_no,
+        'command': command,
+        'directory': directory,
+        'status': 'failed' if error else 'ok',
+        'error': error,
+        'seconds': round(seconds, 4),
+        'jobs': jobs,
+    }
+
+
+def __printed_error(text):
+    """Returns the first error message printed in a command's output (by this tool or argparse), or None if there is none"""
+    for line in text.splitlines():
+        if line.startswith('ERROR'):
+            return line
+        if ': error: ' in line:  # argparse's "prog: error: message"
+            return line.split(': error: ', 1)[1]
+    return None
+
+
+def __job_entry(job, outdir):
+    """Returns the manifest entry of a render job: its output file (relative to outdir), status, time taken and error"""
+    return {
+        'file': os.path.relpath(job.outfile, outdir),
+        'status': job.status,
+        'seconds': round(job.finished - job.started, 4) if job.finished is not None else None,
+        'error': job.error,
+    }
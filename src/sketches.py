@@ -0,0 +1,294 @@
+import math
+
+import numpy as np
+
+
+QUANTILE_K = 1024  # Accuracy parameter of quantile sketches. Rank error shrinks roughly in proportion to 1/QUANTILE_K
+FREQUENCY_K = 1024  # Max. no. of distinct values counted by frequency sketches
+UPDATE_SLICES = 64  # No. of slices of k values taken from the input at a time by the sketches' update()
+CONFIDENCE_Z = 2.576  # z-value of the confidence (99%) at which quantile rank errors are reported
+
+
+class QuantileSketch:
+    """ KLL sketch of the distribution of a numerical variable, from which approximate quantiles can be read.
+
+    Values are kept in levels of sorted buffers, where each value at level h stands for 2^h original values.
+    When a level outgrows its capacity, it is compacted: sorted, and every other value (starting at a random offset)
+    is promoted to the level above. Memory use is therefore bounded (about 3*k values) however many values are added,
+    and two sketches can be merged by concatenating their levels and compacting.
+
+    Each compaction at level h shifts the rank of any value by at most 2^h, up or down with equal probability,
+    so the rank error is tracked as the variance of the sum of these shifts.
+    """
+
+    def __init__(self, k=QUANTILE_K, seed=None):
+        """
+        PARAMETERS:
+            k - capacity of the top level. Larger values give smaller errors and use more memory
+            seed - seed for the random compaction offsets
+        """
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.__compactions = [0]  # No. of compactions at each level
+        self.__rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """ Adds an array of values to the sketch. Missing (NaN) values are ignored.
+        Values are taken a batch at a time, so memory use stays bounded however many values are added at once
+        """
+        values = np.asarray(values, dtype=np.float64)
+        for start in range(0, len(values), self.__width() * UPDATE_SLICES):
+            batch = values[start:start + self.__width() * UPDATE_SLICES]
+            batch = batch[~np.isnan(batch)]
+            self.n += len(batch)
+            self.__ingest(batch, 0)
+        self.__compress()
+        return self
+
+    def merge(self, other):
+        """Adds all the values summarised by another QuantileSketch to this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+            self.__compactions.append(0)
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+            self.__compactions[h] += other.__compactions[h]
+        self.n += other.n
+        self.__compress()
+        return self
+
+    def quantile(self, q):
+        """Returns the approximate q-quantile (0 <= q <= 1) of the values added, or NaN if no values were added"""
+        if self.n == 0:
+            return np.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        i = np.searchsorted(cumulative, q * self.n, side='left')
+        return values[order[min(i, len(order) - 1)]]
+
+    def rank_error(self):
+        """ Returns a bound on the error of the rank of any returned quantile, as a fraction of the no. of values,
+        that holds with 99% confidence. 0 if the sketch is still exact (nothing has been compacted)
+        """
+        if self.n == 0:
+            return 0.0
+        variance = sum(count * 4**h for h, count in enumerate(self.__compactions))
+        return CONFIDENCE_Z * math.sqrt(variance) / self.n
+
+    def __capacity(self, h):
+        """Returns the capacity of level h. Capacities shrink geometrically from k at the top level downwards"""
+        depth = len(self.levels) - 1 - h
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def __width(self):
+        """Returns the no. of values in each slice compacted on the way in (see __ingest()): k, rounded down to an even no."""
+        return max(2, self.k - self.k % 2)
+
+    def __ingest(self, values, h):
+        """ Adds values to level h. Whole slices of k values are compacted straight away (each slice is sorted, and every
+        other value promoted to level h+1, as in __compress()), all slices at once, so that a level never holds more
+        than O(k) values. The values left over join the level's buffer
+        """
+        width = self.__width()
+        full = len(values) - len(values) % width
+        if full:
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.__compactions.append(0)
+            slices = np.sort(values[:full].reshape(-1, width), axis=1)
+            offsets = self.__rng.integers(2, size=len(slices))
+            promoted = slices[np.arange(len(slices))[:, None], offsets[:, None] + np.arange(0, width, 2)]
+            self.__compactions[h] += len(slices)
+            self.__ingest(promoted.ravel(), h + 1)
+        self.levels[h] = np.concatenate((self.levels[h], values[full:]))
+
+    def __compress(self):
+        """Compacts the lowest over-capacity level until every level is within its capacity"""
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) <= self.__capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.__compactions.append(0)
+
+            items = np.sort(self.levels[h])
+            leftover = items[len(items) - len(items) % 2:]  # With an odd no. of items, the largest one stays at this level
+            offset = self.__rng.integers(2)
+            promoted = items[offset:len(items) - len(leftover):2]
+            self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+            self.levels[h] = leftover
+            self.__compactions[h] += 1
+            h = 0  # Adding a level shrinks the capacities of those below it
+
+
+class FrequencySketch:
+    """ Misra-Gries sketch of the most frequent values of a variable, from which an approximate mode can be read.
+
+    At most k distinct values are counted. When there are more, only the values with the k largest counts are kept,
+    and the (k+1)th largest count is subtracted from their counts (as it is from the dropped values' counts).
+    Each count therefore underestimates the true count by at most the total subtracted so far, which is reported
+    as the error. Two sketches are merged by adding their counts and then reducing them the same way.
+    """
+
+    def __init__(self, k=FREQUENCY_K):
+        """
+        PARAMETERS:
+            k - max. no. of distinct values counted
+        """
+        self.k = k
+        self.values = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.error = 0
+
+    def update(self, values):
+        """ Adds an array of values to the sketch. Missing (NaN) values are ignored.
+        Values are counted a batch at a time, so memory use stays bounded however many values are added at once
+        """
+        values = np.asarray(values, dtype=np.float64)
+        for start in range(0, len(values), self.k * UPDATE_SLICES):
+            batch = values[start:start + self.k * UPDATE_SLICES]
+            self.__add(*np.unique(batch[~np.isnan(batch)], return_counts=True))
+        return self
+
+    def merge(self, other):
+        """Adds all the values summarised by another FrequencySketch to this one"""
+        self.error += other.error
+        self.__add(other.values, other.counts)
+        return self
+
+    def mode(self):
+        """Returns the approximate mode of the values added (the smallest, if there's a tie), or NaN if no values were added"""
+        if len(self.counts) == 0:
+            return np.nan
+        return self.values[np.argmax(self.counts)]  # values are sorted, so argmax() picks the smallest of tied values
+
+    def __add(self, values, counts):
+        """Adds counts for some values, then reduces the counts to at most k distinct values"""
+        values, inverse = np.unique(np.concatenate((self.values, values)), return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=np.concatenate((self.counts, counts))).astype(np.int64)
+
+        if len(values) > self.k:
+            order = np.argpartition(counts, len(counts) - self.k - 1)
+            threshold = counts[order[len(counts) - self.k - 1]]  # (k+1)th largest
+            kept = np.sort(order[len(counts) - self.k:])  # The k largest counts, kept even if they drop to 0 (e.g. all counts are 1)
+            values, counts = values[kept], counts[kept] - threshold
+            self.error += int(threshold)
+        self.values, self.counts = values, counts
+
+
+class RowSample:
+    """ Uniform random sample of at most k rows (e.g. datapoints to plot) from any no. of rows, added block by block.
+
+    Every row is given a random key when added, and the k rows with the smallest keys are kept (bottom-k sampling).
+    The sample is therefore uniform over all rows added, like a reservoir sample, and two samples of disjoint sets of rows
+    can be merged by keeping the k smallest keys of both.
+    """
+
+    def __init__(self, k, seed=None):
+        """
+        PARAMETERS:
+            k - max. no. of rows to keep
+            seed - seed for the random keys
+        """
+        self.k = k
+        self.n = 0  # Total no. of rows added
+        self.rows = None
+        self.keys = np.empty(0)
+        self.__rng = np.random.default_rng(seed)
+
+    def update(self, rows):
+        """Adds a 2-D array of rows to the sample"""
+        self.n += len(rows)
+        return self.__keep(rows, self.__rng.random(len(rows)))
+
+    def merge(self, other):
+        """Adds all the rows sampled by another RowSample (of disjoint rows) to this one"""
+        self.n += other.n
+        return self if other.rows is None else self.__keep(other.rows, other.keys)
+
+    def __keep(self, rows, keys):
+        """Keeps the k rows with the smallest keys among the current sample and some new rows"""
+        rows = rows if self.rows is None else np.concatenate((self.rows, rows))
+        keys = np.concatenate((self.keys, keys))
+        if len(keys) > self.k:
+            kept = np.argpartition(keys, self.k - 1)[:self.k]
+            rows, keys = rows[kept], keys[kept]
+        self.rows, self.keys = rows, keys
+        return self
+
+
+def percentile(stat):
+    """Returns the quantile (between 0 and 1) named by a percentile stat (e.g. 0.9 for 'p90'), or None for other stats"""
+    if stat.startswith('p') and len(stat) > 1:
+        try:
+            q = float(stat[1:])
+        except ValueError:
+            return None
+        if 0 <= q <= 100:
+            return q / 100
+    return None
+
+
+def is_sketch_stat(stat):
+    """Returns True if a summary stat can be approximated with sketches: median, mode, iqr or a percentile (e.g. p90)"""
+    return stat in ('median', 'mode', 'iqr') or percentile(stat) is not None
+
+
+def sketch_columns(block, stats, seed=None):
+    """ Builds the sketches needed for some stats for each column of a 2-D block of values in one pass.
+
+    Returns a list with, for each column, a tuple of its QuantileSketch and FrequencySketch (either of which is None
+    if none of the stats need it).
+
+    PARAMETERS:
+        block - 2-D float array of values, with missing values as NaN
+        stats - list of the sketch stats that will be read from the sketches
+        seed - seed (int or list of ints) from which each column's quantile sketch gets its own random stream.
+                Sketches that will be merged should be given different seeds, so their errors are independent
+    """
+    need_quantiles = any(stat != 'mode' for stat in stats)
+    need_frequencies = 'mode' in stats
+    seeds = np.random.SeedSequence(seed).spawn(block.shape[1])
+    return [(QuantileSketch(seed=seeds[i]).update(block[:, i]) if need_quantiles else None,
+             FrequencySketch().update(block[:, i]) if need_frequencies else None)
+            for i in range(block.shape[1])]
+
+
+def merge_columns(a, b):
+    """Merges two lists of per-column sketches, as returned by sketch_columns(), into a"""
+    for (qa, fa), (qb, fb) in zip(a, b):
+        if qa is not None:
+            qa.merge(qb)
+        if fa is not None:
+            fa.merge(fb)
+    return a
+
+
+def read_stat(column_sketches, stat):
+    """ Returns a tuple of the approximate value of a sketch stat and its error bound.
+
+    For quantile-based stats, the error is the rank error (see QuantileSketch.rank_error()), as a fraction of the count.
+    For mode, it is the max. no. of occurrences by which the count of the mode may be underestimated.
+
+    PARAMETERS:
+        column_sketches - a column's tuple of sketches, from sketch_columns()
+        stat - the sketch stat to read
+    """
+    quantiles, frequencies = column_sketches
+    if stat == 'mode':
+        return frequencies.mode(), frequencies.error
+    if stat == 'median':
+        return quantiles.quantile(0.5), quantiles.rank_error()
+    if stat == 'iqr':
+        return quantiles.quantile(0.75) - quantiles.quantile(0.25), quantiles.rank_error()
+    return quantiles.quantile(percentile(stat)), quantiles.rank_error()
+
+
+def error_label(stat):
+    """Returns the name under which the error bound of a sketch stat is tabulated"""
+    return f"{stat} ±count" if stat == 'mode' else f"{stat} ±rank"
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import csvLoader
+import datasetProfile
+import moments
+import ols
+import profiler
+import sketches
+
+
+STREAM_THRESHOLD = 8 * 2**30  # main.py streams CSV files larger than this many bytes instead of loading them
+OPCODES = ['summary', 'ci', 'reg', 'corr']  # Commands that support streaming
+
+
+class StreamingDataset:
+    """ A CSV file that is too large to load into memory, which supporting commands read chunk by chunk.
+
+    Only the schema, inferred from a sample of the file, is held in memory. Like columnStore.ColumnStore, it mimics the
+    parts of the pd dataframe interface used to validate commands (columns, dtypes, empty), so it can be passed to the
+    command modules in place of a dataframe. Commands that support streaming then call chunks() to read the columns they use.
+    """
+
+    def __init__(self, filename, dtype=None, usecols=None, chunk_rows=csvLoader.CHUNK_ROWS):
+        """
+        PARAMETERS:
+            filename - name of the csv file
+            dtype, usecols - loading overrides, as for csvLoader.load_csv()
+            chunk_rows - no. of rows to read per chunk. Peak memory use is proportional to this, not to the file's size
+        """
+        self.filename = filename
+        self.chunk_rows = chunk_rows
+        self.__dtype = dict(dtype) if dtype else {}
+        sample = pd.read_csv(filename, nrows=csvLoader.SAMPLE_ROWS, usecols=usecols, dtype=self.__dtype)
+        self.columns = sample.columns
+        self.dtypes = sample.dtypes
+        self.empty = len(self.columns) == 0
+
+    @property
+    def shape(self):
+        return None, len(self.columns)  # No. of rows isn't known without reading the whole file
+
+    def size(self):
+        """Returns the size of the file in bytes"""
+        return os.path.getsize(self.filename)
+
+    def chunks(self, columns):
+        """ Yields successive chunks of the file as dataframes holding just the requested columns
+
+        PARAMETERS:
+            columns - list of column names. May contain duplicates
+        """
+        columns = list(dict.fromkeys(columns))
+        dtype = {col: t for col, t in self.__dtype.items() if col in columns}
+        with pd.read_csv(self.filename, usecols=columns, dtype=dtype, chunksize=self.chunk_rows) as reader:
+            while True:
+                with profiler.stage('read'):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    return
+                yield chunk
+
+
+def accumulate(dataset, vars, categoricals=(), sketch_stats=()):
+    """ Computes the Moments (see moments.compute()) of some numerical variables in one pass over a streamed file,
+    along with the sketches (see sketches.sketch_columns()) needed for any requested sketch stats (e.g. median, p90).
+
+    Each chunk's Moments and sketches are computed in memory, then merged into the running totals with moments.merge()
+    and sketches.merge_columns(), so memory use doesn't grow with the file and the Moments match those of the in-memory path.
+    Returns a tuple of the Moments, the (sorted) index of the groups, which is None if no categoricals are provided,
+    and a list of each group's per-column sketches, which is None if no sketch stats are requested.
+
+    PARAMETERS:
+        dataset - the StreamingDataset
+        vars - list of numerical variables
+        categoricals - optional list of categorical variables to group datapoints on
+        sketch_stats - optional list of the sketch stats that will be read from the sketches
+    """
+    categoricals = list(categoricals)
+    total, index = None, None
+    sketched = {}  # Maps each group's key (None without categoricals) to its per-column sketches
+    for chunk_no, chunk in enumerate(dataset.chunks(vars + categoricals)):
+        if not categoricals:
+            part = moments.compute(chunk, vars)
+            total = part if total is None else moments.merge(total, part)
+            if sketch_stats:
+                __merge_sketches(sketched, None, sketches.sketch_columns(moments.to_block(chunk, vars), sketch_stats, chunk_no))
+            continue
+
+        groups = datasetProfile.build_groups(chunk, categoricals)
+        part = moments.compute(chunk, vars, groups)
+        if sketch_stats:
+            block = moments.to_block(chunk, vars, groups.order)
+            for k, key in enumerate(groups.index):
+                rows = block[groups.starts[k]:groups.starts[k] + groups.sizes[k]]
+                __merge_sketches(sketched, key, sketches.sketch_columns(rows, sketch_stats, [chunk_no, k]))
+
+        if total is None:
+            total, index = part, groups.index
+            continue
+
+        # A chunk may contain groups not seen before (and lack others), so both sides are aligned on the union of groups
+        union = index.union(groups.index)
+        total = moments.regroup(total, union.get_indexer(index), len(union))
+        part = moments.regroup(part, union.get_indexer(groups.index), len(union))
+        total, index = moments.merge(total, part), union
+
+    if total is None:  # File has no rows
+        raise ValueError("file contains no rows")
+    if not sketch_stats:
+        return total, index, None
+    keys = [None] if index is None else list(index)
+    empty = np.empty((0, len(vars)))
+    return total, index, [sketched.get(key) or sketches.sketch_columns(empty, sketch_stats) for key in keys]
+
+
+def __merge_sketches(sketched, key, column_sketches):
+    """Merges a chunk's per-column sketches for a group into the running sketches of that group"""
+    if key in sketched:
+        sketches.merge_columns(sketched[key], column_sketches)
+    else:
+        sketched[key] = column_sketches
+
+
+def accumulate_cross_products(dataset, xs, y, sample_size=0):
+    """ Computes the CrossProducts (see ols.compute_blocked()) of a response variable against some explanatory variables
+    in one pass over a streamed file, merging each chunk's CrossProducts into the running total with ols.merge().
+    Returns a tuple of the CrossProducts and a sketches.RowSample of the (x, y) datapoints where neither is missing,
+    taken in the same pass (None if sample_size is 0, or if there are several explanatory variables).
+
+    PARAMETERS:
+        dataset - the StreamingDataset
+        xs - list of explanatory variables
+        y - the response variable
+        sample_size - max. no. of datapoints to sample, e.g. for plotting
+    """
+    total = None
+    sample = sketches.RowSample(sample_size, seed=0) if sample_size and len(xs) == 1 else None
+    for chunk in dataset.chunks(xs + [y]):
+        if sample is None:
+            part = ols.compute_blocked(chunk, xs, y)
+        else:  # The chunk's (x, y) values are taken once, for both its CrossProducts and the sample
+            points = moments.to_block(chunk, xs + [y])
+            part = ols.compute_block(points[:, :1], points[:, 1])
+            sample.update(points[~np.isnan(points).any(axis=1)])
+        total = part if total is None else ols.merge(total, part)
+
+    if total is None:  # File has no rows
+        raise ValueError("file contains no rows")
+    return total, sample
@@ -1,5 +1,12 @@
 import argparse
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
 
+import moments
+import sketches
+import streaming
+import datasetProfile
 import utils
 
 
@@ -13,7 +20,12 @@ def get_stats(data, args):
 
         stats - a list of the summary statistics to find. Denoted in user command by -s or --stats.
                 By default, mean, median and variance will be found.
-                Possible statistics that can be calculated: ['mean', 'median', 'mode', 'count', 'sum', 'std', 'var', 'min', 'max'].
+                Possible statistics that can be calculated: ['mean', 'median', 'mode', 'count', 'sum', 'std', 'var', 'min', 'max', 'iqr'],
+                as well as any percentile, written as p followed by the percentage (e.g. p90, p99, p2.5).
+
+        approx - whether to approximate the median, mode, iqr and percentiles with mergeable sketches (see sketches),
+                 rather than finding them exactly. Denoted in user command by -a or --approx.
+                 The error bound of each approximate stat is tabulated alongside it. Always set when streaming.
 
         categoricals - a list of variables in the dataset whose values shall be used as categories to group datapoints into.
                         Requested sample statistics will then be calculated for the numerical variables of each category,
@@ -26,32 +38,49 @@ def get_stats(data, args):
         args - array of command window argument strings obtained by command interpreter module
     """
 
-    # Deriving argument values from args array using argparse
+    profile = datasetProfile.get(data)
+    parsed_args = parser(data).parse_args(args)
+
+    if isinstance(data, streaming.StreamingDataset):
+        table = __tabulate_streaming(data, parsed_args.vars, parsed_args.stats, parsed_args.categoricals)
+        print(table)
+        print("\n")
+        return
+
+    data = utils.select_columns(data, parsed_args.vars)  # Categoricals are only needed for grouping, which the profile caches
+
+    if parsed_args.categoricals == []:
+        table = __tabulate(data, parsed_args.vars, parsed_args.stats, parsed_args.approx)
+    else:
+        groups = profile.groups(parsed_args.categoricals)
+        table = __tabulate_by_categoricals(data, parsed_args.vars, parsed_args.stats, groups, parsed_args.approx)
+
+    print(table)
+    print("\n")
+
+
+def parser(data):
+    """Returns the argparse parser of the summary command's arguments (see get_stats()) for a dataset"""
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--vars',
-                        nargs='*', 
-                        default=utils.get_numericals(data),
-                        choices=utils.get_numericals(data))
+                        nargs='*',
+                        default=profile.numericals,
+                        choices=profile.numericals)
     parser.add_argument('-s', '--stats',
-                        nargs='*', 
+                        nargs='*',
                         default=['mean', 'median', 'var'],
-                        choices=['mean', 'median', 'mode', 'count', 'sum', 'std', 'var', 'min', 'max'])
+                        type=__stat_name)
     parser.add_argument('-c', '--categoricals',
                         nargs='*',
                         default=[],
-                        choices=data.columns.values)
-    parsed_args = parser.parse_args(args)
+                        choices=profile.columns)
+    parser.add_argument('-a', '--approx',
+                        action='store_true')
+    return parser
 
-    if parsed_args.categoricals == []:
-        table = __tabulate(data, parsed_args.vars, parsed_args.stats)
-    else:
-        table = __tabulate_by_categoricals(data, parsed_args.vars, parsed_args.stats, parsed_args.categoricals)
-
-    print(table)
-    print("\n")
 
-
-def __tabulate(data, vars, stats):
+def __tabulate(data, vars, stats, approx=False):
     """
     Find summary statistics for provided numerical variables and tabulates them in a dataframe.
 
@@ -62,18 +91,13 @@ def __tabulate(data, vars, stats):
         data - the input dataframe
         vars - array of numerical variables to find summary statistics for
         stats - array of summary statistics (e.g. mean, variance, mode) to find.
+        approx - whether to approximate sketch stats (e.g. median, p90) with sketches
     """
-
-    # Dictionary to map requested vars to array of requested stats, for use in .agg()
-    vars_dict = {}
-    for var in vars:
-        vars_dict[var] = stats
-
-    table = data.agg(vars_dict)
-    return table
+    values = __compute_stats(data, vars, stats, approx=approx)
+    return __build_table(data, vars, __with_errors(stats, approx), values)
             
 
-def __tabulate_by_categoricals(data, vars, stats, categoricals):
+def __tabulate_by_categoricals(data, vars, stats, groups, approx=False):
     """
     Divides provided numerical variables into categories based on provided categorical variables then finds summary statistics for them.
 
@@ -89,23 +113,184 @@ def __tabulate_by_categoricals(data, vars, stats, categoricals):
         data - the input dataframe
         vars - array of numerical variables to find summary statistics for
         stats - array of summary statistics (e.g. mean, variance, mode) to find.
-        categoricals - categorical variables in the data to divide entries into categories along
+        groups - datasetProfile.GroupIndex dividing entries into categories along the requested categoricals
+        approx - whether to approximate sketch stats (e.g. median, p90) with sketches
+    """
+    values = __compute_stats(data, vars, stats, groups, approx)
+    return __build_table(data, vars, __with_errors(stats, approx), values, groups.index)
+
+
+def __tabulate_streaming(data, vars, stats, categoricals):
+    """
+    Finds summary statistics for provided numerical variables of a streamed file, in one pass over its chunks
+    (see streaming.accumulate()). The table is laid out as by __tabulate() or __tabulate_by_categoricals().
+
+    Sketch stats (e.g. median, mode, p90) can't be found exactly by merging per-chunk results, so are always approximated
+    with sketches, and their error bounds tabulated alongside them.
+
+    PARAMETERS:
+        data - the streaming.StreamingDataset
+        vars - array of numerical variables to find summary statistics for
+        stats - array of summary statistics (e.g. mean, variance, mode) to find.
+        categoricals - categorical variables in the data to divide entries into categories along (may be empty)
+    """
+    sketch_stats = [stat for stat in stats if sketches.is_sketch_stat(stat)]
+    accumulators, index, sketched = streaming.accumulate(data, vars, categoricals, sketch_stats)
+    values = {stat: accumulators.stat(stat) for stat in stats if stat in moments.STATS}
+    if sketch_stats:
+        values.update(__read_sketches(sketched, sketch_stats))
+    return __build_table(data, vars, __with_errors(stats, approx=True), values, index)
+
+
+def __build_table(data, vars, stats, values, index=None):
+    """
+    Lays out computed summary statistics in a dataframe.
+
+    Without a group index, the numerical variables form the columns and the stats form the rows.
+    With one, the columns are a 2-level (var, stat) multiindex and the rows are the groups.
+
+    PARAMETERS:
+        data - the input dataframe (or dataset standing in for one), used for the dtypes of the vars
+        vars - array of numerical variables
+        stats - array of summary statistics
+        values - dict mapping each stat to a 2-D array of its values, with one row per group and one column per var
+        index - optional index of the groups
+    """
+    table = {}
+    if index is None:
+        for i, var in enumerate(vars):
+            # Each column is built from python scalars so that pandas infers an int column if every stat is an integer, like .agg() would
+            column = [int(values[stat][0, i]) if __is_integer_stat(data, var, stat, values[stat][0, i])
+                      else float(values[stat][0, i]) for stat in stats]
+            table[var] = pd.Series(column, index=stats)
+        return pd.DataFrame(table)
+
+    for i, var in enumerate(vars):
+        for stat in stats:
+            column = values[stat][:, i]
+            table[(var, stat)] = column.astype(np.int64) if __is_integer_stat(data, var, stat, column) else column
+    return pd.DataFrame(table, index=index)
+
+
+def __compute_stats(data, vars, stats, groups=None, approx=False):
+    """
+    Computes summary statistics for provided numerical variables, for each group of datapoints if a group index is provided.
+
+    All stats except the sketch stats (median, mode, iqr & percentiles) are derived from a single pass of the moments engine
+    (see moments.compute()). Sketch stats are found exactly with pandas, or approximated from sketches if approx is set,
+    in which case their error bounds are included too (see __with_errors()).
+    Returns a dict mapping each stat to a 2-D array of its values, with one row per group and one column per var.
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - array of numerical variables to find summary statistics for
+        stats - array of summary statistics (e.g. mean, variance, mode) to find.
+        groups - optional datasetProfile.GroupIndex dividing the datapoints into groups
+        approx - whether to approximate sketch stats with sketches
+    """
+    values = {}
+
+    moment_stats = [stat for stat in stats if stat in moments.STATS]
+    if moment_stats:
+        accumulators = moments.compute(data, vars, groups)
+        for stat in moment_stats:
+            values[stat] = accumulators.stat(stat)
+
+    sketch_stats = [stat for stat in stats if sketches.is_sketch_stat(stat)]
+    if sketch_stats and approx:
+        block = moments.to_block(data, vars, None if groups is None else groups.order)
+        if groups is None:
+            sketched = [sketches.sketch_columns(block, sketch_stats, 0)]
+        else:
+            sketched = [sketches.sketch_columns(block[start:start + size], sketch_stats, k)
+                        for k, (start, size) in enumerate(zip(groups.starts, groups.sizes))]
+        values.update(__read_sketches(sketched, sketch_stats))
+        return values
+
+    # Exact sketch stats need all of a group's values at once, so are left to pandas
+    for stat in sketch_stats:
+        if groups is None:
+            values[stat] = __exact_stat(data[vars], stat).to_numpy(dtype=np.float64).reshape(1, -1)
+        else:
+            grouped = __exact_stat(data[vars].groupby(groups.codes), stat)
+            values[stat] = grouped.reindex(range(len(groups))).to_numpy(dtype=np.float64)
+
+    return values
+
+
+def __exact_stat(data, stat):
+    """ Returns a sketch stat found exactly by pandas, as a series (one value per column) for a dataframe,
+    or as a dataframe (one row per group) for a grouped dataframe
+    """
+    if stat == 'median':
+        return data.median()
+    if stat == 'mode':
+        return data.agg(__first_mode)
+    if stat == 'iqr':
+        return data.quantile(0.75) - data.quantile(0.25)
+    return data.quantile(sketches.percentile(stat))
+
+
+def __read_sketches(sketched, stats):
+    """
+    Reads approximate sketch stats and their error bounds from sketches.
+
+    Returns a dict mapping each stat, and the label of its error bound (see sketches.error_label()), to a 2-D array
+    with one row per group and one column per var.
+
+    PARAMETERS:
+        sketched - list of each group's per-column sketches (see sketches.sketch_columns())
+        stats - array of sketch stats to read
+    """
+    values = {}
+    for stat in stats:
+        read = np.array([[sketches.read_stat(column, stat) for column in group] for group in sketched], dtype=np.float64)
+        values[stat] = read[:, :, 0]
+        values[sketches.error_label(stat)] = read[:, :, 1]
+    return values
+
+
+def __with_errors(stats, approx):
+    """Returns the list of stats to tabulate, with the error bound of each approximated sketch stat following it"""
+    if not approx:
+        return stats
+    tabulated = []
+    for stat in stats:
+        tabulated.append(stat)
+        if sketches.is_sketch_stat(stat):
+            tabulated.append(sketches.error_label(stat))
+    return tabulated
+
+
+def __stat_name(stat):
+    """Argparse type of the stats argument, which accepts the fixed stats as well as percentiles (e.g. p90)"""
+    if stat in moments.STATS or sketches.is_sketch_stat(stat):
+        return stat
+    raise argparse.ArgumentTypeError(f"invalid choice: '{stat}' (choose from {', '.join(moments.STATS)}, median, mode, iqr "
+                                     f"or a percentile such as p90)")
+
+
+def __is_integer_stat(data, var, stat, values):
+    """ Returns True if the values of a stat of a var should be shown as integers, i.e. the stat is a count,
+    or the sum, min or max of an integer var that isn't missing for any group
     """
+    if stat == 'count' or stat == sketches.error_label('mode'):
+        return True
+    return stat in ('sum', 'min', 'max') and is_integer_dtype(data.dtypes[var]) and not np.isnan(values).any()
 
-    # Dictionary to map requested vars to array of requested stats, for use in .agg()
-    vars_dict = {}
-    for var in vars:
-        vars_dict[var] = stats
 
-    table = (data.groupby(categoricals)).agg(vars_dict)
-    return table
+def __first_mode(series):
+    """Returns the mode of a series. Where there are several, returns the smallest"""
+    modes = series.mode()
+    return modes.iloc[0] if len(modes) > 0 else np.nan
 
 
 def print_help():
     """Prints a help message for this module"""
-    print("usage: summary [-v/--vars] [-s/--stats] [-c/--categoricals]")
+    print("usage: summary [-v/--vars] [-s/--stats] [-c/--categoricals] [-a/--approx]")
     print("\t-v/--vars             List of numerical variables to get summary statistics for (default: all numerical vars in data)")
-    print("\t-s/--stats            List of summary stats to get (default: mean, median, variance)")
+    print("\t-s/--stats            List of summary stats to get (default: mean, median, variance). Percentiles are written as e.g. p90")
     print("\t-c/--categoricals     List of categorical variables to categorize datapoints on (default: None). No categorization if none provided")
+    print("\t-a/--approx           Approximate median, mode, iqr & percentiles with sketches, showing their error bounds")
     print("\n")
 
@@ -1,7 +1,12 @@
 import argparse
+import itertools
+import numpy as np
 from scipy import stats
 import pandas as pd
 
+import datasetProfile
+import moments
+import resampling
 import utils
 
 
@@ -22,14 +27,16 @@ def one_sample_ttest(data, args):
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
-    parser.add_argument('var', choices=utils.get_numericals(data))
+    parser.add_argument('var', choices=profile.numericals)
     parser.add_argument('h0', type=float)
     parser.add_argument('-a', '--alternative',
                         nargs='?',
                         choices=['less', 'greater', 'two-sided'],
                         default='two-sided')
     parsed_args = parser.parse_args(args)
+    data = utils.select_columns(data, [parsed_args.var])
 
     res = stats.ttest_1samp(data[parsed_args.var], parsed_args.h0, alternative=parsed_args.alternative)
     __print_result(res)
@@ -54,9 +61,10 @@ def two_sample_ttest_by_cat(data, args):
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
-    parser.add_argument('var', choices=utils.get_numericals(data))
-    parser.add_argument('categorical', choices=data.columns.values)
+    parser.add_argument('var', choices=profile.numericals)
+    parser.add_argument('categorical', choices=profile.columns)
     parser.add_argument('c1')
     parser.add_argument('c2')
     parser.add_argument('-a', '--alternative',
@@ -64,9 +72,10 @@ def two_sample_ttest_by_cat(data, args):
                         choices=['less', 'greater', 'two-sided'],
                         default='two-sided')
     parsed_args = parser.parse_args(args)
+    data = utils.select_columns(data, [parsed_args.var])  # The categorical is only needed for grouping, which the profile caches
 
     # Check if provided categories are valid
-    possible_categories = data[parsed_args.categorical].unique()
+    possible_categories = profile.levels(parsed_args.categorical)
     if parsed_args.c1 not in possible_categories:
         msg = f"invalid choice: {parsed_args.c1} (choose from {possible_categories})"
         action = argparse.Action('c1', 'c1', choices=possible_categories)
@@ -76,8 +85,9 @@ def two_sample_ttest_by_cat(data, args):
         action = argparse.Action('c1', 'c1', choices=possible_categories)
         raise argparse.ArgumentError(action, msg)
 
-    s1 = data[data[parsed_args.categorical] == parsed_args.c1][parsed_args.var]
-    s2 = data[data[parsed_args.categorical] == parsed_args.c2][parsed_args.var]
+    groups = profile.groups([parsed_args.categorical])
+    s1 = data[parsed_args.var].iloc[groups.rows(groups.index.get_loc(parsed_args.c1))]
+    s2 = data[parsed_args.var].iloc[groups.rows(groups.index.get_loc(parsed_args.c2))]
 
     # Test for equality of variance first to determine what kind of test scipy will use for diff of means
     eqvar = __equality_of_variances(s1, s2)
@@ -85,6 +95,283 @@ def two_sample_ttest_by_cat(data, args):
     __print_result(res)
 
 
+def permutation_test_by_cat(data, args):
+    """ Performs a permutation test for the difference in a summary stat (e.g. the mean or median) of a numerical variable
+    between 2 independent categories, which unlike the t-test makes no assumption about the distribution of the data.
+    i.e. Tests the null hypothesis that the variable is distributed the same way in both categories.
+
+    The pooled non-missing values of both categories are randomly permuted many times, the first category's share of
+    each permutation is compared to the rest, and the p-value is the share of permutations whose difference in the stat
+    is at least as extreme as the observed one. Permutations are drawn & evaluated in batches across a process pool (see resampling).
+
+    Outputs a pandas series containing:
+        - The observed difference (c1 - c2) in the stat
+        - p-value from test
+        - no. of permutations
+
+    COMMAND WINDOW ARGUMENTS:
+        var - name of numerical variable to test
+        categorical - categorical variable to categorize datapoints into
+        c1, c2 - categories (possible values of categorical) to test the difference between
+        stat - summary stat to compare (any stat offered by summary, e.g. mean, median, p90). Default is mean.
+                Denoted in user command by -s or --stat.
+        alternative - less than, greater than or 2-sided (defaults to 2-sided). Denoted in user command by -a or --alternative.
+        resamples - no. of permutations. Default is 2000. Denoted in user command by -n or --resamples.
+        seed - seed of the random permutations, so that results can be reproduced. Default is 0. Denoted in user command by --seed.
+        jobs - max. no. of worker processes. Default is the no. of CPUs. Denoted in user command by -j or --jobs.
+
+    FUNCTION PARAMETERS:
+        data - the input dataframe
+        args - array of command window argument strings obtained by command interpreter module
+    """
+    profile = datasetProfile.get(data)
+    parsed_args = perm_parser(data).parse_args(args)
+
+    if not resampling.is_stat(parsed_args.stat):
+        print(f"ERROR: {parsed_args.stat} is not a valid summary stat")
+        return
+    if parsed_args.resamples < 1:
+        print("ERROR: No. of resamples must be at least 1")
+        return
+    data = utils.select_columns(data, [parsed_args.var])  # The categorical is only needed for grouping, which the profile caches
+
+    groups = profile.groups([parsed_args.categorical])
+    try:
+        locs = groups.index.get_indexer(pd.Index([parsed_args.c1, parsed_args.c2]).astype(groups.index.dtype))  # Typed as strings
+    except (ValueError, TypeError):
+        locs = np.array([-1, -1])
+    if (locs == -1).any():
+        invalid = parsed_args.c1 if locs[0] == -1 else parsed_args.c2
+        print(f"ERROR: invalid choice: {invalid} (choose from {profile.levels(parsed_args.categorical)})")
+        return
+
+    samples = [data[parsed_args.var].iloc[groups.rows(loc)].to_numpy(dtype=np.float64, na_value=np.nan) for loc in locs]
+    s1, s2 = (sample[~np.isnan(sample)] for sample in samples)
+    if len(s1) == 0 or len(s2) == 0:
+        print("ERROR: Both categories need at least 1 non-missing value")
+        return
+    pooled = np.concatenate((s1, s2))
+
+    observed = resampling.difference(pooled, len(s1), parsed_args.stat)
+    permuted = resampling.permutation([pooled], [len(s1)], parsed_args.stat, parsed_args.resamples,
+                                      parsed_args.seed, parsed_args.jobs)[0]
+    tolerance = 1e-12 * max(1, abs(observed))  # Permuted differences equal to the observed one shouldn't be lost to rounding
+    if parsed_args.alternative == 'less':
+        extreme = permuted <= observed + tolerance
+    elif parsed_args.alternative == 'greater':
+        extreme = permuted >= observed - tolerance
+    else:
+        extreme = np.abs(permuted) >= abs(observed) - tolerance
+    p = (extreme.sum() + 1) / (len(permuted) + 1)  # Counts the observed arrangement as one of the permutations
+
+    output = pd.Series(data=[observed, p, len(permuted)], index=['diff', 'p', 'resamples'])
+    print(output)
+
+
+def perm_parser(data):
+    """Returns the argparse parser of the test perm command's arguments (see permutation_test_by_cat()) for a dataset"""
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('var', choices=profile.numericals)
+    parser.add_argument('categorical', choices=profile.columns)
+    parser.add_argument('c1')
+    parser.add_argument('c2')
+    parser.add_argument('-s', '--stat',
+                        default='mean')
+    parser.add_argument('-a', '--alternative',
+                        choices=['less', 'greater', 'two-sided'],
+                        default='two-sided')
+    parser.add_argument('-n', '--resamples',
+                        default=resampling.RESAMPLES,
+                        type=int)
+    parser.add_argument('--seed',
+                        default=0,
+                        type=int)
+    parser.add_argument('-j', '--jobs',
+                        type=int)
+    return parser
+
+
+def pairwise_ttests_by_cat(data, args):
+    """ Performs t-tests for the difference in population means between every pair of categories of a categorical variable,
+    for each of a set of numerical variables, and corrects the p-values for multiple comparisons.
+
+    Each category's count, mean, variance and Levene statistics (mean & spread of absolute deviations from its median)
+    are found once per variable, then every pair's Levene test and t-test are computed from them as arrays.
+    As for 2samp_cat, a pair's variances are assumed equal (Student's t-test) unless Levene's test rejects that at
+    the 10% significance level, in which case Welch's t-test is used. Missing values are ignored.
+
+    Outputs a table with a row per variable & pair of categories, containing:
+        - The no. of datapoints & mean of each category
+        - p-value of Levene's test for equality of variances, and whether variances were assumed equal
+        - T-Test statistic, degrees of freedom & p-value
+        - p-value adjusted for multiple comparisons across all rows of the table (unless the correction is 'none')
+
+    COMMAND WINDOW ARGUMENTS:
+        categorical - categorical variable to categorize datapoints into
+        vars - list of numerical variables to test. In the user's command, this list is denoted by -v or --vars.
+                By default, this will be all numerical variables in the dataset.
+        levels - optional list of the categories to compare (default: all). Denoted in user command by -l or --levels.
+        alternative - less than, greater than or 2-sided (defaults to 2-sided), for the mean of the first category of
+                        each pair relative to the second. Denoted in user command by -a or --alternative.
+        correction - multiple comparison correction: 'holm' (Holm-Bonferroni, default), 'bh' (Benjamini-Hochberg false
+                        discovery rate) or 'none'. Denoted in user command by -m or --correction.
+
+    FUNCTION PARAMETERS:
+        data - the input dataframe
+        args - array of command window argument strings obtained by command interpreter module
+    """
+    profile = datasetProfile.get(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('categorical', choices=profile.columns)
+    parser.add_argument('-v', '--vars',
+                        nargs='*',
+                        default=profile.numericals,
+                        choices=profile.numericals)
+    parser.add_argument('-l', '--levels',
+                        nargs='*')
+    parser.add_argument('-a', '--alternative',
+                        choices=['less', 'greater', 'two-sided'],
+                        default='two-sided')
+    parser.add_argument('-m', '--correction',
+                        choices=['holm', 'bh', 'none'],
+                        default='holm')
+    parsed_args = parser.parse_args(args)
+    vars = list(dict.fromkeys(parsed_args.vars))
+    data = utils.select_columns(data, vars)  # The categorical is only needed for grouping, which the profile caches
+
+    groups = profile.groups([parsed_args.categorical])
+    if parsed_args.levels:
+        levels = list(dict.fromkeys(parsed_args.levels))
+        try:
+            selected = groups.index.get_indexer(pd.Index(levels).astype(groups.index.dtype))  # Levels are typed as strings
+        except (ValueError, TypeError):
+            selected = np.full(len(levels), -1)
+        if (selected == -1).any():
+            invalid = levels[np.flatnonzero(selected == -1)[0]]
+            print(f"ERROR: invalid level: {invalid} (choose from {profile.levels(parsed_args.categorical)})")
+            return
+    else:
+        selected = np.arange(len(groups))
+    if len(selected) < 2 or not vars:
+        print("ERROR: At least 2 categories and 1 numerical variable are needed")
+        return
+
+    group_stats = __group_stats(data, vars, groups)
+    pairs = np.array(list(itertools.combinations(selected, 2)))
+    table = __pairwise_tests(group_stats, pairs[:, 0], pairs[:, 1], parsed_args.alternative)
+
+    # One row per var & pair, with the pairs of each var together
+    labels = np.asarray(groups.index)[pairs]
+    index = pd.MultiIndex.from_arrays([np.repeat(vars, len(pairs)), np.tile(labels[:, 0], len(vars)), np.tile(labels[:, 1], len(vars))],
+                                      names=['var', 'c1', 'c2'])
+    output = pd.DataFrame({name: values.T.ravel() for name, values in table.items()}, index=index)
+    output['equal var'] = output['equal var'].astype(bool)
+    if parsed_args.correction != 'none':
+        output[f"p ({parsed_args.correction})"] = __adjust_pvalues(output['p'].to_numpy(), parsed_args.correction)
+    print(output)
+    print("\n")
+
+
+def __group_stats(data, vars, groups):
+    """ Returns a dict of per-group statistics of some numerical variables, each a 2-D array with one row per group and
+    one column per variable: 'count', 'mean' and 'var' (from moments.compute()), and 'z_mean' & 'z_ss', the mean and
+    corrected sum of squares of the absolute deviations of the values from their group's median (for Levene's test)
+
+    PARAMETERS:
+        data - the input dataframe
+        vars - list of numerical variables
+        groups - datasetProfile.GroupIndex dividing the datapoints into groups
+    """
+    accumulators = moments.compute(data, vars, groups)
+    block = moments.to_block(data, vars, groups.order)
+
+    medians = np.full((len(groups), len(vars)), np.nan)
+    for k in np.flatnonzero(groups.sizes > 0):
+        rows = block[groups.starts[k]:groups.starts[k] + groups.sizes[k]]
+        valid = ~np.isnan(rows).all(axis=0)
+        medians[k, valid] = np.nanmedian(rows[:, valid], axis=0)
+    deviations = np.abs(block - np.repeat(medians, groups.sizes, axis=0))
+
+    valid = ~np.isnan(deviations)
+    deviations = np.where(valid, deviations, 0)
+    nonempty = groups.sizes > 0
+    z_sum = np.zeros_like(medians)
+    z_sumsq = np.zeros_like(medians)
+    if nonempty.any():
+        z_sum[nonempty] = np.add.reduceat(deviations, groups.starts[nonempty], axis=0)
+        z_sumsq[nonempty] = np.add.reduceat(np.square(deviations), groups.starts[nonempty], axis=0)
+
+    count = accumulators.count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_mean = z_sum / count
+        z_ss = np.maximum(z_sumsq - np.square(z_sum) / count, 0)
+    return {'count': count, 'mean': accumulators.mean(), 'var': accumulators.var(), 'z_mean': z_mean, 'z_ss': z_ss}
+
+
+def __pairwise_tests(group_stats, first, second, alternative):
+    """ Performs Levene's test and a t-test for every pair of groups, for every variable, from per-group statistics.
+    Returns a dict mapping each column of the output table to a 2-D array with one row per pair and one column per variable.
+
+    PARAMETERS:
+        group_stats - per-group statistics, from __group_stats()
+        first, second - arrays of the group nos. of the first & second group of each pair
+        alternative - 'less', 'greater' or 'two-sided'
+    """
+    n1, n2 = group_stats['count'][first].astype(np.float64), group_stats['count'][second].astype(np.float64)
+    m1, m2 = group_stats['mean'][first], group_stats['mean'][second]
+    v1, v2 = group_stats['var'][first], group_stats['var'][second]
+    total = n1 + n2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Levene's test (median-centred) for 2 groups: a one-way ANOVA F-test on the absolute deviations
+        between = n1 * n2 / total * np.square(group_stats['z_mean'][first] - group_stats['z_mean'][second])
+        w = (total - 2) * between / (group_stats['z_ss'][first] + group_stats['z_ss'][second])
+        levene_p = np.where((n1 > 1) & (n2 > 1), stats.f.sf(w, 1, total - 2), np.nan)
+        equal_var = ~(levene_p < 0.1)
+
+        pooled = ((n1 - 1) * v1 + (n2 - 1) * v2) / (total - 2)
+        se_student = np.sqrt(pooled * (1 / n1 + 1 / n2))
+        se_welch = np.sqrt(v1 / n1 + v2 / n2)
+        df_welch = np.square(v1 / n1 + v2 / n2) / (np.square(v1 / n1) / (n1 - 1) + np.square(v2 / n2) / (n2 - 1))
+
+        se = np.where(equal_var, se_student, se_welch)
+        df = np.where(equal_var, total - 2, df_welch)
+        t = (m1 - m2) / se
+
+    if alternative == 'less':
+        p = stats.t.cdf(t, df)
+    elif alternative == 'greater':
+        p = stats.t.sf(t, df)
+    else:
+        p = 2 * stats.t.sf(np.abs(t), df)
+
+    return {'n1': n1.astype(np.int64), 'n2': n2.astype(np.int64), 'mean1': m1, 'mean2': m2,
+            'levene p': levene_p, 'equal var': equal_var, 'T': t, 'df': df, 'p': p}
+
+
+def __adjust_pvalues(p, correction):
+    """ Returns p-values adjusted for multiple comparisons. Missing (NaN) p-values are left out of the no. of comparisons
+
+    PARAMETERS:
+        p - array of p-values
+        correction - 'holm' (Holm-Bonferroni) or 'bh' (Benjamini-Hochberg)
+    """
+    adjusted = np.full(len(p), np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    m = len(tested)
+    if m == 0:
+        return p.copy()
+
+    order = tested[np.argsort(p[tested], kind='stable')]
+    ranks = np.arange(1, m + 1)
+    if correction == 'holm':
+        adjusted[order] = np.minimum(np.maximum.accumulate((m - ranks + 1) * p[order]), 1)
+    else:
+        adjusted[order] = np.minimum(np.minimum.accumulate((m / ranks * p[order])[::-1])[::-1], 1)
+    return adjusted
+
+
 def two_sample_ttest_by_col(data, args):
     """ Performs a t-test for the difference in population means between 2 (numerical) independent columns of the data
 
@@ -101,14 +388,16 @@ def two_sample_ttest_by_col(data, args):
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
-    parser.add_argument('col1', choices=utils.get_numericals(data))
-    parser.add_argument('col2', choices=utils.get_numericals(data))
+    parser.add_argument('col1', choices=profile.numericals)
+    parser.add_argument('col2', choices=profile.numericals)
     parser.add_argument('-a', '--alternative',
                         nargs='?',
                         choices=['less', 'greater', 'two-sided'],
                         default='two-sided')
     parsed_args = parser.parse_args(args)
+    data = utils.select_columns(data, [parsed_args.col1, parsed_args.col2])
 
     s1 = data[parsed_args.col1]
     s2 = data[parsed_args.col2]
@@ -134,14 +423,16 @@ def paired_ttest(data, args):
         data - the input dataframe
         args - array of command window argument strings obtained by command interpreter module
     """
+    profile = datasetProfile.get(data)
     parser = argparse.ArgumentParser()
-    parser.add_argument('col1', choices=utils.get_numericals(data))
-    parser.add_argument('col2', choices=utils.get_numericals(data))
+    parser.add_argument('col1', choices=profile.numericals)
+    parser.add_argument('col2', choices=profile.numericals)
     parser.add_argument('-a', '--alternative',
                         nargs='?',
                         choices=['less', 'greater', 'two-sided'],
                         default='two-sided')
     parsed_args = parser.parse_args(args)
+    data = utils.select_columns(data, [parsed_args.col1, parsed_args.col2])
 
     s1 = data[parsed_args.col1]
     s2 = data[parsed_args.col2]
@@ -158,7 +449,7 @@ def __equality_of_variances(s1, s2):
         s1, s2 - Pandas series to test
     """
     res = stats.levene(s1, s2)
-    p = res[0]
+    p = res.pvalue
     # Use 10% significance level
     if p < 0.1:
         return False
@@ -189,6 +480,27 @@ def print_help():
     print("\t\talternative            'less', 'greater', or 'two-sided' (defaults to 'two-sided')")
     print("\n")
 
+    print("PERMUTATION TEST FOR DIFFERENCE IN A SUMMARY STAT BETWEEN 2 (INDEPENDENT) CATEGORIES:")
+    print("\tusage: test perm [var] [categorical] [c1] [c2] [-s/--stat] [-a/--alternative] [-n/--resamples] [--seed] [-j/--jobs]")
+    print("\t\tvar                    Numerical variable to test")
+    print("\t\tcategorical            Categorical variable")
+    print("\t\tc1,c2                  Categories of categorical variable to test the difference between")
+    print("\t\t-s/--stat              Summary stat to compare, e.g. mean, median, p90 (defaults to mean)")
+    print("\t\t-a/--alternative       'less', 'greater', or 'two-sided' (defaults to 'two-sided')")
+    print("\t\t-n/--resamples         No. of permutations (defaults to 2000)")
+    print("\t\t--seed                 Seed of the random permutations (defaults to 0)")
+    print("\t\t-j/--jobs              Max. no. of worker processes (defaults to no. of CPUs)")
+    print("\n")
+
+    print("T-TESTS FOR DIFFERENCE OF MEANS BETWEEN EVERY PAIR OF (INDEPENDENT) CATEGORIES:")
+    print("\tusage: test pairwise [categorical] [-v/--vars] [-l/--levels] [-a/--alternative] [-m/--correction]")
+    print("\t\tcategorical            Categorical variable")
+    print("\t\t-v/--vars              List of numerical variables to test (default: all numerical vars in data)")
+    print("\t\t-l/--levels            List of categories of categorical variable to compare (default: all)")
+    print("\t\t-a/--alternative       'less', 'greater', or 'two-sided' (defaults to 'two-sided')")
+    print("\t\t-m/--correction        Multiple comparison correction: 'holm', 'bh' or 'none' (defaults to 'holm')")
+    print("\n")
+
     print("T-TEST FOR DIFFERENCE OF MEANS BETWEEN 2 (INDEPENDENT) VARIABLES/COLUMNS:")
     print("\tusage: test 2samp_col [col1] [col2] [alternative]")
     print("\t\tcol1,col2               Numerical columns/variables to test")
@@ -1,17 +1,40 @@
+import os
+import time
+
 import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+import columnCache
+import columnStore
+import csvLoader
+import streaming
 
 
-def check_and_load_csv_file(filename):
+def check_and_load_csv_file(filename, dtype=None, usecols=None, use_cache=True, cache_budget=None, lazy=False,
+                            stream_threshold=None):
     """ Checks if a .csv file is valid, and if so loads it
 
     Checks if a provided CSV file is:
         - Existent
         - Actually a CSV file
-    If so, loads the CSV file into a pd dataframe that is then returned.
+    If so, loads the CSV file into a compact pd dataframe (see csvLoader.load_csv()) that is then returned,
+    and prints how long loading took and how much memory the dataframe uses.
+    If the file has been loaded before and hasn't changed since, the dataframe is loaded from the binary column cache
+    (see columnCache) instead of parsing the CSV file again. Otherwise, the freshly parsed dataframe is written to the cache.
+    If lazy is set, a columnStore.ColumnStore that memory-maps the cached columns is returned in place of the dataframe,
+    so that columns are only read from disk when a command uses them.
+    If the file is larger than stream_threshold, it isn't loaded at all. A streaming.StreamingDataset is returned instead,
+    from which supporting commands read the file chunk by chunk.
     If CSV file isn't valid, prints an appropriate error msg then returns an empty dataframe.
 
     PARAMETERS:
         filename - name of requested csv file
+        dtype - optional dict mapping column names to dtypes, overriding the inferred schema for those columns
+        usecols - optional list of the columns to load (default: all columns)
+        use_cache - whether to load from/write to the column cache
+        cache_budget - max. total bytes the column cache may use on disk (default: columnCache.DISK_BUDGET)
+        lazy - whether to return a memory-mapped column store rather than a dataframe. Only applies if use_cache is set
+        stream_threshold - optional size in bytes above which the file is streamed rather than loaded
     """
     
     # If provided file isn't a CSV file
@@ -19,18 +42,65 @@ def check_and_load_csv_file(filename):
         print("ERROR: Input file must be a CSV file")
         return pd.DataFrame()  # Empty df
 
-    try:
-        data = pd.read_csv(filename)  # Load file into pd dataframe
-    except FileNotFoundError:
+    if not os.path.isfile(filename):
         print("ERROR: File does not exist")
         return pd.DataFrame()
 
+    if stream_threshold is not None and os.path.getsize(filename) > stream_threshold:
+        try:
+            data = streaming.StreamingDataset(filename, dtype=dtype, usecols=usecols)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return pd.DataFrame()
+        print(f"Streaming {filename} ({data.size() / 2**20:.1f} MB) in chunks of {data.chunk_rows} rows. "
+              f"Only the {', '.join(streaming.OPCODES)} commands are available")
+        return data
+
+    start = time.perf_counter()
+    if use_cache and lazy:
+        data = columnStore.open_store(filename, dtype, usecols)
+    else:
+        data = columnCache.load(filename, dtype, usecols) if use_cache else None
+    source = 'cache'
+    if data is None:
+        try:
+            data = csvLoader.load_csv(filename, dtype=dtype, usecols=usecols)  # Load file into pd dataframe
+        except ValueError as e:  # e.g. requested usecols/dtype don't match the file
+            print(f"ERROR: {e}")
+            return pd.DataFrame()
+        source = 'CSV'
+        if use_cache and columnCache.store(filename, data, dtype, usecols, budget=cache_budget) and lazy:
+            data = columnStore.open_store(filename, dtype, usecols) or data  # Lets the parsed dataframe be freed
+    elapsed = time.perf_counter() - start
+
+    rows, cols = data.shape
+    if isinstance(data, columnStore.ColumnStore):
+        mb = data.on_disk_bytes() / 2**20
+        print(f"Opened {rows} rows x {cols} columns from {source} in {elapsed:.2f}s ({mb:.1f} MB memory-mapped from disk)")
+    else:
+        mb = csvLoader.memory_usage(data) / 2**20
+        print(f"Loaded {rows} rows x {cols} columns from {source} in {elapsed:.2f}s ({mb:.1f} MB in memory)")
     return data
 
 
 def get_numericals(data):
-    """For the provided dataframe "data", returns a list of column names that correspond to numerical vars/columns in that df"""
-    return list(data.select_dtypes(include='number').columns)
+    """For the provided dataframe (or column store) "data", returns a list of column names that correspond to numerical vars/columns in that df"""
+    return [col for col, dtype in data.dtypes.items() if is_numeric_dtype(dtype) and not is_bool_dtype(dtype)]
+
+
+def select_columns(data, columns):
+    """ Returns a dataframe holding the requested columns of the provided data, for use by a command.
+
+    If data is a dataframe, it is returned as is. If it is a columnStore.ColumnStore, only the requested columns
+    are paged in from disk.
+
+    PARAMETERS:
+        data - the input dataframe or column store
+        columns - list of names of the columns the command uses. May contain duplicates
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    return data.frame(list(dict.fromkeys(columns)))
 
 
 def check_valid_png(filename):